@@ -0,0 +1,135 @@
+import gc
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import zlib
+
+import javalang
+from spans import TokenSpans
+
+# Bump when the stored layout or the parse step changes so stale entries are ignored
+AST_SCHEMA = 1
+
+# Entries are only valid for the exact javalang and serialization formats that wrote them
+_FORMAT = f"ast{AST_SCHEMA}:javalang-{getattr(javalang, '__version__', 'unknown')}:py{sys.version_info[0]}.{sys.version_info[1]}:marshal{marshal.version}"
+
+
+def parse_source(source_code, cache=None):
+    """
+    Tokenizes and parses Java source. Returns (tree, spans), where spans is a
+    TokenSpans over the tokens. With a ParseCache, unchanged sources are
+    loaded from disk instead of being parsed again. Syntax errors propagate
+    as from javalang and are never cached.
+    """
+    key = None
+    if cache is not None:
+        key = cache.key(source_code)
+        parsed = cache.load(key)
+        if parsed is not None:
+            return parsed
+
+    tokens = list(javalang.tokenizer.tokenize(source_code))
+    tree = javalang.parser.Parser(tokens).parse()
+    spans = TokenSpans(tokens)
+    if cache is not None:
+        cache.store(key, tree, spans)
+    return tree, spans
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed sources, keyed by a hash of the source text.
+    Each entry holds the tree pickled and the token columns (values,
+    positions, separator flags) marshalled, compressed together with zlib.
+    Loading one is several times faster than tokenizing and parsing again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source_code):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{_FORMAT}:".encode())
+        digest.update(source_code.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        # Shard by prefix so no single directory grows too large
+        return os.path.join(self.directory, key[:2], key + ".ast")
+
+    def load(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        # Unpickling creates one object per node; collecting during that is wasted work
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            fmt, columns, tree_bytes = marshal.loads(zlib.decompress(data))
+            if fmt != _FORMAT:
+                raise ValueError("format mismatch")
+            tree = pickle.loads(tree_bytes)
+        except (ValueError, EOFError, TypeError, zlib.error, pickle.UnpicklingError, AttributeError, ImportError):
+            # Corrupt or foreign entry: treat as a miss, it is rewritten after parsing
+            self.misses += 1
+            return None
+        finally:
+            if collecting:
+                gc.enable()
+        self.hits += 1
+        return tree, TokenSpans.from_columns(*columns)
+
+    def store(self, key, tree, spans):
+        path = self._path(key)
+        try:
+            tree_bytes = pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # Extremely deep expressions; such files are simply parsed every time
+            return
+        data = zlib.compress(marshal.dumps((_FORMAT, spans.columns_data(), tree_bytes)), 1)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Best effort: the caller already has its parse
+            pass
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    The process-wide ParseCache for the ANALYSIS_AST_CACHE_DIR environment
+    variable, or None when it is unset.
+    The variable is read on first use, so worker processes started after it
+    was set (e.g. by scan.py --ast-cache) pick it up.
+    """
+    global _default
+    directory = os.environ.get("ANALYSIS_AST_CACHE_DIR")
+    if not directory:
+        return None
+    with _default_lock:
+        if _default is None or _default.directory != directory:
+            try:
+                _default = ParseCache(directory)
+            except OSError:
+                # An unusable directory only costs the speed-up
+                return None
+    return _default
@@ -0,0 +1,125 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# Bump when the report format or detector behaviour changes so stale entries are ignored
+CACHE_VERSION = 10
+
+# Cache settings (Configurable through the environment)
+# ANALYSIS_CACHE_DIR enables the on-disk tier; leave unset for memory only
+CACHE_SETTINGS = {
+    "MAX_ENTRIES": int(os.environ.get("ANALYSIS_CACHE_SIZE", 1024)),
+    "DIRECTORY": os.environ.get("ANALYSIS_CACHE_DIR") or None,
+}
+
+
+def cache_key(source_code, thresholds=None, variant=""):
+    """
+    Content address of an analysis: hash of the source text, the active
+    thresholds and the cache version. Reports of another shape (e.g. with
+    smell line ranges for diff mode) use their own `variant`.
+    """
+    if thresholds is None:
+        # Imported here so the cache itself does not pull in javalang
+        from smells import THRESHOLDS as thresholds
+    settings = json.dumps(thresholds, sort_keys=True)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"v{CACHE_VERSION}:{variant + ':' if variant else ''}{settings}:".encode())
+    digest.update(source_code.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of analysis reports.
+    The memory tier is a bounded LRU; the optional disk tier stores one JSON
+    file per key and survives restarts. Cached reports are shared between
+    callers and must not be mutated. Pass directory="" to keep a cache in
+    memory regardless of ANALYSIS_CACHE_DIR.
+    """
+
+    def __init__(self, max_entries=None, directory=None):
+        self.max_entries = CACHE_SETTINGS["MAX_ENTRIES"] if max_entries is None else max_entries
+        self.directory = directory if directory is not None else CACHE_SETTINGS["DIRECTORY"]
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        # Shard by prefix so no single directory grows too large
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        with self._lock:
+            report = self._entries.get(key)
+            if report is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return report
+
+        report = self._load(key) if self.directory else None
+        with self._lock:
+            if report is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, report)
+        return report
+
+    def put(self, key, report):
+        with self._lock:
+            self._remember(key, report)
+        if self.directory:
+            self._store(key, report)
+
+    def _remember(self, key, report):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = report
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, report):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(report, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is best effort; the memory tier still holds the result
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "misses": self.misses,
+            "hitRatio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "diskEnabled": bool(self.directory)
+        }
@@ -0,0 +1,449 @@
+"""
+Diff mode: analyze only what a change touched and keep the smells it introduced.
+
+A change comes from a unified diff (applied to the files on disk) or from two
+revisions of a local git repository. Both versions of every touched .java
+file are analyzed, reports are cached by content so the base side of a pull
+request is usually a cache hit, and a smell of the new version is reported
+when it lies on changed lines and is new or worse than its counterpart in the
+old version.
+"""
+import bisect
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import re
+import subprocess
+
+from javalang.tree import TypeDeclaration, MethodDeclaration, ConstructorDeclaration, FieldDeclaration
+
+from engine import walk
+
+JAVA_SUFFIX = ".java"
+_HUNK = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_LINE_LOCATION = re.compile(r"^(Lines?) (\d+)(?:-(\d+))?$")
+_NUMBER = re.compile(r"\d+")
+SEVERITY_RANK = {"Low": 0, "Medium": 1, "High": 2}
+
+
+class Edit:
+    """
+    One run of removed and/or added lines. `old_start` and `new_start` are
+    the first line of the run on each side, or for an empty side the line
+    the run sits before.
+    """
+    __slots__ = ("old_start", "new_start", "removed", "added")
+
+    def __init__(self, old_start, new_start, removed, added):
+        self.old_start = old_start
+        self.new_start = new_start
+        self.removed = removed
+        self.added = added
+
+
+class FileDiff:
+    """The edits of one file; old_path is None for added files, new_path for deleted ones."""
+
+    def __init__(self, old_path, new_path):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.edits = []
+        # Sides marked "\ No newline at end of file"
+        self.old_unterminated = False
+        self.new_unterminated = False
+
+    @property
+    def status(self):
+        if self.old_path is None:
+            return "added"
+        if self.new_path is None:
+            return "deleted"
+        return "renamed" if self.old_path != self.new_path else "modified"
+
+    def changed_ranges(self):
+        """
+        Sorted, merged [start, end] ranges of new-version lines the change
+        touched. A pure deletion touches the lines on both sides of it.
+        """
+        ranges = []
+        for edit in self.edits:
+            if edit.added:
+                start, end = edit.new_start, edit.new_start + len(edit.added) - 1
+            else:
+                start, end = max(1, edit.new_start - 1), edit.new_start
+            if ranges and start <= ranges[-1][1] + 1:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        return ranges
+
+    def map_line(self, old_line):
+        # Line of the new version holding an unchanged old line; None when it was edited
+        delta = 0
+        for edit in self.edits:
+            if old_line < edit.old_start:
+                break
+            if old_line < edit.old_start + len(edit.removed):
+                return None
+            delta += len(edit.added) - len(edit.removed)
+        return old_line + delta
+
+    def reverse(self, new_text):
+        """
+        Rebuilds the old version from the new one. Raises ValueError when the
+        added lines do not match, i.e. the diff does not describe this text.
+        """
+        terminated = new_text.endswith("\n")
+        new_lines = (new_text[:-1] if terminated else new_text).split("\n")
+        old_lines = []
+        position = 0
+        for edit in self.edits:
+            start = edit.new_start - 1
+            if new_lines[start:start + len(edit.added)] != edit.added:
+                raise ValueError(f"Diff does not match {self.new_path} at line {edit.new_start}")
+            old_lines.extend(new_lines[position:start])
+            old_lines.extend(edit.removed)
+            position = start + len(edit.added)
+        old_lines.extend(new_lines[position:])
+        if self.old_unterminated:
+            terminated = False
+        elif self.new_unterminated:
+            terminated = True
+        return "\n".join(old_lines) + ("\n" if terminated else "")
+
+
+def _diff_path(value):
+    # "a/src/Foo.java", optionally followed by a tab and a timestamp (diff -u)
+    value = value.split("\t", 1)[0].strip().strip('"')
+    if value == "/dev/null":
+        return None
+    return value[2:] if value[:2] in ("a/", "b/") else value
+
+
+def parse_diff(text):
+    """
+    Parses a unified diff (git or diff -u) into FileDiffs of .java files, in
+    diff order. Context lines are dropped; only runs of changed lines are kept.
+    """
+    files = []
+    current = None
+    # Between "diff --git" and "+++": the lines there all describe one file
+    in_header = False
+    lines = text.split("\n")
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if line.startswith("diff --git "):
+            current = FileDiff(None, None)
+            files.append(current)
+            in_header = True
+        elif in_header and line.startswith("rename from "):
+            current.old_path = line[len("rename from "):]
+        elif in_header and line.startswith("rename to "):
+            current.new_path = line[len("rename to "):]
+        elif line.startswith("--- "):
+            if not in_header:
+                current = FileDiff(None, None)
+                files.append(current)
+                in_header = True
+            current.old_path = _diff_path(line[4:])
+        elif line.startswith("+++ ") and in_header:
+            current.new_path = _diff_path(line[4:])
+            in_header = False
+        else:
+            match = _HUNK.match(line)
+            if match is None or current is None:
+                continue
+            in_header = False
+            old_start, old_count, new_start, new_count = (int(g) if g is not None else 1 for g in match.groups())
+            # An empty side is numbered after the line it follows
+            old_line = old_start if old_count else old_start + 1
+            new_line = new_start if new_count else new_start + 1
+            run = None
+            kind = None
+            while i < len(lines) and (old_count > 0 or new_count > 0 or lines[i].startswith("\\")):
+                body = lines[i]
+                i += 1
+                if body.startswith("\\"):
+                    # No newline after the previous line, on its side(s)
+                    current.old_unterminated |= kind != "+"
+                    current.new_unterminated |= kind != "-"
+                    continue
+                kind, content = body[:1], body[1:]
+                if kind == "-" or kind == "+":
+                    if run is None:
+                        run = Edit(old_line, new_line, [], [])
+                        current.edits.append(run)
+                    if kind == "-":
+                        run.removed.append(content)
+                        old_line += 1
+                        old_count -= 1
+                    else:
+                        run.added.append(content)
+                        new_line += 1
+                        new_count -= 1
+                else:
+                    run = None
+                    old_line += 1
+                    new_line += 1
+                    old_count -= 1
+                    new_count -= 1
+    return [f for f in files if (f.new_path or f.old_path or "").endswith(JAVA_SUFFIX)]
+
+
+def _read_blobs(repo, specs):
+    # Contents of "<revision>:<path>" specs through one `git cat-file --batch`; None when missing
+    if not specs:
+        return []
+    data = subprocess.run(["git", "-C", repo, "cat-file", "--batch"], input="\n".join(specs).encode() + b"\n",
+                          capture_output=True, check=True).stdout
+    blobs = []
+    position = 0
+    for _ in specs:
+        end = data.index(b"\n", position)
+        header = data[position:end].split()
+        position = end + 1
+        if len(header) != 3 or header[1] != b"blob":
+            blobs.append(None)
+            continue
+        size = int(header[2])
+        blobs.append(data[position:position + size].decode("utf-8", "replace"))
+        position += size + 1
+    return blobs
+
+
+def _read_file(root, path):
+    try:
+        with open(os.path.join(root, path), "r", encoding="utf-8", errors="replace", newline="") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def git_changes(repo, base, head=None):
+    """
+    Changed .java files between two revisions of the repository at `repo`
+    (`head` None compares with the working tree; untracked files are not
+    part of it). Returns [(FileDiff, old source or None, new source)]
+    without deleted files; the new source is an exception when unreadable.
+    """
+    command = ["git", "-C", repo, "diff", "--no-color", "--no-ext-diff", "-U0", "-M", base]
+    if head:
+        command.append(head)
+    text = subprocess.run(command + ["--", f"*{JAVA_SUFFIX}"], capture_output=True, check=True).stdout.decode("utf-8", "replace")
+    diffs = [d for d in parse_diff(text) if d.new_path is not None]
+    old_sources = _read_blobs(repo, [f"{base}:{d.old_path}" for d in diffs if d.old_path is not None])
+    if head:
+        new_sources = _read_blobs(repo, [f"{head}:{d.new_path}" for d in diffs])
+    else:
+        new_sources = [_read_file(repo, d.new_path) for d in diffs]
+    old_sources = iter(old_sources)
+    return [(d, next(old_sources) if d.old_path is not None else None,
+             new if new is not None else ValueError(f"Cannot read {d.new_path}"))
+            for d, new in zip(diffs, new_sources)]
+
+
+def diff_changes(text, root="."):
+    """
+    Changed .java files of a unified diff whose new side is on disk under
+    `root`; the old side is rebuilt by undoing the diff. Same shape as
+    git_changes; the new source is an exception when the diff does not
+    apply to the file on disk.
+    """
+    changes = []
+    for diff in parse_diff(text):
+        if diff.new_path is None:
+            continue
+        new_source = _read_file(root, diff.new_path)
+        if new_source is None:
+            changes.append((diff, None, ValueError(f"Cannot read {diff.new_path}")))
+            continue
+        try:
+            old_source = diff.reverse(new_source) if diff.old_path is not None else None
+        except ValueError as e:
+            changes.append((diff, None, e))
+            continue
+        changes.append((diff, old_source, new_source))
+    return changes
+
+
+def locate_smells(tree, spans, smells, origins=None):
+    """
+    Copies of `smells` with "lines": the [start, end] ranges their location
+    names (every declaration of that name), or None for locations that name
+    no declaration (e.g. Data Clumps). Without a `tree` (quick analysis) only
+    line locations are resolved. `origins` (see run_rules) pins a smell to
+    the declaration it was recorded at, so overloads do not share ranges.
+    """
+    declared = collections.defaultdict(list)
+    for node, _ in walk(tree) if tree is not None else ():
+        names = _declared_names(node)
+        if not names:
+            continue
+        line_range = _line_range(spans, node)
+        if line_range is None:
+            continue
+        for name in names:
+            declared[name].append(line_range)
+
+    located = []
+    for i, smell in enumerate(smells):
+        match = _LINE_LOCATION.match(smell["location"])
+        origin = origins[i] if origins is not None else None
+        if origin is not None and smell["location"] in _declared_names(origin):
+            origin = _line_range(spans, origin)
+        else:
+            origin = None
+        if match:
+            start = int(match.group(2))
+            lines = [[start, int(match.group(3) or start)]]
+        elif origin is not None:
+            lines = [origin]
+        else:
+            lines = declared.get(smell["location"])
+        located.append(dict(smell, lines=lines))
+    return located
+
+
+def _declared_names(node):
+    # The locations smells use for a declaration
+    if isinstance(node, TypeDeclaration):
+        return [node.name]
+    if isinstance(node, (MethodDeclaration, ConstructorDeclaration)):
+        return [f"{node.name}()"]
+    if isinstance(node, FieldDeclaration):
+        return [f"Field '{declarator.name}'" for declarator in node.declarators]
+    return []
+
+
+def _line_range(spans, node):
+    span = spans.span(node) if spans is not None else None
+    return list(spans.line_range(span)) if span is not None else None
+
+
+def _touches(changed, lines):
+    if lines is None:
+        return True
+    starts = [r[0] for r in changed]
+    for start, end in lines:
+        i = bisect.bisect_right(starts, end) - 1
+        if i >= 0 and changed[i][1] >= start:
+            return True
+    return False
+
+
+def _magnitude(smell):
+    # First number of the reason: parameters, lines, methods, cases, ...
+    match = _NUMBER.search(smell.get("reason", ""))
+    return int(match.group()) if match else 0
+
+
+def _old_location(location, diff):
+    # Line-based locations of the old version, renumbered like the new one
+    match = _LINE_LOCATION.match(location)
+    if not match:
+        return location
+    start = diff.map_line(int(match.group(2)))
+    end = diff.map_line(int(match.group(3))) if match.group(3) else start
+    if start is None or end is None:
+        return None
+    return f"Lines {start}-{end}" if match.group(3) else f"Line {start}"
+
+
+def introduced_smells(old_smells, new_smells, diff):
+    """
+    Smells of the new version that lie on changed lines and are new (no
+    smell of the same type at the same location before) or worsened (higher
+    severity or a larger measure in the reason than before). Each gets a
+    "change" of "new" or "worsened"; worsened ones also "previous".
+    """
+    before = collections.defaultdict(collections.deque)
+    for smell in old_smells:
+        location = _old_location(smell["location"], diff)
+        if location is not None:
+            before[(smell["type"], location)].append(smell)
+
+    changed = diff.changed_ranges()
+    found = []
+    for smell in new_smells:
+        matches = before.get((smell["type"], smell["location"]))
+        previous = matches.popleft() if matches else None
+        if not _touches(changed, smell.get("lines")):
+            continue
+        if previous is None:
+            found.append(dict(smell, change="new"))
+        elif (SEVERITY_RANK.get(smell["severity"], 0) > SEVERITY_RANK.get(previous["severity"], 0)
+              or _magnitude(smell) > _magnitude(previous)):
+            found.append(dict(smell, change="worsened",
+                              previous={"severity": previous["severity"], "reason": previous["reason"]}))
+    return found
+
+
+def _analyze_located(source_code):
+    # Imported here: the analyzer imports this module
+    from analyzer import analyze_code
+    return analyze_code(source_code, locate=True)
+
+
+def analyze_changes(changes, cache=None, jobs=None):
+    """
+    Yields one report per changed file: the usual report shape with only the
+    introduced smells, plus "path", "status" ("added", "modified",
+    "renamed") and "changedLines". Both versions are analyzed at most once
+    per content: reports come from `cache` (a ResultCache) when present and
+    are stored there otherwise.
+    """
+    from inputs import count_lines
+    from cache import cache_key
+
+    keys = {}
+    for diff, old_source, new_source in changes:
+        # Pure renames cannot introduce anything
+        if not diff.edits:
+            continue
+        for source_code in (old_source, new_source):
+            if isinstance(source_code, str) and source_code not in keys:
+                keys[source_code] = cache_key(source_code, variant="located")
+    reports = {}
+    missing = []
+    for source_code, key in keys.items():
+        report = cache.get(key) if cache is not None else None
+        if report is None:
+            missing.append(source_code)
+        else:
+            reports[source_code] = report
+
+    jobs = min(jobs or os.cpu_count() or 1, len(missing))
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+            analyzed = list(pool.map(_analyze_located, missing, chunksize=max(1, len(missing) // (jobs * 4))))
+    else:
+        analyzed = [_analyze_located(source_code) for source_code in missing]
+    for source_code, report in zip(missing, analyzed):
+        reports[source_code] = report
+        if cache is not None:
+            cache.put(keys[source_code], report)
+
+    for diff, old_source, new_source in changes:
+        record = {"path": diff.new_path, "status": diff.status, "changedLines": diff.changed_ranges()}
+        if diff.status == "renamed":
+            record["oldPath"] = diff.old_path
+        if not isinstance(new_source, str):
+            yield dict(record, error=f"Diff Error: {new_source}", summary={"totalLines": 0, "totalSmells": 0}, smells=[])
+            continue
+        if not diff.edits:
+            yield dict(record, summary={"totalLines": count_lines(new_source), "totalSmells": 0}, smells=[])
+            continue
+        new_report = reports[new_source]
+        if "error" in new_report:
+            yield dict(new_report, **record)
+            continue
+        old_smells = reports[old_source]["smells"] if old_source is not None else []
+        smells = introduced_smells(old_smells, new_report["smells"], diff)
+        report = dict(record, summary={"totalLines": new_report["summary"]["totalLines"], "totalSmells": len(smells)},
+                      smells=smells)
+        if "parseErrors" in new_report:
+            report["parseErrors"] = new_report["parseErrors"]
+        yield report
@@ -0,0 +1,369 @@
+import bisect
+import hashlib
+from array import array
+
+from javalang.tokenizer import Keyword, Boolean
+
+# NumPy is imported on first use: it takes longer to import than the rest of
+# the analyzer, and only pays off from NUMPY_MIN_TOKENS tokens on
+NUMPY_MIN_TOKENS = 20_000
+_numpy = None
+
+# Rolling hash parameters: polynomial hash over line fingerprints modulo a Mersenne prime
+_MOD = (1 << 61) - 1
+_BASE = 1_000_003
+
+# Token windows hash modulo 2**64, which numpy's uint64 arithmetic wraps to for free
+_MASK = (1 << 64) - 1
+_TOKEN_BASE = 0x9E3779B97F4A7C15
+
+
+def _load_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            # Token clones fall back to a pure Python index (same results, slower)
+            _numpy = False
+    return _numpy or None
+
+
+def line_fingerprints(source_code_lines):
+    """
+    Fingerprints every non-blank line after stripping whitespace.
+    Returns (line_numbers, hashes): 1-based source line numbers and stable
+    64-bit hashes, as compact arrays that are cheap to send between processes.
+    """
+    line_numbers = array("I")
+    hashes = array("Q")
+    for number, line in enumerate(source_code_lines, 1):
+        stripped = line.strip()
+        if stripped:
+            line_numbers.append(number)
+            hashes.append(int.from_bytes(hashlib.blake2b(stripped.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little"))
+    return line_numbers, hashes
+
+
+def rolling_hashes(hashes, window_size):
+    """
+    Yields the Rabin-Karp hash of every window of `window_size` consecutive lines.
+    """
+    if len(hashes) < window_size:
+        return
+    top = pow(_BASE, window_size - 1, _MOD)
+    value = 0
+    for i in range(window_size):
+        value = (value * _BASE + hashes[i]) % _MOD
+    yield value
+    for i in range(window_size, len(hashes)):
+        value = ((value - hashes[i - window_size] * top) * _BASE + hashes[i]) % _MOD
+        yield value
+
+
+def _stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+
+_KEYWORDS = frozenset(Keyword.VALUES)
+_IDENTIFIER = _stable_hash("<identifier>")
+_LITERAL = _stable_hash("<literal>")
+_token_codes = {}
+
+
+def _token_code(value):
+    # Identifiers and literals collapse into one placeholder each, so renamed
+    # variables and changed constants still match (Type-2 clones)
+    first = value[0]
+    if first == '"' or first == "'" or first.isdigit() or (first == "." and value[1:2].isdigit()) or value in Boolean.VALUES or value == "null":
+        return _LITERAL
+    if (first.isalpha() or first == "_" or first == "$") and value not in _KEYWORDS:
+        return _IDENTIFIER
+    return _stable_hash(value)
+
+
+def token_fingerprints(values, lines):
+    """
+    Normalized codes of a token stream (e.g. the `values` and `lines`
+    columns of a TokenSpans). Returns (line_numbers, codes) as compact
+    arrays: the source line and a stable 64-bit code of every token.
+    """
+    codes = array("Q")
+    cache = _token_codes
+    if len(cache) > 100_000:
+        # Distinct identifiers accumulate across a large scan; start over
+        cache.clear()
+    for value in values:
+        code = cache.get(value)
+        if code is None:
+            code = cache[value] = _token_code(value)
+        codes.append(code)
+    return array("I", lines), codes
+
+
+class Clone:
+    __slots__ = ("path", "start_line", "end_line", "other_path", "other_start_line", "other_end_line", "lines", "tokens")
+
+    def __init__(self, path, start_line, end_line, other_path, other_start_line, other_end_line, lines, tokens=None):
+        self.path = path
+        self.start_line = start_line
+        self.end_line = end_line
+        self.other_path = other_path
+        self.other_start_line = other_start_line
+        self.other_end_line = other_end_line
+        self.lines = lines
+        self.tokens = tokens
+
+    def as_dict(self):
+        clone = {
+            "path": self.path,
+            "startLine": self.start_line,
+            "endLine": self.end_line,
+            "otherPath": self.other_path,
+            "otherStartLine": self.other_start_line,
+            "otherEndLine": self.other_end_line,
+            "lines": self.lines
+        }
+        if self.tokens is not None:
+            clone["tokens"] = self.tokens
+        return clone
+
+
+class CloneIndex:
+    """
+    Shared fingerprint index for finding copy-paste within and across files.
+    Each distinct window hash is stored once, pointing at its first occurrence,
+    so memory grows with the number of unique fingerprints. Consecutive
+    matching windows are merged into one maximal clone.
+    """
+
+    def __init__(self, window_size):
+        self.window_size = window_size
+        self._first_seen = {}
+        self._paths = []
+        self._line_numbers = []
+
+    def add(self, path, source_code_lines):
+        return self.add_fingerprints(path, *line_fingerprints(source_code_lines))
+
+    def add_fingerprints(self, path, line_numbers, hashes):
+        """
+        Indexes one file and returns the clones it shares with everything
+        indexed so far, including earlier parts of the same file.
+        """
+        file_id = len(self._paths)
+        self._paths.append(path)
+        self._line_numbers.append(line_numbers)
+
+        clones = []
+        run = None  # [start window, other file id, other start window, window count]
+        for i, fingerprint in enumerate(rolling_hashes(hashes, self.window_size)):
+            key = (file_id << 32) | i
+            packed = self._first_seen.setdefault(fingerprint, key)
+            if packed == key:
+                hit = None
+            else:
+                hit = (packed >> 32, packed & 0xFFFFFFFF)
+                # Windows overlapping themselves are repetition, not copy-paste
+                if hit[0] == file_id and hit[1] + self.window_size > i:
+                    hit = None
+
+            if run and hit and hit[0] == run[1] and hit[1] == run[2] + run[3] and i == run[0] + run[3]:
+                run[3] += 1
+                continue
+            if run:
+                clones.append(self._clone(file_id, run))
+                run = None
+            if hit:
+                run = [i, hit[0], hit[1], 1]
+        if run:
+            clones.append(self._clone(file_id, run))
+        return clones
+
+    def _clone(self, file_id, run):
+        start, other_id, other_start, windows = run
+        length = windows + self.window_size - 1
+        lines = self._line_numbers[file_id]
+        other_lines = self._line_numbers[other_id]
+        return Clone(
+            self._paths[file_id], lines[start], lines[start + length - 1],
+            self._paths[other_id], other_lines[other_start], other_lines[other_start + length - 1],
+            length)
+
+    def __len__(self):
+        return len(self._first_seen)
+
+
+class TokenCloneIndex:
+    """
+    Type-2 clone finder over normalized token streams (see
+    `token_fingerprints`). Files are collected with `add_fingerprints` and
+    compared all at once by `clones()`: every window of `window_size`
+    tokens is hashed, equal hashes are grouped by sorting, and consecutive
+    matching windows are merged into maximal clones, each paired with the
+    first occurrence of its code. With numpy the hashing, sorting and
+    merging run as array operations over all files together.
+    """
+
+    def __init__(self, window_size):
+        self.window_size = window_size
+        self._paths = []
+        self._line_numbers = []
+        self._codes = []
+
+    def add_fingerprints(self, path, line_numbers, codes):
+        self._paths.append(path)
+        self._line_numbers.append(line_numbers)
+        self._codes.append(codes)
+
+    def __len__(self):
+        return sum(len(codes) for codes in self._codes)
+
+    def clones(self):
+        if not self._codes:
+            return []
+        self._offsets = [0]
+        for codes in self._codes:
+            self._offsets.append(self._offsets[-1] + len(codes))
+        numpy = _load_numpy() if self._offsets[-1] >= NUMPY_MIN_TOKENS else None
+        runs = self._runs_numpy(numpy) if numpy is not None else self._runs_python()
+        # Runs break where a window's first occurrence lies elsewhere (common in
+        # repetitive code), so each run is extended token by token to its
+        # maximal match. Runs come ordered by start; the part of a run that an
+        # earlier clone already covers is dropped, so clones never overlap
+        codes = array("Q")
+        for file_codes in self._codes:
+            codes.extend(file_codes)
+        found = []
+        reach = -1
+        for start, other_start, windows in runs:
+            if start + windows + self.window_size - 1 <= reach:
+                continue
+            start, other_start, length = self._extend(codes, start, other_start, windows)
+            if start < reach:
+                length -= reach - start
+                other_start += reach - start
+                start = reach
+            if length < self.window_size:
+                continue
+            reach = start + length
+            found.append(self._clone(start, other_start, length))
+        return found
+
+    def _extend(self, codes, start, other_start, windows):
+        # Returns (start, other start, token count) of the maximal match around a run
+        file_start, file_end = self._bounds(start)
+        other_file_start, other_file_end = self._bounds(other_start)
+        length = windows + self.window_size - 1
+        while (start > file_start and other_start > other_file_start
+               and codes[start - 1] == codes[other_start - 1]):
+            start -= 1
+            other_start -= 1
+            length += 1
+        # Within one file the earlier copy must end before the later one starts
+        limit = min(file_end - start, other_file_end - other_start)
+        if file_start == other_file_start:
+            limit = min(limit, start - other_start)
+        while length < limit and codes[start + length] == codes[other_start + length]:
+            length += 1
+        return start, other_start, length
+
+    def _runs_numpy(self, numpy):
+        # Returns (start, other start, window count) in global token positions
+        n = self.window_size
+        codes = numpy.concatenate([numpy.frombuffer(c, dtype=numpy.uint64) for c in self._codes])
+        files = numpy.repeat(numpy.arange(len(self._codes), dtype=numpy.int64), [len(c) for c in self._codes])
+        total = len(codes)
+        if total < n:
+            return []
+
+        # 1. Window hashes: sum(code[i + k] * BASE^(n-1-k)), from prefix sums
+        #    weighted by BASE^-j (BASE is odd, so it is invertible mod 2**64)
+        with numpy.errstate(over="ignore"):
+            inverse = numpy.uint64(pow(_TOKEN_BASE, -1, 1 << 64))
+            inverse_powers = numpy.cumprod(numpy.full(total, inverse, dtype=numpy.uint64)) * numpy.uint64(_TOKEN_BASE)
+            powers = numpy.cumprod(numpy.full(total, _TOKEN_BASE, dtype=numpy.uint64)) * inverse
+            prefix = numpy.concatenate([numpy.zeros(1, dtype=numpy.uint64), numpy.cumsum(codes * inverse_powers, dtype=numpy.uint64)])
+            starts = numpy.arange(total - n + 1)
+            hashes = powers[starts + n - 1] * (prefix[starts + n] - prefix[starts])
+
+        # Windows crossing from one file into the next are not code
+        valid = files[starts] == files[starts + n - 1]
+        starts, hashes = starts[valid], hashes[valid]
+
+        # 2. Group equal hashes; a stable sort keeps each group in file order
+        order = numpy.argsort(hashes, kind="stable")
+        hashes, positions = hashes[order], starts[order]
+        first_of_group = numpy.empty(len(hashes), dtype=bool)
+        first_of_group[:1] = True
+        first_of_group[1:] = hashes[1:] != hashes[:-1]
+        group_start = numpy.maximum.accumulate(numpy.where(first_of_group, numpy.arange(len(hashes)), 0))
+        later = positions[~first_of_group]
+        earlier = positions[group_start][~first_of_group]
+
+        # Windows overlapping their own match are repetition, not copy-paste
+        keep = (files[later] != files[earlier]) | (later - earlier >= n)
+        later, earlier = later[keep], earlier[keep]
+
+        # 3. Merge windows that continue the previous pair into runs
+        order = numpy.argsort(later, kind="stable")
+        later, earlier = later[order], earlier[order]
+        continues = numpy.zeros(len(later), dtype=bool)
+        continues[1:] = (later[1:] == later[:-1] + 1) & (earlier[1:] == earlier[:-1] + 1)
+        run_starts = numpy.flatnonzero(~continues)
+        windows = numpy.diff(numpy.append(run_starts, len(later)))
+        return zip(later[run_starts].tolist(), earlier[run_starts].tolist(), windows.tolist())
+
+    def _runs_python(self):
+        n = self.window_size
+        top = pow(_TOKEN_BASE, n - 1, 1 << 64)
+        first_seen = {}
+        runs = []
+        offset = 0
+        for codes in self._codes:
+            run = None  # [start, other start, window count]
+            value = 0
+            for i, code in enumerate(codes):
+                if i >= n:
+                    value = (value - codes[i - n] * top) & _MASK
+                value = (value * _TOKEN_BASE + code) & _MASK
+                if i < n - 1:
+                    continue
+                position = offset + i - n + 1
+                other = first_seen.setdefault(value, position)
+                # Windows overlapping their own match are repetition, not copy-paste
+                if other == position or (other >= offset and position - other < n):
+                    other = None
+                if run and other is not None and other == run[1] + run[2] and position == run[0] + run[2]:
+                    run[2] += 1
+                    continue
+                if run:
+                    runs.append(run)
+                    run = None
+                if other is not None:
+                    run = [position, other, 1]
+            if run:
+                runs.append(run)
+            offset += len(codes)
+        return runs
+
+    def _locate(self, position):
+        # Global token position -> (file id, token index in that file)
+        file_id = bisect.bisect_right(self._offsets, position) - 1
+        return file_id, position - self._offsets[file_id]
+
+    def _bounds(self, position):
+        # Global token range [start, end) of the file holding a position
+        file_id = bisect.bisect_right(self._offsets, position) - 1
+        return self._offsets[file_id], self._offsets[file_id + 1]
+
+    def _clone(self, start, other_start, length):
+        file_id, first = self._locate(start)
+        other_id, other_first = self._locate(other_start)
+        lines = self._line_numbers[file_id]
+        other_lines = self._line_numbers[other_id]
+        return Clone(
+            self._paths[file_id], lines[first], lines[first + length - 1],
+            self._paths[other_id], other_lines[other_first], other_lines[other_first + length - 1],
+            lines[first + length - 1] - lines[first] + 1, tokens=length)
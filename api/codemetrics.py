@@ -0,0 +1,346 @@
+import collections
+
+from javalang.tree import (MemberReference, MethodInvocation, MethodDeclaration, FieldDeclaration, ClassDeclaration,
+                           ClassCreator, This, LambdaExpression, VariableDeclaration, FormalParameter,
+                           InferredFormalParameter, CatchClauseParameter, TryResource, ForControl, EnhancedForControl,
+                           ReturnStatement, StatementExpression)
+
+from spans import lex
+
+
+def accessor_flags(name):
+    # (getter, setter, predicate) by naming convention: getX(), setX(), isX()
+    return name.startswith("get"), name.startswith("set"), name.startswith("is")
+
+
+def _delegation(node):
+    # The call that is all a body does: `return a.b(...);`, `this.a.b(...);` (its target is resolved in the walk)
+    if not node.body or len(node.body) != 1:
+        return None
+    statement = node.body[0]
+    if not isinstance(statement, (ReturnStatement, StatementExpression)):
+        return None
+    expression = statement.expression
+    if not isinstance(expression, (MethodInvocation, This)) or expression.prefix_operators or expression.postfix_operators:
+        return None
+    if isinstance(expression, MethodInvocation):
+        qualifier = expression.qualifier
+        if qualifier and "." not in qualifier and not expression.selectors:
+            return expression
+    elif isinstance(expression, This) and not expression.qualifier:
+        selectors = expression.selectors or []
+        if (len(selectors) == 2 and isinstance(selectors[0], MemberReference)
+                and isinstance(selectors[1], MethodInvocation) and not selectors[1].selectors):
+            return selectors[1]
+    return None
+
+
+class ReferenceProfile:
+    """
+    What the body of one method refers to, collected during the walk (see
+    MetricsTable). `own` counts uses of its own class's fields and methods
+    (`x`, `this.x`, `m()`); `foreign` counts, per other variable (local,
+    parameter or field), the members used through it (`order.total`,
+    `order.getTotal()`), and `invoked` holds the method names called on each
+    target ("this" for the class's own). `delegate` is the field whose
+    method the body does nothing but call (`return order.getTotal();`), once
+    the walk has resolved that `order` is a field and not a local or
+    parameter of the same name.
+    """
+    __slots__ = ("own", "foreign", "invoked", "delegate", "delegation")
+
+    def __init__(self, delegation=None):
+        self.own = 0
+        self.foreign = collections.Counter()
+        self.invoked = collections.defaultdict(set)
+        self.delegate = None
+        # The call node that makes up the whole body, if any
+        self.delegation = delegation
+
+
+class MethodMetrics:
+    """
+    Facts about one method declaration. `calls` holds every invoked method
+    name in its body, including those of nested declarations; `profile` is
+    its ReferenceProfile, which leaves those to their own methods.
+    """
+    __slots__ = ("name", "start_line", "end_line", "loc", "parameter_count",
+                 "is_getter", "is_setter", "is_predicate", "calls", "profile")
+
+    @property
+    def is_accessor(self):
+        return self.is_getter or self.is_setter or self.is_predicate
+
+
+class ClassMetrics:
+    """
+    Facts about one class declaration, derived from its members' metrics.
+    `field_usage` is filled in during the walk (see MetricsTable).
+    """
+    __slots__ = ("name", "start_line", "end_line", "loc", "methods", "field_names", "field_count",
+                 "get_set_count", "accessor_count", "field_usage")
+
+    @property
+    def method_count(self):
+        return len(self.methods)
+
+
+class FieldUsage:
+    """
+    Which methods of one class use each of its fields. Fields and methods
+    are numbered in declaration order and the users of a field are a bitset
+    over method numbers, so asking about a field costs the same however
+    many references the class has.
+    """
+    __slots__ = ("field_ids", "methods", "users", "_method_ids")
+
+    def __init__(self, field_names, method_nodes, methods):
+        self.field_ids = {}
+        for name in field_names:
+            self.field_ids.setdefault(name, len(self.field_ids))
+        self.methods = methods
+        self.users = [0] * len(self.field_ids)
+        self._method_ids = {id(node): i for i, node in enumerate(method_nodes)}
+
+    def add(self, field_id, member):
+        # `member` is the class member holding the reference; only methods count
+        method_id = self._method_ids.get(id(member))
+        if method_id is not None:
+            self.users[field_id] |= 1 << method_id
+
+    def use_count(self, name):
+        return self.users[self.field_ids[name]].bit_count()
+
+    def methods_using(self, name):
+        """MethodMetrics of the methods using field `name`, in declaration order."""
+        bits = self.users[self.field_ids[name]]
+        found = []
+        while bits:
+            lowest = bits & -bits
+            found.append(self.methods[lowest.bit_length() - 1])
+            bits ^= lowest
+        return found
+
+
+class MetricsTable:
+    """
+    Per-declaration metrics shared by every rule of one analysis.
+
+    Declaration facts (line counts, parameter counts, accessor flags, field
+    names) are computed the first time a rule asks for a declaration and
+    reused afterwards. With `spans` (a TokenSpans over the parsed tokens)
+    line counts run to the real closing brace; without it they are estimated
+    from the last top-level statement.
+
+    Usage facts (`calls`, `field_usage`) are collected while run_rules walks
+    the tree, through `node_types`/`visit` like a rule, when a rule sets
+    `needs_usage`; such rules read them in `finish()`. A name counts as a use
+    of a field of an enclosing class (`x`, `this.x`, `Outer.this.x`, or the
+    `x` of `x.call()` and `x.y`) unless a local variable or parameter in
+    scope shadows it. The same pass fills each method's ReferenceProfile.
+    """
+    node_types = (MemberReference, MethodInvocation, ClassDeclaration, VariableDeclaration, FormalParameter,
+                  InferredFormalParameter, CatchClauseParameter, TryResource)
+    scope = None
+
+    def __init__(self, spans=None):
+        self.spans = spans
+        self._methods = {}
+        self._classes = {}
+        self._lexed = None
+        # id(node) -> names of the locals and parameters declared in it so far,
+        # or the FieldUsage of a class
+        self._scopes = {}
+
+    def token_spans(self, source_code_lines):
+        """
+        Tokens of the analyzed source for token-level rules: `spans` when the
+        table has them, else the lines tokenized once (lexical errors skipped).
+        """
+        if self.spans is not None:
+            return self.spans
+        if self._lexed is None:
+            self._lexed = lex("\n".join(source_code_lines))[0]
+        return self._lexed
+
+    def _end_line(self, node, last_seen):
+        if self.spans is not None:
+            span = self.spans.span(node)
+            if span is not None:
+                return self.spans.line_range(span)[1]
+        # The closing brace usually sits on the line after the last statement
+        return last_seen + 1
+
+    def method(self, node):
+        metrics = self._methods.get(id(node))
+        if metrics is not None:
+            return metrics
+
+        metrics = MethodMetrics()
+        metrics.name = node.name
+        metrics.start_line = node.position.line if node.position else None
+        if metrics.start_line:
+            last_seen = metrics.start_line
+            for statement in node.body or ():
+                position = getattr(statement, "_position", None)
+                if position and position.line > last_seen:
+                    last_seen = position.line
+            metrics.end_line = self._end_line(node, last_seen)
+            metrics.loc = metrics.end_line - metrics.start_line + 1
+        else:
+            metrics.end_line = None
+            metrics.loc = 0
+        metrics.parameter_count = len(node.parameters)
+        metrics.is_getter, metrics.is_setter, metrics.is_predicate = accessor_flags(node.name)
+        metrics.calls = set()
+        metrics.profile = ReferenceProfile(_delegation(node))
+        self._methods[id(node)] = metrics
+        return metrics
+
+    def methods(self):
+        """Metrics of every method seen so far."""
+        return self._methods.values()
+
+    def cls(self, node):
+        metrics = self._classes.get(id(node))
+        if metrics is not None:
+            return metrics
+
+        methods = [self.method(m) for m in node.methods]
+        fields = [member for member in node.body if isinstance(member, FieldDeclaration)]
+        start_line = node.position.line if node.position else None
+
+        metrics = ClassMetrics()
+        metrics.name = node.name
+        metrics.start_line = start_line
+        if start_line:
+            metrics.end_line = self._end_line(node, max([m.end_line for m in methods if m.end_line] + [start_line]))
+            metrics.loc = metrics.end_line - start_line + 1
+        else:
+            metrics.end_line = None
+            metrics.loc = 0
+        metrics.methods = methods
+        metrics.field_names = [d.name for field in fields for d in field.declarators]
+        metrics.field_count = len(fields)
+        metrics.get_set_count = sum(1 for m in methods if m.is_getter or m.is_setter)
+        metrics.accessor_count = sum(1 for m in methods if m.is_accessor)
+        metrics.field_usage = FieldUsage(metrics.field_names, node.methods, methods)
+        self._classes[id(node)] = metrics
+        return metrics
+
+    def visit(self, node, ancestors):
+        if isinstance(node, (MemberReference, MethodInvocation)):
+            self._reference(node, ancestors)
+        elif isinstance(node, ClassDeclaration):
+            # Names resolve to its fields below it
+            self._scopes[id(node)] = self.cls(node).field_usage
+        else:
+            names = [d.name for d in node.declarators] if isinstance(node, VariableDeclaration) else [node.name]
+            self._declare(names, ancestors)
+
+    def _declare(self, names, ancestors):
+        owner = ancestors[-1]
+        if isinstance(owner, (ForControl, EnhancedForControl)):
+            # for (int i ...) declares i for the whole statement, body included
+            owner = ancestors[-2]
+        self._scopes.setdefault(id(owner), set()).update(names)
+
+    def _reference(self, node, ancestors):
+        # Class identity instead of isinstance: javalang has no subclasses of
+        # these, and this runs for every name in the tree
+        is_call = node.__class__ is MethodInvocation
+        method = None
+        if is_call:
+            for ancestor in ancestors:
+                if ancestor.__class__ is MethodDeclaration:
+                    method = self.method(ancestor)
+                    # A call counts for every method containing it
+                    method.calls.add(node.member)
+        else:
+            for ancestor in reversed(ancestors):
+                if ancestor.__class__ is MethodDeclaration:
+                    method = self.method(ancestor)
+                    break
+        # The innermost method owns the reference in its profile
+        profile = method.profile if method is not None else ReferenceProfile()
+
+        parent = ancestors[-1]
+        if isinstance(parent, LambdaExpression) and any(p is node for p in parent.parameters):
+            # x -> ...: a parameter, not a reference
+            self._declare([node.member], ancestors)
+            return
+        selectors = getattr(parent, "selectors", None)
+        if selectors and any(s is node for s in selectors):
+            # A member of something else (foo().x), except this.x, this.m() and this.x.m()
+            if not isinstance(parent, This):
+                return
+            first = selectors[0]
+            if node is first:
+                if is_call:
+                    profile.own += 1
+                    profile.invoked["this"].add(node.member)
+                else:
+                    self._this_field(node.member, parent.qualifier, ancestors)
+                    if len(selectors) == 1:
+                        profile.own += 1
+            elif node is selectors[1] and isinstance(first, MemberReference):
+                self._foreign(profile, first.member, node, is_call)
+                if node is profile.delegation:
+                    # this.x.m() always calls through a field
+                    profile.delegate = first.member
+            return
+        if node.qualifier:
+            name = node.qualifier.partition(".")[0]
+            resolved = self._field(name, ancestors)
+            if resolved is not None:
+                self._foreign(profile, name, node, is_call)
+            if resolved == "field" and node is profile.delegation:
+                profile.delegate = name
+        elif is_call:
+            profile.own += 1
+            profile.invoked["this"].add(node.member)
+        elif self._field(node.member, ancestors) == "field":
+            profile.own += 1
+
+    def _foreign(self, profile, target, node, is_call):
+        profile.foreign[target] += 1
+        if is_call:
+            profile.invoked[target].add(node.member)
+
+    def _field(self, name, ancestors):
+        """
+        Resolves a plain name, recording the use when it is a field: "field",
+        "local" for a local variable or parameter in scope, or None for
+        anything else (a type, an inherited field, ...).
+        """
+        scopes = self._scopes
+        for i in range(len(ancestors) - 1, -1, -1):
+            names = scopes.get(id(ancestors[i]))
+            if names is None:
+                continue
+            if type(names) is FieldUsage:
+                if self._use(name, names, ancestors, i):
+                    return "field"
+            elif name in names:
+                return "local"
+        return None
+
+    def _this_field(self, name, qualifier, ancestors):
+        # this.x names a field of the innermost class, Outer.this.x one of Outer
+        for i in range(len(ancestors) - 1, -1, -1):
+            ancestor = ancestors[i]
+            if not qualifier and isinstance(ancestor, ClassCreator) and ancestor.body:
+                # The `this` of an anonymous class
+                return
+            if isinstance(ancestor, ClassDeclaration) and (not qualifier or ancestor.name == qualifier):
+                self._use(name, self.cls(ancestor).field_usage, ancestors, i)
+                return
+
+    def _use(self, name, usage, ancestors, class_index):
+        # Records a use of field `name` of ancestors[class_index] by the member below it
+        field_id = usage.field_ids.get(name)
+        if field_id is None:
+            return False
+        if class_index + 1 < len(ancestors):
+            usage.add(field_id, ancestors[class_index + 1])
+        return True
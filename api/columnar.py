@@ -0,0 +1,287 @@
+"""
+Compact columnar form of many analysis reports.
+
+Repeated strings (smell types, severities, refactorings, locations and
+reasons) are stored once per table and referenced by integer codes, and each
+smell attribute is a typed array rather than a field of a dict. Besides the
+codes there are two analytic columns dashboards can aggregate directly: the
+first line a smell points at and its measure (the first number of its
+reason). Locations and reasons are interned with those numbers left out
+("Line {}", "Method has {} parameters"). `report()` turns a file back into
+the usual JSON shape.
+
+Wire forms: `as_dict()` is plain JSON (columns as lists); `to_msgpack()` is
+MessagePack with every column as raw little-endian bytes (needs the
+optional msgpack package). `SmellTable.from_dict()` reads both.
+"""
+import re
+import sys
+from array import array
+
+try:
+    import msgpack
+except ImportError:
+    # Only the binary form needs it; the JSON form works without
+    msgpack = None
+
+FORMAT = "smells-columnar/1"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Smell column -> array typecode (B/H: 1/2 bytes, I: 4 bytes unsigned)
+SMELL_COLUMNS = {
+    "file": "I",
+    "type": "H",
+    "severity": "B",
+    "refactoring": "H",
+    "location": "I",
+    "reason": "I",
+    "line": "I",
+    "metric": "I",
+}
+# Coded smell columns -> the smell field they intern
+SMELL_FIELDS = {
+    "type": "type",
+    "severity": "severity",
+    "refactoring": "suggestedRefactoring",
+    "location": "location",
+    "reason": "reason",
+}
+_SMELL_KEYS = frozenset(SMELL_FIELDS.values())
+# Coded columns interned as templates of the line / metric column
+_TEMPLATED = ("location", "reason")
+_REPORT_FIELDS = ("path", "summary", "smells")
+_LINE_LOCATION = re.compile(r"^Lines? (\d+)")
+_NUMBER = re.compile(r"\d+")
+_UINT32 = (1 << 32) - 1
+
+
+def _line(smell):
+    # First line the smell points at: its located lines, else a "Line N" location; 0 when unknown
+    lines = smell.get("lines")
+    if lines:
+        return lines[0][0]
+    match = _LINE_LOCATION.match(smell["location"])
+    return int(match.group(1)) if match else 0
+
+
+def _metric(smell):
+    # The measure behind the smell: parameters, lines, methods, cases, tokens, ...
+    match = _NUMBER.search(smell["reason"])
+    return min(int(match.group()), _UINT32) if match else 0
+
+
+def _template(value, number):
+    """
+    `value` with its first number, when that is `number`, as "{}": "Line 12"
+    and "Line 40" intern as one "Line {}" next to the line column. Returns
+    None for values that already hold "{}" (stored as they are instead).
+    """
+    if "{}" in value:
+        return None
+    match = _NUMBER.search(value)
+    if match is None or match.group() != str(number):
+        return value
+    return value[:match.start()] + "{}" + value[match.end():]
+
+
+class StringTable:
+    """Interned strings: each distinct value is stored once and referred to by its index."""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class SmellTable:
+    """
+    Reports of many files as per-file and per-smell columns. Fields outside
+    the fixed columns (errors, parseErrors, diff mode "change", ...) are kept
+    sparsely by file or smell index, so every report reads back unchanged.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.total_lines = array("I")
+        # Index of the first smell of each file, plus the end
+        self.offsets = array("I", [0])
+        self.columns = {name: array(typecode) for name, typecode in SMELL_COLUMNS.items()}
+        self.strings = {name: StringTable() for name in SMELL_FIELDS}
+        self.file_extra = {}
+        self.smell_extra = {}
+
+    def __len__(self):
+        return len(self.columns["file"])
+
+    @property
+    def file_count(self):
+        return len(self.paths)
+
+    def add_report(self, report):
+        """Appends one report (with or without "path"); returns its file id."""
+        file_id = len(self.paths)
+        self.paths.append(report.get("path"))
+        summary = report.get("summary") or {}
+        self.total_lines.append(summary.get("totalLines", 0))
+        smells = report.get("smells") or []
+
+        extra = {key: value for key, value in report.items() if key not in _REPORT_FIELDS}
+        if summary != {"totalLines": summary.get("totalLines", 0), "totalSmells": len(smells)}:
+            extra["summary"] = summary
+        if extra:
+            self.file_extra[file_id] = extra
+
+        columns = self.columns
+        strings = self.strings
+        for smell in smells:
+            index = len(columns["file"])
+            line, metric = _line(smell), _metric(smell)
+            columns["file"].append(file_id)
+            columns["line"].append(line)
+            columns["metric"].append(metric)
+            extra = {key: value for key, value in smell.items() if key not in _SMELL_KEYS}
+            for column, field in SMELL_FIELDS.items():
+                value = smell[field]
+                if column in _TEMPLATED:
+                    template = _template(value, line if column == "location" else metric)
+                    if template is None:
+                        extra[field] = value
+                    value = template or ""
+                columns[column].append(strings[column].code(value))
+            if extra:
+                self.smell_extra[index] = extra
+        self.offsets.append(len(columns["file"]))
+        return file_id
+
+    def smell(self, index):
+        # The JSON shape of one smell
+        columns = self.columns
+        smell = {field: self.strings[column].values[columns[column][index]]
+                 for column, field in SMELL_FIELDS.items()}
+        if "{}" in smell["location"]:
+            smell["location"] = smell["location"].replace("{}", str(columns["line"][index]), 1)
+        if "{}" in smell["reason"]:
+            smell["reason"] = smell["reason"].replace("{}", str(columns["metric"][index]), 1)
+        extra = self.smell_extra.get(index)
+        if extra:
+            smell.update(extra)
+        return smell
+
+    def report(self, file_id):
+        """The JSON shape of one file's report, as it was added."""
+        smells = [self.smell(i) for i in range(self.offsets[file_id], self.offsets[file_id + 1])]
+        report = {"summary": {"totalLines": self.total_lines[file_id], "totalSmells": len(smells)}, "smells": smells}
+        report.update(self.file_extra.get(file_id, {}))
+        if self.paths[file_id] is not None:
+            report["path"] = self.paths[file_id]
+        return report
+
+    def reports(self):
+        for file_id in range(len(self.paths)):
+            yield self.report(file_id)
+
+    def counts(self, column="type"):
+        """{value: number of smells} of a coded column, e.g. smells per type."""
+        totals = [0] * len(self.strings[column])
+        for code in self.columns[column]:
+            totals[code] += 1
+        return {value: totals[code] for code, value in enumerate(self.strings[column].values) if totals[code]}
+
+    def as_dict(self, binary=False):
+        """
+        The columnar wire form: "strings" holds the interned values of each
+        coded column, "files" and "smells" the columns. With `binary`, the
+        columns are little-endian bytes in the narrowest unsigned type that
+        holds their values ("columnTypes": B, H or I) instead of lists.
+        """
+        types = {}
+
+        def encode(name, values):
+            if not binary:
+                return list(values)
+            # Each column in the narrowest type that holds its values
+            largest = max(values, default=0)
+            typecode = "B" if largest < 1 << 8 else "H" if largest < 1 << 16 else "I"
+            types[name] = typecode
+            if typecode != values.typecode or sys.byteorder != "little":
+                values = array(typecode, values)
+                if sys.byteorder != "little":
+                    values.byteswap()
+            return values.tobytes()
+
+        files = {
+            "path": self.paths,
+            "totalLines": encode("totalLines", self.total_lines),
+            "offsets": encode("offsets", self.offsets),
+            "extra": {str(file_id): extra for file_id, extra in self.file_extra.items()},
+        }
+        smells = {name: encode(name, column) for name, column in self.columns.items()}
+        smells["extra"] = {str(index): extra for index, extra in self.smell_extra.items()}
+        return {
+            "format": FORMAT,
+            "columnTypes": types or dict(SMELL_COLUMNS, totalLines="I", offsets="I"),
+            "strings": {column: table.values for column, table in self.strings.items()},
+            "files": files,
+            "smells": smells,
+        }
+
+    def to_msgpack(self, extra=None):
+        """as_dict(binary=True) as MessagePack, with the `extra` fields (summary, clones, ...) added."""
+        if msgpack is None:
+            raise RuntimeError("MessagePack output needs the msgpack package (pip install msgpack)")
+        data = self.as_dict(binary=True)
+        data.update(extra or {})
+        return msgpack.packb(data, use_bin_type=True)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Reads as_dict() output, in its JSON or its binary form."""
+        if data.get("format") != FORMAT:
+            raise ValueError(f"Not a {FORMAT} table")
+        types = data["columnTypes"]
+
+        wide = dict(SMELL_COLUMNS, totalLines="I", offsets="I")
+
+        def decode(name, values):
+            if isinstance(values, (bytes, bytearray)):
+                column = array(types[name])
+                column.frombytes(values)
+                if sys.byteorder != "little":
+                    column.byteswap()
+                # Back to the in-memory type, so more reports can be added
+                return array(wide[name], column)
+            return array(wide[name], values)
+
+        table = cls()
+        files = data["files"]
+        table.paths = list(files["path"])
+        table.total_lines = decode("totalLines", files["totalLines"])
+        table.offsets = decode("offsets", files["offsets"])
+        table.file_extra = {int(file_id): extra for file_id, extra in files.get("extra", {}).items()}
+        smells = data["smells"]
+        table.columns = {name: decode(name, smells[name]) for name in SMELL_COLUMNS}
+        table.smell_extra = {int(index): extra for index, extra in smells.get("extra", {}).items()}
+        table.strings = {column: StringTable(data["strings"][column]) for column in SMELL_FIELDS}
+        return table
+
+    @classmethod
+    def from_msgpack(cls, payload):
+        if msgpack is None:
+            raise RuntimeError("MessagePack input needs the msgpack package (pip install msgpack)")
+        return cls.from_dict(msgpack.unpackb(payload, raw=False, strict_map_key=False))
+
+
+def table_of(reports):
+    table = SmellTable()
+    for report in reports:
+        table.add_report(report)
+    return table
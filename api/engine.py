@@ -0,0 +1,284 @@
+import time
+from operator import attrgetter
+
+from javalang.ast import Node
+
+
+class Rule:
+    """
+    Base class for a smell rule driven by the single-pass engine.
+    Subclasses list the javalang node classes they care about in `node_types`
+    and receive every matching node through `visit`. Rules that only need the
+    raw source lines can leave `node_types` empty and work in `finish`.
+
+    A rule whose smells depend only on the text of one enclosing declaration
+    sets `scope` to that declaration type (e.g. MethodDeclaration). Its smells
+    can then be reused for unchanged declarations by incremental analysis.
+    `position_dependent` marks scoped rules whose smells mention line numbers.
+
+    `metrics` is the MetricsTable shared by all rules of one run; rules read
+    declaration facts (line counts, accessors, field uses, ...) from it
+    instead of recomputing them. Rules reading its usage facts (field uses,
+    calls) set `needs_usage` so the table collects them during the walk.
+
+    Smells are tied to the node being visited when they are recorded; a
+    smell recorded in `finish` can be tied to the declaration it is about
+    through `origins` (id(smell) -> node), so it can be located exactly.
+
+    Rules that only look at the token stream (`metrics.token_spans()`) or the
+    lines set `needs_tree` to False: they run without a syntax tree, so a
+    run made only of them never has to parse the source (quick scan).
+    """
+    node_types = ()
+    scope = None
+    position_dependent = False
+    needs_usage = False
+    needs_tree = True
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self.smells = []
+        self.origins = {}
+
+    def visit(self, node, ancestors):
+        pass
+
+    def finish(self, source_code_lines):
+        return self.smells
+
+
+class ScopeMemo:
+    """
+    Smells of scoped rules recorded per declaration, for incremental analysis.
+    `key_function(node)` returns (fingerprint, start line) for a declaration,
+    or None when it cannot be keyed; `previous` holds the entries recorded by
+    the last run on the same document.
+    """
+
+    def __init__(self, key_function, previous=None):
+        self.key_function = key_function
+        self.previous = previous or {}
+        self.current = {}
+        self.reused = 0
+        self.evaluated = 0
+        self._keys = {}
+
+    def key_for(self, rule, node):
+        key = self._keys.get(id(node), False)
+        if key is False:
+            key = self._keys[id(node)] = self.key_function(node)
+        if key is None:
+            return None
+        fingerprint, line = key
+        return (type(rule).__name__, fingerprint, line if rule.position_dependent else None)
+
+
+class _ScopeTracker:
+    # Per-rule state while walking with a ScopeMemo: the outermost open scope
+    # node, its depth, its memo key and whether its smells came from the memo
+    __slots__ = ("node", "depth", "key", "reused", "start")
+
+    def __init__(self):
+        self.node = None
+
+
+def walk(tree):
+    """
+    Pre-order walk over every node, in the same order as `tree.filter()`.
+    Yields (node, ancestors); `ancestors` is a live list of enclosing nodes,
+    outermost first, and must not be kept between iterations.
+    """
+    ancestors = []
+    stack = [(tree, 0)]
+    while stack:
+        node, depth = stack.pop()
+        del ancestors[depth:]
+        yield node, ancestors
+        ancestors.append(node)
+        cls = node.__class__
+        getter = _CHILD_GETTERS.get(cls) or _child_getter(cls)
+        _push_children(getter(node), stack, depth + 1)
+
+
+# Per node class: a getter returning its javalang attribute values as a tuple
+# (what `node.children` builds as a list, one getattr at a time)
+_CHILD_GETTERS = {}
+# Per value class: 1 for nodes, 2 for lists and tuples, 0 for leaves (str, None, set, ...)
+_VALUE_KINDS = {}
+
+
+def _child_getter(cls):
+    attrs = cls.attrs
+    if len(attrs) > 1:
+        getter = attrgetter(*attrs)
+    elif attrs:
+        single = attrgetter(attrs[0])
+        getter = lambda node: (single(node),)
+    else:
+        getter = lambda node: ()
+    _CHILD_GETTERS[cls] = getter
+    return getter
+
+
+def _value_kind(cls):
+    kind = 1 if issubclass(cls, Node) else 2 if issubclass(cls, (list, tuple)) else 0
+    _VALUE_KINDS[cls] = kind
+    return kind
+
+
+def _push_children(values, stack, depth):
+    # Pushes the nodes among `values` (nested in lists) so they pop in order
+    for value in reversed(values):
+        cls = value.__class__
+        kind = _VALUE_KINDS.get(cls)
+        if kind is None:
+            kind = _value_kind(cls)
+        if kind == 1:
+            stack.append((value, depth))
+        elif kind and value:
+            _push_children(value, stack, depth)
+
+
+def _build_dispatch(rules, memo):
+    # Maps node_type -> rules interested in it
+    by_type = {}
+    for rule in rules:
+        node_types = rule.node_types
+        if memo is not None and rule.scope is not None:
+            # Scoped rules also need to see where each of their scopes opens
+            node_types = node_types + (rule.scope,)
+        for node_type in node_types:
+            by_type.setdefault(node_type, []).append(rule)
+    return by_type
+
+
+def _rules_for(cls, by_type, cache):
+    rules = cache.get(cls)
+    if rules is None:
+        rules = []
+        for base in cls.__mro__:
+            for rule in by_type.get(base, ()):
+                if rule not in rules:
+                    rules.append(rule)
+        cache[cls] = rules
+    return rules
+
+
+def _close_scope(rule, tracker, memo):
+    if tracker.node is not None and not tracker.reused:
+        if tracker.key is not None:
+            memo.current[tracker.key] = rule.smells[tracker.start:]
+        memo.evaluated += 1
+    tracker.node = None
+
+
+def _visit_scoped(rule, tracker, node, ancestors, memo):
+    depth = len(ancestors)
+    if tracker.node is not None and not (node is tracker.node or (depth > tracker.depth and ancestors[tracker.depth] is tracker.node)):
+        _close_scope(rule, tracker, memo)
+
+    if tracker.node is None and isinstance(node, rule.scope):
+        tracker.node = node
+        tracker.depth = depth
+        tracker.key = memo.key_for(rule, node)
+        cached = memo.previous.get(tracker.key) if tracker.key is not None else None
+        tracker.reused = cached is not None
+        tracker.start = len(rule.smells)
+        if tracker.reused:
+            rule.smells.extend(cached)
+            memo.current[tracker.key] = cached
+            memo.reused += 1
+
+    if tracker.reused:
+        return
+    if isinstance(node, rule.node_types):
+        rule.visit(node, ancestors)
+
+
+def run_rules(tree, source_code_lines, rule_classes, memo=None, timings=None, metrics=None, origins=None):
+    """
+    Walks the AST once, sends each node to every rule registered for its type
+    and returns the smells of all rules in registration order. `tree` may be
+    None when none of the rules needs it (see Rule.needs_tree).
+    With a ScopeMemo, scoped rules skip declarations whose smells were
+    recorded by a previous run and record the smells of the rest.
+    With a `timings` dict, the seconds spent in each rule (visits plus finish)
+    are added to it under the rule's class name.
+    `metrics` is handed to every rule (see Rule) and, when a rule needs usage
+    facts, visited during the same walk to collect them.
+    With an `origins` list, the node each smell was recorded at is appended
+    to it, in the order of the returned smells (for smells found in `finish`,
+    the node the rule tied them to, else None).
+    """
+    found = [[] for _ in rule_classes]
+    for index, smell, node in _iter_rules(tree, source_code_lines, rule_classes, memo, timings, metrics):
+        found[index].append((smell, node))
+    located = [pair for pairs in found for pair in pairs]
+    if origins is not None:
+        origins.extend(node for _, node in located)
+    return [smell for smell, _ in located]
+
+
+def iter_rules(tree, source_code_lines, rule_classes, memo=None, timings=None, metrics=None):
+    """
+    Generator form of run_rules: yields (rule index, smell) as soon as each
+    smell is known. Smells a rule records while visiting come right after
+    the node that produced them; the rest when the rule finishes, after the
+    walk. Across rules the order is therefore the order of discovery.
+    """
+    for index, smell, _ in _iter_rules(tree, source_code_lines, rule_classes, memo, timings, metrics):
+        yield index, smell
+
+
+def _iter_rules(tree, source_code_lines, rule_classes, memo, timings, metrics):
+    # iter_rules, with the node each smell was recorded at
+    rules = [rule_class(metrics) for rule_class in rule_classes]
+    collectors = [metrics] if metrics is not None and any(rule.needs_usage for rule in rules) else []
+    by_type = _build_dispatch(rules + collectors, memo)
+    trackers = {}
+    if memo is not None:
+        trackers = {rule: _ScopeTracker() for rule in rules if rule.scope is not None}
+    spent = dict.fromkeys(rules + collectors, 0.0) if timings is not None else None
+    index = {rule: i for i, rule in enumerate(rules)}
+    emitted = dict.fromkeys(rules, 0)
+
+    if by_type and tree is not None:
+        cache = {}
+        for node, ancestors in walk(tree):
+            # Most nodes interest no rule: look them up without a call
+            interested = cache.get(node.__class__)
+            if interested is None:
+                interested = _rules_for(node.__class__, by_type, cache)
+            for rule in interested:
+                if spent is not None:
+                    start = time.perf_counter()
+                tracker = trackers.get(rule)
+                if tracker is None:
+                    rule.visit(node, ancestors)
+                else:
+                    _visit_scoped(rule, tracker, node, ancestors, memo)
+                if spent is not None:
+                    spent[rule] += time.perf_counter() - start
+                if rule is not metrics and len(rule.smells) > emitted[rule]:
+                    for smell in rule.smells[emitted[rule]:]:
+                        yield index[rule], smell, node
+                    emitted[rule] = len(rule.smells)
+
+    for rule, tracker in trackers.items():
+        _close_scope(rule, tracker, memo)
+    for collector in collectors:
+        if spent is not None:
+            name = type(collector).__name__
+            timings[name] = timings.get(name, 0.0) + spent[collector]
+
+    for rule in rules:
+        if spent is not None:
+            start = time.perf_counter()
+        smells = rule.finish(source_code_lines)
+        if spent is not None:
+            spent[rule] += time.perf_counter() - start
+            name = type(rule).__name__
+            timings[name] = timings.get(name, 0.0) + spent[rule]
+        # finish() returns everything the rule recorded, visits included
+        for smell in smells[emitted[rule]:]:
+            yield index[rule], smell, rule.origins.get(id(smell))
@@ -6,22 +6,64 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+import functools
+import gc
+import importlib
+import asyncio
+import json
+import time
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 import traceback
 
-# Safe Import with debug
-try:
-    from analyzer import analyze_code
-except ImportError as e:
-    import_error = str(e)
-    def analyze_code(code):
-        raise Exception(f"Import Error: {import_error}. Sys Path: {sys.path}")
+# Local modules without third-party dependencies
+from pool import AnalysisPool, PoolBusy, WorkerLost, POOL_SETTINGS, chunked
+from cache import ResultCache, cache_key
+import inputs
+import metrics
+
+# Heavy modules (javalang and the detectors, SQLite for jobs) are imported on
+# first use, so a cold start that serves no analysis only pays for FastAPI.
+# ANALYSIS_PREWARM=1 imports them and runs a warm-up analysis at startup
+# instead, for platforms where initialization time is cheaper than request time
+PREWARM = os.environ.get("ANALYSIS_PREWARM", "").lower() in ("1", "true", "yes", "on")
+
+def lazy(name):
+    # Safe Import with debug: a missing module shows up as a 500 with details
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        raise Exception(f"Import Error: {str(e)}. Sys Path: {sys.path}")
 
 app = FastAPI(title="Code Smell Detector API")
 
+# CPU-bound analysis runs here so the event loop keeps serving other requests.
+# Falls back to a thread when the platform cannot start worker processes.
+pool = AnalysisPool(warmup=lazy("analyzer").prewarm if PREWARM else None)
+# Warm instances answer resubmitted sources from here without parsing again
+cache = ResultCache()
+# Per-declaration smells of recent documents, keyed by the token returned to the client
+sessions = ResultCache(max_entries=int(os.environ.get("ANALYSIS_SESSIONS", 256)), directory="")
+
+# Background tasks are frozen between invocations, so queued jobs are worked
+# off while clients poll their status, for this many seconds per poll.
+# The queue lives in /tmp and only survives as long as the instance does.
+JOB_POLL_SECONDS = float(os.environ.get("ANALYSIS_JOB_POLL_SECONDS", 5))
+_job_queue = None
+
+def job_queue():
+    # Created on first use so a missing dependency or unwritable path shows up as a 500 with details
+    global _job_queue
+    if _job_queue is None:
+        jobs = lazy("jobs")
+        store = jobs.JobStore()
+        runner = jobs.JobRunner(store, pool, lazy("analyzer").analyze_sources, check=lambda source_code: check_source(source_code, max_lines=0),
+                           cache=cache, cache_key=cache_key, timeout=POOL_SETTINGS["BATCH_TIMEOUT"])
+        _job_queue = (store, runner)
+    return _job_queue
+
 # Enable CORS for everyone
 app.add_middleware(
     CORSMiddleware,
@@ -31,28 +73,398 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    if route is not None and request.method == "POST":
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=route.path)
+    return response
+
 class CodeRequest(BaseModel):
     sourceCode: str
 
+class FileEntry(BaseModel):
+    path: str
+    sourceCode: str
+
+class BatchRequest(BaseModel):
+    files: List[FileEntry]
+
+class IncrementalRequest(BaseModel):
+    sourceCode: str
+    previousToken: Optional[str] = None
+
+# Input budgets (Configurable through the environment)
+# The JSON endpoints keep the line limit; /api/analyze/large only applies the byte budget.
+# Vercel caps request bodies at 4.5 MB, so keep ANALYSIS_MAX_BYTES below that.
+MAX_LINES = int(os.environ.get("ANALYSIS_MAX_LINES", 500))
+MAX_BYTES = int(os.environ.get("ANALYSIS_MAX_BYTES", 2 * 1024 * 1024))
+LARGE_TIMEOUT = float(os.environ.get("ANALYSIS_LARGE_TIMEOUT", 120))
+
+def check_source(source_code: str, max_lines=MAX_LINES):
+    # Returns an error message for unacceptable input, None otherwise
+    return inputs.check_source(source_code, MAX_BYTES, max_lines)
+
+def requested(http_request: Request, name: str):
+    # Instrumentation is turned on by ?name=1 or an X-Analysis-Name: 1 header
+    value = http_request.query_params.get(name) or http_request.headers.get(f"x-analysis-{name}")
+    return value is not None and value.lower() in ("1", "true", "yes", "on")
+
+def requested_format(http_request: Request):
+    # ?format=columnar|msgpack or an Accept: application/msgpack header; None for the usual JSON shape
+    name = http_request.query_params.get("format")
+    if name is None and "application/msgpack" in http_request.headers.get("accept", ""):
+        name = "msgpack"
+    if name in (None, "json"):
+        return None
+    if name not in ("columnar", "msgpack"):
+        raise HTTPException(status_code=400, detail="Unknown format (expected json, columnar or msgpack)")
+    if name == "msgpack" and lazy("columnar").msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack output is not available on this server")
+    return name
+
+def columnar_response(name: str, reports, extra):
+    # The reports as one SmellTable, with the other response fields (summary, paging) beside it
+    columnar = lazy("columnar")
+    table = columnar.table_of(reports)
+    if name == "msgpack":
+        return Response(table.to_msgpack(extra), media_type=columnar.MSGPACK_MEDIA_TYPE)
+    return dict(table.as_dict(), **extra)
+
 @app.post("/api/analyze")
 @app.post("/analyze")
-async def analyze_endpoint(request: CodeRequest):
+async def analyze_endpoint(request: CodeRequest, http_request: Request):
     try:
-        if not request.sourceCode.strip():
-            raise HTTPException(status_code=400, detail="Source code cannot be empty")
-        
-        if len(request.sourceCode.splitlines()) > 500:
-            raise HTTPException(status_code=400, detail="Source code exceeds 500 lines limit")
-
-        result = analyze_code(request.sourceCode)
-        return result
+        problem = check_source(request.sourceCode)
+        if problem:
+            raise HTTPException(status_code=400, detail=problem)
+        return await analyze_source(request.sourceCode, http_request)
+    except HTTPException:
+        raise
     except Exception as e:
         # Return 500 with the specific error to show in Frontend
         return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
 
+async def read_body(http_request: Request, limit: int, what="Source code"):
+    # Read as it arrives so an oversized upload is refused after `limit`
+    # bytes instead of being buffered whole
+    declared = http_request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=413, detail=f"{what} exceeds {limit} bytes limit")
+    chunks = []
+    received = 0
+    async for chunk in http_request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail=f"{what} exceeds {limit} bytes limit")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def is_json(http_request: Request):
+    return http_request.headers.get("content-type", "").startswith("application/json")
+
+async def read_source(http_request: Request):
+    # Raw body (text/plain, or JSON with sourceCode)
+    body = await read_body(http_request, MAX_BYTES)
+
+    if is_json(http_request):
+        try:
+            source_code = json.loads(body)["sourceCode"]
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Expected a JSON object with sourceCode")
+        if not isinstance(source_code, str):
+            raise HTTPException(status_code=400, detail="sourceCode must be a string")
+    else:
+        source_code = body.decode("utf-8", errors="replace")
+    del body
+
+    problem = check_source(source_code, max_lines=0)
+    if problem:
+        raise HTTPException(status_code=400, detail=problem)
+    return source_code
+
+@app.post("/api/analyze/large")
+@app.post("/analyze/large")
+async def analyze_large_endpoint(http_request: Request):
+    try:
+        source_code = await read_source(http_request)
+        return await analyze_source(source_code, http_request, timeout=LARGE_TIMEOUT)
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
+
+# Streamed analyses step through the detectors in a thread of this process
+# (results cannot stream out of the pool); at most STREAMS run at once
+STREAMS = int(os.environ.get("ANALYSIS_STREAMS", 2))
+stream_slots = asyncio.Semaphore(STREAMS)
+
+def sse_event(event: str, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/analyze/stream")
+@app.post("/analyze/stream")
+async def analyze_stream_endpoint(http_request: Request):
+    # Same input as /api/analyze/large; answers with Server-Sent Events:
+    # "parsed", one "smell" per smell as it is found, then "summary" (or "error")
+    try:
+        source_code = await read_source(http_request)
+        key = cache_key(source_code)
+        cached = cache.get(key)
+        if cached is None and stream_slots.locked():
+            raise HTTPException(status_code=503, detail="Too many streamed analyses in progress", headers={"Retry-After": "1"})
+        return StreamingResponse(stream_events(source_code, key, cached), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
+
+async def stream_events(source_code: str, key: str, cached):
+    if cached is not None:
+        for event, data in lazy("analyzer").replay_stream(cached):
+            yield sse_event(event, data)
+        return
+    async with stream_slots:
+        events = lazy("analyzer").analyze_stream(source_code)
+        try:
+            while True:
+                item = await asyncio.to_thread(next, events, None)
+                if item is None:
+                    break
+                event, data = item
+                if event == "report":
+                    cache.put(key, data)
+                    continue
+                if event == "error":
+                    cache.put(key, data)
+                yield sse_event(event, data)
+        except Exception as e:
+            # The response has started; the failure can only be reported in the stream
+            yield sse_event("error", {"error": f"Runtime Error: {str(e)}"})
+
+async def analyze_source(source_code: str, http_request: Request, timeout=None):
+    profile = requested(http_request, "profile")
+    instrumented = profile or requested(http_request, "timings")
+
+    key = cache_key(source_code)
+    # Instrumented requests always measure a real analysis
+    result = None if instrumented else cache.get(key)
+    timings = None
+    if result is None:
+        submitted = time.perf_counter()
+        result = await run_in_pool(
+            functools.partial(lazy("analyzer").analyze_code, timings="rules" if instrumented else "phases", profile=profile),
+            source_code, timeout=timeout)
+        timings = result.pop("timings")
+        timings["queue"] = max(0.0, time.perf_counter() - submitted - timings["total"])
+        cache.put(key, result)
+
+    start = time.perf_counter()
+    body = json.dumps(result)
+    if timings is not None:
+        timings["serialize"] = time.perf_counter() - start
+        metrics.observe_timings(timings)
+        if instrumented:
+            body = json.dumps(dict(result, timings=timings))
+    return Response(body, media_type="application/json")
+
+@app.post("/api/analyze/batch")
+@app.post("/analyze/batch")
+async def analyze_batch_endpoint(request: BatchRequest, http_request: Request):
+    try:
+        if not request.files:
+            raise HTTPException(status_code=400, detail="Batch must contain at least one file")
+        wire_format = requested_format(http_request)
+
+        # Invalid files are reported individually instead of failing the whole batch
+        reports = [None] * len(request.files)
+        pending = []
+        for i, entry in enumerate(request.files):
+            problem = check_source(entry.sourceCode)
+            if problem:
+                reports[i] = inputs.error_report(entry.path, entry.sourceCode, problem)
+                continue
+
+            key = cache_key(entry.sourceCode)
+            cached = cache.get(key)
+            if cached is not None:
+                reports[i] = dict(cached, path=entry.path)
+            else:
+                pending.append((i, entry, key))
+
+        if pending:
+            chunks = chunked([e.sourceCode for _, e, _ in pending], max(pool.workers, 1) * 2)
+            results = await run_in_pool(lazy("analyzer").analyze_sources, chunks, many=True, timeout=pool.batch_timeout(len(pending)))
+            results = [report for chunk in results for report in chunk]
+            for (i, entry, key), report in zip(pending, results):
+                cache.put(key, report)
+                reports[i] = dict(report, path=entry.path)
+
+        if wire_format:
+            return columnar_response(wire_format, reports, {"summary": lazy("analyzer").summarize_reports(reports)})
+        return {
+            "summary": lazy("analyzer").summarize_reports(reports),
+            "files": reports
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
+
+@app.post("/api/analyze/incremental")
+@app.post("/analyze/incremental")
+async def analyze_incremental_endpoint(request: IncrementalRequest):
+    try:
+        problem = check_source(request.sourceCode)
+        if problem:
+            raise HTTPException(status_code=400, detail=problem)
+
+        # An unknown or expired token (e.g. a cold instance) just means a full analysis
+        previous = sessions.get(request.previousToken) if request.previousToken else None
+        report, entries = await run_in_pool(functools.partial(lazy("analyzer").analyze_incremental, previous=previous), request.sourceCode)
+
+        token = cache_key(request.sourceCode)
+        sessions.put(token, entries)
+        report["token"] = token
+        report["incremental"]["previousFound"] = previous is not None
+        return report
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
+
+async def run_in_pool(fn, arg, many=False, timeout=None):
+    try:
+        if many:
+            return await pool.run_many(fn, arg, timeout=timeout)
+        return await pool.run(fn, arg, timeout=timeout)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+    except MemoryError:
+        # Raised inside a worker capped by ANALYSIS_WORKER_MEMORY_MB
+        raise HTTPException(status_code=413, detail="Analysis exceeded the worker memory limit")
+    except WorkerLost as e:
+        # The pool starts new workers for the next request
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+@app.post("/api/jobs")
+@app.post("/jobs")
+async def submit_job_endpoint(http_request: Request):
+    try:
+        # A tar archive of the repository (any compression), or JSON {"files": [{path, sourceCode}]}
+        body = await read_body(http_request, lazy("jobs").JOB_SETTINGS["MAX_BYTES"], "Job upload")
+        # Unpacking an upload and the SQLite calls run in threads so they do not stall the event loop
+        files = await asyncio.to_thread(parse_job_files, body, is_json(http_request))
+        if not files:
+            raise HTTPException(status_code=400, detail="Job must contain at least one .java file")
+        store, _ = job_queue()
+        job_id = await asyncio.to_thread(store.submit, files)
+        return JSONResponse(status_code=202, content=await asyncio.to_thread(store.status, job_id), headers={"Location": f"/api/jobs/{job_id}"})
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
+
+def parse_job_files(body: bytes, json_body: bool):
+    if json_body:
+        try:
+            request = BatchRequest(**json.loads(body))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Expected a JSON object with files")
+        return [(entry.path, entry.sourceCode) for entry in request.files]
+    import tarfile
+    try:
+        return list(lazy("jobs").tar_sources(body))
+    except (tarfile.TarError, EOFError, OSError):
+        raise HTTPException(status_code=400, detail="Expected a tar archive or a JSON object with files")
+
+@app.get("/api/jobs/{job_id}")
+@app.get("/jobs/{job_id}")
+async def job_status_endpoint(job_id: str):
+    try:
+        store, runner = job_queue()
+        status = await asyncio.to_thread(store.status, job_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        if status["status"] != "done":
+            await runner.run_for(JOB_POLL_SECONDS)
+            status = await asyncio.to_thread(store.status, job_id)
+        return status
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
+
+@app.get("/api/jobs/{job_id}/results")
+@app.get("/jobs/{job_id}/results")
+def job_results_endpoint(job_id: str, http_request: Request, offset: int = 0, limit: int = 100):
+    try:
+        store, _ = job_queue()
+        status = store.status(job_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        wire_format = requested_format(http_request)
+        offset = max(offset, 0)
+        limit = min(max(limit, 1), 1000)
+        # Reports are stored as JSON and passed through without decoding
+        reports = store.results(job_id, offset, limit)
+        following = offset + len(reports)
+        page = {
+            "id": job_id,
+            "status": status["status"],
+            "offset": offset,
+            "limit": limit,
+            "next": following if following < status["progress"]["done"] else None
+        }
+        if wire_format:
+            return columnar_response(wire_format, [json.loads(report) for report in reports], page)
+        body = json.dumps(page)[:-1] + ', "files": [' + ",".join(reports) + "]}"
+        return Response(body, media_type="application/json")
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
+
+@app.delete("/api/jobs/{job_id}")
+@app.delete("/jobs/{job_id}")
+def delete_job_endpoint(job_id: str):
+    try:
+        store, _ = job_queue()
+        if not store.delete(job_id):
+            raise HTTPException(status_code=404, detail="Unknown job")
+        return {"id": job_id, "status": "deleted"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": f"Runtime Error: {str(e)}", "trace": traceback.format_exc()})
+
+@app.on_event("shutdown")
+def shutdown_pool():
+    pool.shutdown()
+
+@app.get("/metrics")
+@app.get("/api/metrics")
+def metrics_endpoint():
+    stats = cache.stats()
+    text = metrics.render(extra=[
+        ("analysis_cache_hits_total", "Reports served from the memory cache.", stats["hits"]),
+        ("analysis_cache_disk_hits_total", "Reports served from the disk cache.", stats["diskHits"]),
+        ("analysis_cache_misses_total", "Cache lookups that needed an analysis.", stats["misses"]),
+    ])
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache")
+def cache_stats():
+    return cache.stats()
+
 @app.get("/api")
 def api_root():
-    return {"status": "ok", "message": "API is reachable. Modules loaded."}
+    return {"status": "ok", "message": "API is reachable.", "analyzerLoaded": "analyzer" in sys.modules}
 
 @app.options("/{path:path}")
 async def options_handler(path: str):
@@ -69,3 +481,12 @@ async def catch_all(request: Request, path_name: str):
             "url": str(request.url)
         }
     )
+
+if PREWARM:
+    # This process runs streamed analyses (and all of them without worker processes);
+    # the workers run the same warm-up in their initializer
+    lazy("analyzer").prewarm()
+    pool.prewarm()
+# Everything created so far lives as long as the instance: keep it out of
+# garbage collection, or the first request pays for a full collection of it
+gc.freeze()
@@ -0,0 +1,55 @@
+"""
+Cheap checks on submitted sources.
+
+Nothing here imports the parser or the detectors, so the API can reject
+empty or oversized input (and report its line count) before it loads the
+analyzer.
+"""
+
+
+# Line boundaries of str.splitlines() besides "\n" and "\r" ("\r\n" counts once)
+_OTHER_BREAKS = "\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_BREAKS = frozenset("\n\r" + _OTHER_BREAKS)
+
+
+def count_lines(source_code: str):
+    """
+    Number of lines `splitlines()` would report, without materializing the
+    list (cheap enough for multi-megabyte inputs).
+    """
+    if not source_code:
+        return 0
+    breaks = source_code.count("\n") + source_code.count("\r") - source_code.count("\r\n")
+    breaks += sum(source_code.count(c) for c in _OTHER_BREAKS)
+    return breaks + (0 if source_code[-1] in _BREAKS else 1)
+
+
+def utf8_size(source_code: str):
+    # Bytes of the UTF-8 encoding; only encodes when some character needs more than one
+    if source_code.isascii():
+        return len(source_code)
+    return len(source_code.encode("utf-8", "surrogatepass"))
+
+
+def check_empty(source_code):
+    return "Source code cannot be empty" if not source_code or source_code.isspace() else None
+
+
+def check_source(source_code: str, max_bytes, max_lines=0):
+    # Returns an error message for unacceptable input, None otherwise
+    # (no strip()/splitlines() copies, these run before every analysis)
+    problem = check_empty(source_code)
+    if problem:
+        return problem
+    # Every character takes at least one byte, so long inputs are rejected without encoding
+    if len(source_code) > max_bytes or utf8_size(source_code) > max_bytes:
+        return f"Source code exceeds {max_bytes} bytes limit"
+    # Limit check (academic constraint)
+    if max_lines and count_lines(source_code) > max_lines:
+        return f"Source code exceeds {max_lines} lines limit"
+    return None
+
+
+def error_report(path, source_code, message):
+    # The report of a file that was not analyzed
+    return {"path": path, "error": message, "summary": {"totalLines": count_lines(source_code or ""), "totalSmells": 0}, "smells": []}
@@ -0,0 +1,84 @@
+import bisect
+import threading
+
+# Seconds; covers cache hits (sub-millisecond) up to near the request timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Minimal Prometheus-style histogram with labels, rendered in the text
+    exposition format by `render()`.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in sorted(self._series.items())]
+        for key, counts, total in items:
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(labels + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = []
+
+REQUEST_SECONDS = Histogram("analysis_request_seconds", "Wall time of analysis requests.", ("endpoint",))
+PHASE_SECONDS = Histogram("analysis_phase_seconds", "Time spent per analysis phase.", ("phase",))
+RULE_SECONDS = Histogram("analysis_rule_seconds", "Time spent per smell rule (instrumented requests only).", ("rule",))
+
+
+def observe_timings(timings):
+    """Records the phases (and rules, when present) of one analysis report's timings."""
+    for phase in ("parse", "detect", "queue", "serialize"):
+        if phase in timings:
+            PHASE_SECONDS.observe(timings[phase], phase=phase)
+    for rule, seconds in timings.get("rules", {}).items():
+        RULE_SECONDS.observe(seconds, rule=rule)
+
+
+def render(extra=()):
+    """
+    Text exposition of every registered histogram plus `extra` counters,
+    given as (name, documentation, value) tuples.
+    """
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.render())
+    for name, documentation, value in extra:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
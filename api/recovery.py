@@ -0,0 +1,316 @@
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import javalang
+from javalang.tokenizer import JavaTokenizer, Separator, Modifier, Keyword, Identifier, String, Position
+from javalang.tree import CompilationUnit, EnumBody
+
+# Recovery settings (Configurable through the environment)
+# Files with at least PARALLEL_LINES lines parse their regions in WORKERS processes;
+# ANALYSIS_RECOVERY_WORKERS=1 always parses in the calling process
+RECOVERY_SETTINGS = {
+    "PARALLEL_LINES": int(os.environ.get("ANALYSIS_RECOVERY_PARALLEL_LINES", 5000)),
+    "WORKERS": int(os.environ.get("ANALYSIS_RECOVERY_WORKERS", os.cpu_count() or 1)),
+}
+
+TYPE_KEYWORDS = ("class", "interface", "enum")
+# Tokens that only follow a block closing brace when the declaration goes on
+CONTINUATIONS = (";", ",", ")", ".")
+_LEXER_LINE = re.compile(r", line (\d+):")
+
+# Member regions are parsed inside a stand-in type of the same kind; the
+# member's own tokens keep their positions in the original file
+_WRAPPERS = {
+    "class": "class __Region {",
+    "interface": "interface __Region {",
+    "annotation": "@interface __Region {",
+    "enum": "enum __Region {",
+    "enum-members": "enum __Region { ;",
+}
+
+
+def error_location(error):
+    # javalang tokens carry a position; EndOfInput may not
+    position = getattr(error.at, "position", None)
+    return f"at line {position.line}" if position else "at end of input"
+
+
+def describe_error(error):
+    if isinstance(error, javalang.parser.JavaSyntaxError):
+        return f"Syntax Error: {error.description} {error_location(error)}"
+    return f"Parsing Error: {str(error)}"
+
+
+def _is(token, *values):
+    return isinstance(token, Separator) and token.value in values
+
+
+def lenient_tokens(source_code):
+    """
+    Tokenizes without stopping at lexical errors. Returns (tokens, errors)
+    where errors are (line, message). A string literal left open mid-edit
+    would swallow the rest of the file, so the text after its line is
+    tokenized again on its own.
+    """
+    tokens = []
+    errors = []
+    line_offset = 0
+    remaining = source_code
+    while True:
+        tokenizer = JavaTokenizer(remaining, ignore_errors=True)
+        restart = None
+        for token in tokenizer.tokenize():
+            if line_offset:
+                token.position = Position(token.position.line + line_offset, token.position.column)
+            if isinstance(token, String) and "\n" in token.value and not token.value.startswith('"""'):
+                restart = token.position.line
+                errors.append((restart, f"Lexical Error: unterminated string literal at line {restart}"))
+                break
+            tokens.append(token)
+        for error in tokenizer.errors:
+            match = _LEXER_LINE.search(str(error))
+            line = int(match.group(1)) + line_offset if match else 0
+            errors.append((line, f"Lexical Error: {str(error).split(':', 1)[0]}"))
+        if restart is None:
+            return tokens, errors
+        # Continue with the line after the broken literal
+        lines = remaining.split("\n", restart - line_offset)
+        if len(lines) <= restart - line_offset:
+            return tokens, errors
+        remaining = lines[-1]
+        line_offset = restart
+
+
+def _starts_declaration(token):
+    return (isinstance(token, Modifier) or _is(token, "@")
+            or (isinstance(token, Keyword) and token.value in TYPE_KEYWORDS + ("void",)))
+
+
+def split_segments(tokens, start, stop):
+    """
+    Splits tokens[start:stop] into declarations at nesting depth 0. Returns
+    ([(first, last, brace)], end): `brace` is the index of the first "{" of
+    the declaration (None for e.g. fields), `end` where a "}" closing the
+    enclosing body stopped the split.
+
+    A declaration ends at ";" or at the "}" that balances its first "{".
+    When braces do not balance (typical mid-edit), a line starting at or
+    left of the declaration's first column with a modifier, annotation or
+    type keyword starts the next declaration anyway; the same goes for
+    package and import statements missing their ";".
+    """
+    segments = []
+    first = None
+    i = start
+    while i < stop:
+        token = tokens[i]
+        if first is None:
+            if _is(token, "}"):
+                return segments, i
+            if _is(token, ";"):
+                i += 1
+                continue
+            first, indent, depth, parens, brace = i, token.position.column, 0, 0, None
+            statement = isinstance(token, Keyword) and token.value in ("package", "import")
+        elif ((depth > 0 or statement) and token.position.line > tokens[i - 1].position.line
+              and token.position.column <= indent and _starts_declaration(token)):
+            segments.append((first, i - 1, brace))
+            first = None
+            continue
+
+        if isinstance(token, Separator):
+            value = token.value
+            if value == "(":
+                parens += 1
+            elif value == ")":
+                parens -= 1
+            elif value == "{":
+                if brace is None:
+                    brace = i
+                depth += 1
+            elif value == "}":
+                depth -= 1
+                if depth < 0:
+                    # Closes the enclosing body in the middle of a declaration
+                    segments.append((first, i - 1, brace))
+                    return segments, i
+                if depth == 0 and parens <= 0 and not (i + 1 < stop and _is(tokens[i + 1], *CONTINUATIONS)):
+                    segments.append((first, i, brace))
+                    first = None
+            elif value == ";" and depth == 0 and parens <= 0:
+                segments.append((first, i, brace))
+                first = None
+        i += 1
+    if first is not None:
+        segments.append((first, stop - 1, brace))
+    return segments, stop
+
+
+def _type_kind(tokens, first, brace):
+    for i in range(first, brace):
+        token = tokens[i]
+        if isinstance(token, Keyword) and token.value in TYPE_KEYWORDS:
+            if token.value == "interface" and i > first and _is(tokens[i - 1], "@"):
+                return "annotation"
+            return token.value
+    return None
+
+
+def _member_name(tokens, first, last):
+    # The identifier before the first "(" names a method; otherwise the last
+    # identifier before "=" or ";" names a field
+    name = None
+    for i in range(first, last + 1):
+        token = tokens[i]
+        if _is(token, "("):
+            return f"{name}()" if name else "member"
+        if _is(token, "=", ";", "{"):
+            break
+        if isinstance(token, Identifier):
+            name = token.value
+    return name or "member"
+
+
+def _closing(token):
+    # Closes a region; errors at the missing end are reported at its last line
+    return [Separator("}", token.position)]
+
+
+def _wrapper_tokens(kind):
+    return list(javalang.tokenizer.tokenize(_WRAPPERS[kind]))
+
+
+def _parse_job(job):
+    """Parses one region's tokens; returns ("ok", compilation unit) or ("error", message)."""
+    try:
+        return "ok", javalang.parser.Parser(job).parse()
+    except javalang.parser.JavaSyntaxError as e:
+        if getattr(e.at, "position", None) is None and job[-1].position:
+            # Ran out of tokens: the region ends early, at its last line
+            return "error", f"Syntax Error: {e.description} at line {job[-1].position.line}"
+        return "error", describe_error(e)
+    except Exception as e:
+        return "error", describe_error(e)
+
+
+def _parse_all(jobs, workers):
+    # Only the top-level process fans out: inside an AnalysisPool, scan.py or
+    # batch worker a nested pool would multiply the processes those bound
+    if workers > 1 and len(jobs) > 1 and multiprocessing.parent_process() is None:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=multiprocessing.get_context("spawn")) as pool:
+                return list(pool.map(_parse_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+        except (OSError, NotImplementedError):
+            # Platforms without multiprocessing support (e.g. serverless sandboxes)
+            pass
+    return [_parse_job(job) for job in jobs]
+
+
+def _enum_constants(tokens, first, last):
+    # An enum body opens with its constants ("A, B(1), C { ... };"); a region
+    # there starting with a name followed by "(" is a constructor instead
+    # when it ends with its own block rather than with ";" or ","
+    if not isinstance(tokens[first], Identifier) or first == last:
+        return False
+    following = tokens[first + 1]
+    if _is(following, "("):
+        return not _is(tokens[last], "}")
+    return _is(following, ",", ";", "{")
+
+
+def _attach(declaration, wrapper):
+    # Moves the members parsed in a stand-in type into the real declaration
+    body = wrapper.body
+    if isinstance(declaration.body, EnumBody):
+        if isinstance(body, EnumBody):
+            declaration.body.constants.extend(body.constants)
+            declaration.body.declarations.extend(body.declarations)
+    elif not isinstance(body, EnumBody):
+        declaration.body.extend(body)
+
+
+def _workers(source_code, workers):
+    if workers is not None:
+        return workers
+    if source_code.count("\n") < RECOVERY_SETTINGS["PARALLEL_LINES"]:
+        return 1
+    return RECOVERY_SETTINGS["WORKERS"]
+
+
+def recover_tree(source_code, workers=None):
+    """
+    Parses what can be parsed of a source with syntax errors.
+    Top-level declarations are parsed one by one; a type that fails as a
+    whole is split into its members, each parsed on its own inside a
+    stand-in type, and the members that parse are attached to the real
+    type. Regions are parsed in worker processes for large files.
+
+    Returns (tree, tokens, errors): tree is a CompilationUnit of the
+    recovered types (None when nothing could be recovered) and errors has a
+    {"location", "region", "error"} entry for every region left out.
+    """
+    tokens, lexical = lenient_tokens(source_code)
+    if not tokens:
+        return None, tokens, []
+    workers = _workers(source_code, workers)
+    errors = []
+
+    def failed(label, first, last, message):
+        start, end = tokens[first].position.line, tokens[last].position.line
+        errors.append((start, {"location": f"Lines {start}-{end}", "region": label, "error": message}))
+
+    def lexical_error(first, last):
+        start, end = tokens[first].position.line, tokens[last].position.line
+        return next((message for line, message in lexical if start <= line <= end), None)
+
+    # 1. Top-level declarations, each as a compilation unit of its own
+    regions = []
+    for first, last, brace in split_segments(tokens, 0, len(tokens))[0]:
+        kind = _type_kind(tokens, first, brace) if brace is not None else None
+        label = f"{'@interface' if kind == 'annotation' else kind} {_member_name(tokens, first, brace)}" if kind else "declaration"
+        job = tokens[first:last + 1] + ([] if _is(tokens[last], "}", ";") else _closing(tokens[last]))
+        regions.append((label, first, last, brace, kind, job))
+    results = iter(_parse_all([r[5] for r in regions if not lexical_error(r[1], r[2])], workers))
+
+    # 2. Members of the types that failed as a whole
+    types = []
+    members = []
+    for label, first, last, brace, kind, job in regions:
+        message = lexical_error(first, last)
+        if message is None:
+            status, result = next(results)
+            if status == "ok":
+                types.extend(result.types)
+                continue
+            message = result
+        header = _parse_job(tokens[first:brace + 1] + _closing(tokens[brace])) if kind else ("error", message)
+        if header[0] != "ok" or not header[1].types:
+            failed(label, first, last, message)
+            continue
+        declaration = header[1].types[0]
+        types.append(declaration)
+        body_end = last if _is(tokens[last], "}") else last + 1
+        for index, (member_first, member_last, _) in enumerate(split_segments(tokens, brace + 1, body_end)[0]):
+            member_label = f"{label} > {_member_name(tokens, member_first, member_last)}"
+            member_message = lexical_error(member_first, member_last)
+            if member_message:
+                failed(member_label, member_first, member_last, member_message)
+                continue
+            wrapper = kind
+            if kind == "enum" and not (index == 0 and _enum_constants(tokens, member_first, member_last)):
+                wrapper = "enum-members"
+            members.append((member_label, member_first, member_last, declaration,
+                            _wrapper_tokens(wrapper) + tokens[member_first:member_last + 1] + _closing(tokens[member_last])))
+
+    for (label, first, last, declaration, _), (status, result) in zip(members, _parse_all([m[-1] for m in members], workers)):
+        if status == "ok":
+            _attach(declaration, result.types[0])
+        else:
+            failed(label, first, last, result)
+
+    errors = [entry for _, entry in sorted(errors, key=lambda e: e[0])]
+    if not types:
+        return None, tokens, errors
+    return CompilationUnit(package=None, imports=[], types=types), tokens, errors
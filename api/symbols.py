@@ -0,0 +1,358 @@
+import collections
+import json
+import os
+import tempfile
+
+from javalang.tree import (TypeDeclaration, ClassDeclaration, InterfaceDeclaration, MethodDeclaration, FieldDeclaration,
+                           MethodInvocation, SuperMethodInvocation, MethodReference, MemberReference, ClassCreator,
+                           ThrowStatement)
+from engine import walk
+from smells import THRESHOLDS
+
+# Bump when the layout of collected symbols changes; older index files are discarded
+SYMBOLS_VERSION = 1
+
+ACCESS_MODIFIERS = ("public", "protected", "private")
+REFUSAL = "UnsupportedOperationException"
+
+
+def _type_name(node_type):
+    return node_type.name if hasattr(node_type, "name") else "Unknown"
+
+
+def _supertypes(node):
+    names = []
+    extends = getattr(node, "extends", None)
+    if extends is not None:
+        # Classes extend one type, interfaces a list of them
+        names.extend(_type_name(t) for t in (extends if isinstance(extends, list) else [extends]))
+    names.extend(_type_name(t) for t in getattr(node, "implements", None) or ())
+    return names
+
+
+def _refuses(method):
+    # Declares or unconditionally throws UnsupportedOperationException
+    if method.throws and REFUSAL in method.throws:
+        return True
+    if method.body and len(method.body) == 1 and isinstance(method.body[0], ThrowStatement):
+        thrown = method.body[0].expression
+        return isinstance(thrown, ClassCreator) and thrown.type.name == REFUSAL
+    return False
+
+
+def _enclosing(ancestors):
+    # Innermost (type declaration, method name) around a node; the type is None
+    # inside anonymous classes, whose members belong to no named declaration
+    method = None
+    for ancestor in reversed(ancestors):
+        if isinstance(ancestor, MethodDeclaration):
+            if method is None:
+                method = ancestor.name
+        elif isinstance(ancestor, ClassCreator) and ancestor.body is not None:
+            return None, method
+        elif isinstance(ancestor, TypeDeclaration):
+            return ancestor, method
+    return None, method
+
+
+def collect_symbols(tree):
+    """
+    Declarations and references of one compilation unit, gathered in a single
+    walk: every named type with its supertypes, fields and methods, the names
+    each type references from its methods, and how often each method name is
+    called. The result is plain JSON data so it can be stored in an index.
+    """
+    types = {}
+    calls = collections.Counter()
+
+    for node, ancestors in walk(tree):
+        if isinstance(node, TypeDeclaration):
+            owner, _ = _enclosing(ancestors)
+            if owner is None and any(isinstance(a, ClassCreator) for a in ancestors):
+                continue
+            types[id(node)] = {
+                "name": node.name,
+                "kind": "interface" if isinstance(node, InterfaceDeclaration) else "class" if isinstance(node, ClassDeclaration) else "other",
+                "line": node.position.line if node.position else None,
+                "supertypes": _supertypes(node),
+                "fields": [],
+                "methods": [],
+                "references": collections.defaultdict(set)
+            }
+        elif isinstance(node, FieldDeclaration):
+            owner, method = _enclosing(ancestors)
+            if owner is not None and method is None and id(owner) in types:
+                for declarator in node.declarators:
+                    types[id(owner)]["fields"].append({
+                        "name": declarator.name,
+                        "modifiers": sorted(node.modifiers),
+                        "line": node.position.line if node.position else None
+                    })
+        elif isinstance(node, MethodDeclaration):
+            owner, _ = _enclosing(ancestors)
+            if owner is not None and id(owner) in types:
+                types[id(owner)]["methods"].append({
+                    "name": node.name,
+                    "arity": len(node.parameters),
+                    "modifiers": sorted(node.modifiers),
+                    "params": [_type_name(p.type) for p in node.parameters],
+                    "override": any(a.name == "Override" for a in node.annotations),
+                    "refuses": _refuses(node),
+                    "line": node.position.line if node.position else None
+                })
+        elif isinstance(node, (MethodInvocation, SuperMethodInvocation)):
+            calls[node.member] += 1
+        elif isinstance(node, MethodReference):
+            calls[node.method.member] += 1
+
+        if isinstance(node, MemberReference) and not node.qualifier:
+            owner, method = _enclosing(ancestors)
+            if owner is not None and method is not None and id(owner) in types:
+                types[id(owner)]["references"][node.member].add(method)
+
+    classes = []
+    for entry in types.values():
+        entry["references"] = {member: sorted(methods) for member, methods in entry["references"].items()}
+        classes.append(entry)
+    return {"classes": classes, "calls": dict(calls)}
+
+
+def _adjust(table, key, item, delta):
+    # Counters that reach zero are dropped so lookups never see stale keys
+    counter = table[key]
+    counter[item] += delta
+    if counter[item] <= 0:
+        del counter[item]
+        if not counter:
+            del table[key]
+
+
+def _is_accessor(method_name):
+    return method_name.startswith("get") or method_name.startswith("set")
+
+
+class ProjectIndex:
+    """
+    Symbols of every analyzed file of a project, kept up to date one file at
+    a time. `update(path, symbols)` replaces what was known about a file and
+    adjusts the project-wide lookups (types by name, subtypes, call counts,
+    parameter groups) by that file's contribution only, so cross-file rules
+    answer questions such as "is this method called anywhere?" with a lookup.
+
+    Types are matched by simple name, without import resolution.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self._types = collections.defaultdict(list)
+        self._subtypes = collections.defaultdict(collections.Counter)
+        self._calls = collections.Counter()
+        self._param_groups = collections.defaultdict(collections.Counter)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, path):
+        return path in self.files
+
+    def _apply(self, path, symbols, sign):
+        # Adds (sign=1) or withdraws (sign=-1) one file's share of the lookups
+        for entry in symbols["classes"]:
+            if sign > 0:
+                self._types[entry["name"]].append((path, entry))
+            else:
+                remaining = [(p, e) for p, e in self._types[entry["name"]] if p != path]
+                if remaining:
+                    self._types[entry["name"]] = remaining
+                else:
+                    del self._types[entry["name"]]
+            for parent in entry["supertypes"]:
+                _adjust(self._subtypes, parent, entry["name"], sign)
+            for method in entry["methods"]:
+                if len(method["params"]) >= THRESHOLDS["DATA_CLUMP_FIELDS"]:
+                    _adjust(self._param_groups, tuple(sorted(method["params"])), path, sign)
+        for name, count in symbols["calls"].items():
+            self._calls[name] += count * sign
+            if self._calls[name] <= 0:
+                del self._calls[name]
+
+    def update(self, path, symbols):
+        self.remove(path)
+        self.files[path] = symbols
+        self._apply(path, symbols, 1)
+
+    def remove(self, path):
+        symbols = self.files.pop(path, None)
+        if symbols is not None:
+            self._apply(path, symbols, -1)
+
+    def prune(self):
+        """Forgets files that no longer exist on disk; returns how many."""
+        missing = [path for path in self.files if not os.path.exists(path)]
+        for path in missing:
+            self.remove(path)
+        return len(missing)
+
+    # Lookups -----------------------------------------------------------------
+
+    def types(self, name):
+        """(path, type entry) pairs declaring a type with this simple name."""
+        return self._types.get(name, [])
+
+    def call_count(self, method_name):
+        return self._calls.get(method_name, 0)
+
+    def ancestors(self, name):
+        """Known supertypes of `name`, nearest first, as (path, type entry) pairs."""
+        found = []
+        seen = {name}
+        queue = collections.deque([name])
+        while queue:
+            for _, entry in self.types(queue.popleft()):
+                for parent in entry["supertypes"]:
+                    if parent not in seen:
+                        seen.add(parent)
+                        queue.append(parent)
+                        found.extend(self.types(parent))
+        return found
+
+    def descendants(self, name):
+        """Names of every known type that inherits from `name`, directly or not."""
+        found = []
+        seen = {name}
+        queue = collections.deque([name])
+        while queue:
+            for child in self._subtypes.get(queue.popleft(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    found.append(child)
+                    queue.append(child)
+        return found
+
+    # Cross-file smells ----------------------------------------------------------
+
+    def smells(self):
+        """
+        Smells that need more than one file to be seen, each with the `path`
+        it belongs to. Findings visible inside a single file are left to the
+        per-file rules so nothing is reported twice.
+        """
+        found = []
+        for path, symbols in sorted(self.files.items()):
+            for entry in symbols["classes"]:
+                found.extend(self._dead_methods(path, entry))
+                found.extend(self._temporary_fields(path, entry))
+                found.extend(self._refused_bequests(path, entry))
+        found.extend(self._data_clumps())
+        return found
+
+    def _dead_methods(self, path, entry):
+        # Package-private methods may be called from any file of the package
+        if entry["kind"] != "class":
+            return []
+        inherited = {(m["name"], m["arity"]) for _, parent in self.ancestors(entry["name"]) for m in parent["methods"]}
+        found = []
+        for method in entry["methods"]:
+            if any(m in method["modifiers"] for m in ACCESS_MODIFIERS + ("abstract", "native")):
+                continue
+            if method["override"] or (method["name"], method["arity"]) in inherited:
+                continue
+            if self.call_count(method["name"]) == 0:
+                found.append({
+                    "type": "Dead Code",
+                    "location": f"{entry['name']}.{method['name']}()",
+                    "severity": "Medium",
+                    "reason": "Package-private method is never called anywhere in the project",
+                    "suggestedRefactoring": "Inline Method / Delete Code",
+                    "path": path
+                })
+        return found
+
+    def _temporary_fields(self, path, entry):
+        # Only hierarchies spread over several files; the rest is seen per file
+        family = [(p, e) for name in self.descendants(entry["name"]) for p, e in self.types(name)]
+        if not entry["fields"] or not any(p != path for p, _ in family):
+            return []
+        found = []
+        for field in entry["fields"]:
+            if "static" in field["modifiers"]:
+                continue
+            users = set()
+            for _, member in [(path, entry)] + family:
+                users.update(m for m in member["references"].get(field["name"], ()) if not _is_accessor(m))
+            if len(users) == 1:
+                found.append({
+                    "type": "Temporary Field",
+                    "location": f"Field '{entry['name']}.{field['name']}'",
+                    "severity": "Low",
+                    "reason": f"Field used only in method '{users.pop()}' across the class and its subclasses",
+                    "suggestedRefactoring": "Extract Class",
+                    "path": path
+                })
+        return found
+
+    def _refused_bequests(self, path, entry):
+        found = []
+        refused = [m for m in entry["methods"] if m["refuses"]]
+        if not refused:
+            return found
+        parents = [(p, e) for p, e in self.ancestors(entry["name"]) if p != path]
+        for method in refused:
+            for _, parent in parents:
+                if any(m["name"] == method["name"] and m["arity"] == method["arity"] for m in parent["methods"]):
+                    found.append({
+                        "type": "Refused Bequest",
+                        "location": f"{entry['name']}.{method['name']}()",
+                        "severity": "Medium",
+                        "reason": f"Overrides {parent['name']}.{method['name']}() but throws {REFUSAL}",
+                        "suggestedRefactoring": "Push Down Method / Extract Superclass",
+                        "path": path
+                    })
+                    break
+        return found
+
+    def _data_clumps(self):
+        found = []
+        for group, paths in sorted(self._param_groups.items()):
+            # Groups repeated inside one file are already reported per file
+            if len(paths) < 2:
+                continue
+            found.append({
+                "type": "Data Clumps",
+                "location": "Project (Method Parameters)",
+                "severity": "Medium",
+                "reason": f"Parameter group {group} appears in {sum(paths.values())} methods across {len(paths)} files",
+                "suggestedRefactoring": "Extract Class",
+                "path": min(paths)
+            })
+        return found
+
+    # Persistence ----------------------------------------------------------------
+
+    def save(self, filename):
+        # Written to a temporary file first so an interrupted save keeps the old index
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": SYMBOLS_VERSION, "files": self.files}, f, separators=(",", ":"))
+            os.replace(tmp, filename)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @classmethod
+    def load(cls, filename):
+        """Index stored by `save`, or an empty one when missing, unreadable or outdated."""
+        index = cls()
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+        if data.get("version") != SYMBOLS_VERSION:
+            return index
+        for path, symbols in data["files"].items():
+            index.update(path, symbols)
+        return index
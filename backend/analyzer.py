@@ -1,38 +1,105 @@
-import javalang
-from smells import detect_bloaters, detect_oo_abusers, detect_dispensables, detect_couplers
+import collections
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from smells import detect_all, detect_quick, iter_all, ALL_RULES, RULE_FAMILIES
+from engine import ScopeMemo
+from codemetrics import MetricsTable
+from astcache import parse_source, default_cache
+from spans import TokenSpans, lex
+from inputs import count_lines
 
-def analyze_code(source_code: str):
+# Recovery, symbols, clone tokens, smell locations and the profiler serve
+# optional parts of a report and are imported where they are used
+
+def _parse(source_code, recover):
     """
-    Analyzes Java source code for smells.
-    Returns a structured dictionary report.
+    Returns (tree, spans, parse_errors, failure). When the source does not
+    parse and `recover` is set, the regions that do parse are analyzed and
+    `parse_errors` lists the others; `failure` is the error message when
+    nothing could be analyzed.
     """
-    
-    # 1. Parse API
     try:
-        tree = javalang.parse.parse(source_code)
-    except javalang.parser.JavaSyntaxError as e:
-        return {
-            "error": f"Syntax Error: {e.description} at line {e.at.line}",
-            "summary": {"totalLines": len(source_code.splitlines()), "totalSmells": 0},
-            "smells": []
-        }
+        tree, spans = parse_source(source_code, default_cache())
+        return tree, spans, None, None
     except Exception as e:
-         return {
-            "error": f"Parsing Error: {str(e)}",
-            "summary": {"totalLines": len(source_code.splitlines()), "totalSmells": 0},
-            "smells": []
-        }
+        from recovery import describe_error
+        failure = describe_error(e)
+    if recover:
+        from recovery import recover_tree
+        tree, tokens, parse_errors = recover_tree(source_code)
+        if tree is not None:
+            return tree, TokenSpans(tokens), parse_errors, None
+    return None, None, None, failure
+
+def _failure(message, source_code):
+    return {
+        "error": message,
+        "summary": {"totalLines": count_lines(source_code), "totalSmells": 0},
+        "smells": []
+    }
+
+def analyze_code(source_code: str, timings=None, profile=False, symbols=False, recover=True, clone_tokens=False, locate=False, quick=False):
+    """
+    Analyzes Java source code for smells.
+    Returns a structured dictionary report.
+
+    `timings` adds a "timings" section in seconds: "phases" for parse and
+    detection totals, "rules" to also break detection down per rule and per
+    detector family. `profile` samples the call stack while analyzing and
+    adds the hottest functions to the timings. `symbols` adds the declarations
+    and references needed by a ProjectIndex, collected from the same parse.
+    With `recover`, a source with syntax errors is still analyzed region by
+    region; the report then carries "parseErrors" for the regions skipped.
+    `clone_tokens` adds the normalized token fingerprints of the source for a
+    TokenCloneIndex under "cloneTokens" (arrays: remove before serializing).
+    `locate` adds to every smell the "lines" its location spans (diff mode).
+    `quick` only tokenizes the source and runs the rules that need no syntax
+    tree (TOKEN_RULES): several times faster, and syntax errors do not matter.
+    """
+    if profile:
+        from profiler import SamplingProfiler
+        with SamplingProfiler() as profiler:
+            report = analyze_code(source_code, timings or "rules", symbols=symbols, recover=recover, clone_tokens=clone_tokens, locate=locate, quick=quick)
+        report["timings"]["profile"] = {"samples": profiler.samples, "hottest": profiler.hottest()}
+        return report
+
+    if quick and symbols:
+        raise ValueError("symbols need a syntax tree, which a quick analysis does not build")
+
+    start = time.perf_counter()
+
+    # 1. Parse API (token spans are kept to measure declarations exactly)
+    if quick:
+        # Tokens only: enough for TOKEN_RULES, and nothing can fail to parse
+        tree, failure = None, None
+        spans, lexical = lex(source_code)
+        parse_errors = [{"location": f"Line {line}", "region": "tokens", "error": message} for line, message in lexical] or None
+    else:
+        tree, spans, parse_errors, failure = _parse(source_code, recover)
+    parsed = time.perf_counter()
+    if failure is not None:
+        report = _failure(failure, source_code)
+        if timings:
+            report["timings"] = {"parse": parsed - start, "total": parsed - start}
+        return report
 
     lines = source_code.splitlines()
     total_lines = len(lines)
     
     all_smells = []
     
-    # Run Detectors
-    all_smells.extend(detect_bloaters(tree, lines))
-    all_smells.extend(detect_oo_abusers(tree, lines))
-    all_smells.extend(detect_dispensables(tree, lines))
-    all_smells.extend(detect_couplers(tree, lines))
+    # Run Detectors (one shared walk of the tree for all rules)
+    rule_timings = {} if timings == "rules" else None
+    origins = [] if locate and not quick else None
+    if quick:
+        all_smells.extend(detect_quick(lines, timings=rule_timings, metrics=MetricsTable(spans)))
+    else:
+        all_smells.extend(detect_all(tree, lines, timings=rule_timings, metrics=MetricsTable(spans), origins=origins))
+    if locate:
+        from changes import locate_smells
+        all_smells = locate_smells(tree, spans, all_smells, origins)
+    detected = time.perf_counter()
     
     # Summary
     summary = {
@@ -40,7 +107,208 @@ def analyze_code(source_code: str):
         "totalSmells": len(all_smells)
     }
     
-    return {
+    report = {
         "summary": summary,
         "smells": all_smells
     }
+    if parse_errors is not None:
+        report["parseErrors"] = parse_errors
+    if quick:
+        report["quick"] = True
+    if symbols:
+        from symbols import collect_symbols
+        report["symbols"] = collect_symbols(tree)
+    if clone_tokens:
+        from clones import token_fingerprints
+        report["cloneTokens"] = token_fingerprints(spans.values, spans.lines)
+    if timings:
+        report["timings"] = {"parse": parsed - start, "detect": detected - parsed, "total": detected - start}
+        if rule_timings is not None:
+            report["timings"]["rules"] = rule_timings
+            report["timings"]["families"] = {
+                family: sum(rule_timings.get(rule.__name__, 0.0) for rule in rules)
+                for family, rules in RULE_FAMILIES.items()
+            }
+    return report
+
+def analyze_stream(source_code: str, recover=True):
+    """
+    Analyzes like analyze_code, as a generator of (event, data) pairs:
+    ("parsed", {"totalLines", "parseSeconds"[, "parseErrors"]}) once parsed,
+    ("smell", smell) for each smell as its detector finds it, then
+    ("summary", summary). Last comes ("report", report), the complete report
+    in analyze_code order, for callers that keep it; a source that cannot be
+    analyzed yields only ("error", report).
+    """
+    start = time.perf_counter()
+    tree, spans, parse_errors, failure = _parse(source_code, recover)
+    if failure is not None:
+        yield "error", _failure(failure, source_code)
+        return
+
+    lines = source_code.splitlines()
+    parsed = {"totalLines": len(lines), "parseSeconds": time.perf_counter() - start}
+    if parse_errors is not None:
+        parsed["parseErrors"] = parse_errors
+    yield "parsed", parsed
+
+    found = [[] for _ in ALL_RULES]
+    for index, smell in iter_all(tree, lines, metrics=MetricsTable(spans)):
+        found[index].append(smell)
+        yield "smell", smell
+
+    all_smells = [smell for smells in found for smell in smells]
+    summary = {"totalLines": len(lines), "totalSmells": len(all_smells)}
+    yield "summary", summary
+    report = {"summary": summary, "smells": all_smells}
+    if parse_errors is not None:
+        report["parseErrors"] = parse_errors
+    yield "report", report
+
+def replay_stream(report):
+    # The analyze_stream events of a finished report (e.g. a cached one)
+    if "error" in report:
+        yield "error", report
+        return
+    parsed = {"totalLines": report["summary"]["totalLines"], "parseSeconds": 0.0}
+    if "parseErrors" in report:
+        parsed["parseErrors"] = report["parseErrors"]
+    yield "parsed", parsed
+    for smell in report["smells"]:
+        yield "smell", smell
+    yield "summary", report["summary"]
+
+def analyze_incremental(source_code: str, previous=None, locate=False):
+    """
+    Analyzes source code, reusing the smells of declarations that are
+    unchanged since the run that produced `previous`.
+    Returns (report, entries); pass `entries` as `previous` next time.
+    `locate` adds the "lines" of every smell, as in analyze_code.
+    """
+    tree, spans, parse_errors, failure = _parse(source_code, recover=True)
+    if failure is not None:
+        report = _failure(failure, source_code)
+        report["incremental"] = {"reusedScopes": 0, "evaluatedScopes": 0}
+        # Keep the last good state so the next valid edit can still reuse it
+        return report, previous or {}
+
+    def declaration_key(node):
+        span = spans.span(node)
+        if span is None:
+            return None
+        # Line counts are smells too (Long Method), so the height is part of the key
+        first, last = spans.line_range(span)
+        return f"{spans.fingerprint(span)}:{last - first}", node.position.line
+
+    memo = ScopeMemo(declaration_key, previous)
+    lines = source_code.splitlines()
+    origins = [] if locate else None
+    all_smells = detect_all(tree, lines, memo, metrics=MetricsTable(spans), origins=origins)
+    if locate:
+        from changes import locate_smells
+        all_smells = locate_smells(tree, spans, all_smells, origins)
+
+    report = {
+        "summary": {
+            "totalLines": len(lines),
+            "totalSmells": len(all_smells)
+        },
+        "smells": all_smells,
+        "incremental": {
+            "reusedScopes": memo.reused,
+            "evaluatedScopes": memo.evaluated
+        }
+    }
+    if parse_errors is not None:
+        report["parseErrors"] = parse_errors
+    return report, memo.current
+
+# Touches the parser, region recovery and every detector family
+_WARMUP_SOURCES = (
+    "class Warmup { private int count; int get() { return count; }\n"
+    "  void run(int a, int b, int c, int d, int e) { switch (a) { case 1: count = b; break; } "
+    "new Object().toString().trim().length(); } }",
+    "class Broken { void run() { int x = ; } int ok() { return 1; } }",
+)
+
+def prewarm():
+    """
+    Runs a tiny analysis through every code path once, so the first real
+    request after a cold start does not pay for imports and first-use setup.
+    """
+    for source_code in _WARMUP_SOURCES:
+        analyze_code(source_code)
+
+def _analyze_entry(entry):
+    path, source_code = entry
+    report = analyze_code(source_code)
+    report["path"] = path
+    return report
+
+def analyze_batch(entries, max_workers=None):
+    """
+    Analyzes many (path, source_code) pairs concurrently in worker processes.
+    Returns one report per file, in input order.
+    """
+    entries = list(entries)
+    if len(entries) <= 1 or max_workers == 1:
+        return [_analyze_entry(e) for e in entries]
+
+    workers = min(max_workers or os.cpu_count() or 1, len(entries))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_analyze_entry, entries, chunksize=_chunksize(len(entries), workers)))
+    except (OSError, NotImplementedError):
+        # Platforms without multiprocessing support (e.g. serverless sandboxes)
+        return [_analyze_entry(e) for e in entries]
+
+def _chunksize(count, workers):
+    # A few chunks per worker keeps load balanced without per-file IPC overhead
+    return max(1, count // (workers * 4))
+
+class ReportSummary:
+    """
+    Running aggregate of per-file reports.
+    Lets streaming callers summarize without keeping every report in memory.
+    """
+
+    def __init__(self):
+        self.by_type = collections.Counter()
+        self.files = 0
+        self.failed = 0
+        self.total_lines = 0
+        self.total_smells = 0
+
+    def add(self, report):
+        self.files += 1
+        self.total_lines += report["summary"]["totalLines"]
+        self.total_smells += report["summary"]["totalSmells"]
+        if report.get("error") or report.get("parseErrors"):
+            self.failed += 1
+        for smell in report["smells"]:
+            self.by_type[smell["type"]] += 1
+
+    def as_dict(self):
+        return {
+            "totalFiles": self.files,
+            "filesWithErrors": self.failed,
+            "totalLines": self.total_lines,
+            "totalSmells": self.total_smells,
+            "smellsByType": dict(self.by_type)
+        }
+
+def summarize_reports(reports):
+    """
+    Aggregates per-file reports into a single summary.
+    """
+    summary = ReportSummary()
+    for report in reports:
+        summary.add(report)
+    return summary.as_dict()
+
+def analyze_sources(sources):
+    """
+    Analyzes a list of sources one after another.
+    Used as a single pool job so a batch costs one round trip per chunk.
+    """
+    return [analyze_code(source_code) for source_code in sources]
@@ -0,0 +1,287 @@
+"""
+Benchmark harness for the parser and each smell detector.
+
+    python bench.py                          # run every scenario, print a table
+    python bench.py -o results.json          # also write machine-readable results
+    python bench.py --compare old.json       # show the change against a previous run
+    python bench.py --cold-start             # time fresh interpreters importing the API
+
+Synthetic Java corpora are generated at controlled sizes (many classes, long
+methods, deep switches, long message chains). Parsing (tree and token
+spans, as analyze_code does) and each detector family are timed separately
+over several repeats, and the peak memory of every phase is measured in a
+separate traced run so it does not skew timings.
+
+--cold-start starts a fresh interpreter per repeat that imports the serverless
+entry point (api/index.py) and analyzes a small file twice, with and without
+ANALYSIS_PREWARM; peak memory there is the process' maximum resident size.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import javalang
+
+import smells
+from smells import detect_bloaters, detect_oo_abusers, detect_dispensables, detect_couplers, detect_all, detect_quick
+from astcache import parse_source
+from codemetrics import MetricsTable
+
+# Detectors get a fresh MetricsTable over the parsed token spans, as in analyze_code
+PHASES = [
+    ("detect_bloaters", lambda tree, lines, spans: detect_bloaters(tree, lines, metrics=MetricsTable(spans))),
+    ("detect_oo_abusers", lambda tree, lines, spans: detect_oo_abusers(tree, lines, metrics=MetricsTable(spans))),
+    ("detect_dispensables", lambda tree, lines, spans: detect_dispensables(tree, lines, metrics=MetricsTable(spans))),
+    ("detect_couplers", lambda tree, lines, spans: detect_couplers(tree, lines, metrics=MetricsTable(spans))),
+    ("detect_all", lambda tree, lines, spans: detect_all(tree, lines, metrics=MetricsTable(spans))),
+    # The quick tier lexes the lines itself and never needs the tree: compare with parse + detect_all
+    ("detect_quick", lambda tree, lines, spans: detect_quick(lines)),
+]
+
+# name -> generator parameters, before scaling
+SCENARIOS = {
+    "many-classes": {"classes": 200, "methods": 4, "statements": 4, "switch_cases": 0, "chain_length": 0},
+    "long-methods": {"classes": 5, "methods": 6, "statements": 120, "switch_cases": 0, "chain_length": 0},
+    "deep-switches": {"classes": 10, "methods": 5, "statements": 4, "switch_cases": 60, "chain_length": 0},
+    "long-chains": {"classes": 10, "methods": 5, "statements": 30, "switch_cases": 0, "chain_length": 12},
+    "mixed": {"classes": 40, "methods": 8, "statements": 25, "switch_cases": 8, "chain_length": 4},
+}
+
+
+def generate_source(classes, methods, statements, switch_cases=0, chain_length=0):
+    """
+    Builds a compilable-looking Java file with the requested shape.
+    Every method gets `statements` statements, an optional switch with
+    `switch_cases` cases and an optional message chain of `chain_length` calls.
+    """
+    out = []
+    for c in range(classes):
+        out.append(f"class Generated{c} {{")
+        out.append(f"    private int count{c};")
+        out.append(f"    private String label{c};")
+        out.append(f"    public int getCount{c}() {{ return count{c}; }}")
+        for m in range(methods):
+            out.append(f"    public int compute{m}(int a, int b, String name, Object extra) {{")
+            out.append("        int total = 0;")
+            for s in range(statements):
+                out.append(f"        total += a * {s} + b; // step {s}")
+            if switch_cases:
+                out.append("        switch (a) {")
+                for k in range(switch_cases):
+                    out.append(f"            case {k}: total += {k}; break;")
+                out.append("        }")
+            if chain_length:
+                chain = "".join(f".next{k}()" for k in range(chain_length))
+                out.append(f"        Object link = builder(){chain};")
+            out.append(f"        count{c} += total;")
+            out.append("        return total;")
+            out.append("    }")
+        out.append("}")
+    return "\n".join(out) + "\n"
+
+
+def _timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def _peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _stats(samples, peak):
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "peakBytes": peak
+    }
+
+
+def run_scenario(name, params, repeat):
+    source_code = generate_source(**params)
+    lines = source_code.splitlines()
+
+    # Tokens, tree and token spans, built once like analyze_code does
+    samples, (tree, spans) = _timed(lambda: parse_source(source_code), repeat)
+    phases = {"parse": _stats(samples, _peak_bytes(lambda: parse_source(source_code)))}
+    smell_count = 0
+    for phase, detector in PHASES:
+        samples, found = _timed(lambda: list(detector(tree, lines, spans)), repeat)
+        phases[phase] = _stats(samples, _peak_bytes(lambda: list(detector(tree, lines, spans))))
+        if phase == "detect_all":
+            smell_count = len(found)
+
+    return {
+        "scenario": name,
+        "params": params,
+        "lines": len(lines),
+        "smells": smell_count,
+        "phases": phases
+    }
+
+
+DEFAULT_ENTRY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api", "index.py")
+
+# Runs in the fresh interpreter, next to the entry module; the source comes on stdin
+_COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+try:
+    import resource
+    peak = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+except ImportError:
+    peak = lambda: 0
+import {module}
+imported, imported_peak = time.perf_counter(), peak()
+import analyzer
+source_code = sys.stdin.read()
+report = analyzer.analyze_code(source_code)
+first, first_peak = time.perf_counter(), peak()
+analyzer.analyze_code(source_code)
+second = time.perf_counter()
+print(json.dumps({{"import": [imported - start, imported_peak], "first-analysis": [first - imported, first_peak],
+                  "warm-analysis": [second - first, peak()], "smells": report["summary"]["totalSmells"]}}))
+"""
+
+
+def run_cold_start(entry, repeat, prewarm):
+    """
+    Times `repeat` fresh interpreters importing `entry` and analyzing a small
+    generated file twice. Phases: import, first-analysis (including whatever
+    the entry point left to import on first use) and warm-analysis.
+    """
+    params = {"classes": 3, "methods": 4, "statements": 10, "switch_cases": 6, "chain_length": 4}
+    source_code = generate_source(**params)
+    directory, filename = os.path.split(os.path.abspath(entry))
+    script = _COLD_START.format(module=os.path.splitext(filename)[0])
+    env = dict(os.environ, ANALYSIS_PREWARM="1" if prewarm else "0")
+
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", script], input=source_code, capture_output=True,
+                             text=True, cwd=directory, env=env, check=True).stdout
+        total = time.perf_counter() - started
+        result = json.loads(out.strip().splitlines()[-1])
+        result["process"] = [total, result["warm-analysis"][1]]
+        runs.append(result)
+
+    phases = {}
+    for phase in ("process", "import", "first-analysis", "warm-analysis"):
+        phases[phase] = _stats([run[phase][0] for run in runs], max(run[phase][1] for run in runs))
+    return {
+        "scenario": "cold-start-prewarm" if prewarm else "cold-start",
+        "params": dict(params, entry=os.path.relpath(entry), prewarm=prewarm),
+        "lines": len(source_code.splitlines()),
+        "smells": runs[-1]["smells"],
+        "phases": phases
+    }
+
+
+def run(scenarios, scale, repeat, cold_start=None):
+    results = []
+    for name in scenarios:
+        params = dict(SCENARIOS[name])
+        # Scale the dominant dimension of each scenario
+        for key in ("classes", "statements"):
+            params[key] = max(1, int(params[key] * scale))
+        results.append(run_scenario(name, params, repeat))
+    if cold_start:
+        for prewarm in (False, True):
+            results.append(run_cold_start(cold_start, repeat, prewarm))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "javalang": getattr(javalang, "__version__", "unknown"),
+            "thresholds": dict(smells.THRESHOLDS),
+            "scale": scale,
+            "repeat": repeat,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "results": results
+    }
+
+
+def print_table(report, out, baseline=None):
+    previous = {}
+    if baseline:
+        for result in baseline["results"]:
+            previous[result["scenario"]] = result["phases"]
+
+    for result in report["results"]:
+        out.write(f"\n{result['scenario']} ({result['lines']} lines, {result['smells']} smells)\n")
+        for phase, data in result["phases"].items():
+            line = f"  {phase.ljust(20)} {data['median'] * 1000:9.2f} ms  {data['peakBytes'] / 1024:9.0f} KiB"
+            old = previous.get(result["scenario"], {}).get(phase)
+            if old and old["median"] > 0:
+                change = (data["median"] / old["median"] - 1) * 100
+                line += f"  {change:+6.1f}%"
+            out.write(line + "\n")
+
+
+def regressions(report, baseline, tolerance):
+    """
+    Returns (scenario, phase, change) for every phase whose median got slower
+    than `tolerance` (a fraction) compared to the baseline.
+    """
+    previous = {r["scenario"]: r["phases"] for r in baseline["results"]}
+    found = []
+    for result in report["results"]:
+        for phase, data in result["phases"].items():
+            old = previous.get(result["scenario"], {}).get(phase)
+            if old and old["median"] > 0 and data["median"] > old["median"] * (1 + tolerance):
+                found.append((result["scenario"], phase, data["median"] / old["median"] - 1))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Java parser and smell detectors.")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply corpus sizes by this factor (default: 1.0)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timed repetitions per phase (default: 5)")
+    parser.add_argument("--cold-start", action="store_true", help="Time fresh interpreters importing the API entry point (only this unless -s is given)")
+    parser.add_argument("--entry", default=DEFAULT_ENTRY, help="Entry module for --cold-start (default: api/index.py)")
+    parser.add_argument("-o", "--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before --compare fails (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenario or ([] if args.cold_start else list(SCENARIOS))
+    report = run(scenarios, args.scale, max(1, args.repeat), args.entry if args.cold_start else None)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_table(report, sys.stdout, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline:
+        slower = regressions(report, baseline, args.tolerance)
+        for scenario, phase, change in slower:
+            sys.stderr.write(f"Regression: {scenario}/{phase} is {change * 100:.1f}% slower\n")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,449 @@
+"""
+Queue of long-running analyses (whole repositories) kept in SQLite.
+
+    python jobs.py [--db FILE] [--once]
+
+runs a standalone worker that pulls files from the queue and analyzes them
+in this process; start several for more throughput. The API server runs
+the same loop in the background (see JobRunner), so workers are optional.
+Claims are leased: files held by a worker that died are picked up again
+once its lease expires or, on the same host, as soon as it is gone.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+from analyzer import analyze_code, ReportSummary
+from inputs import check_empty, error_report
+from pool import PoolBusy, WorkerLost
+
+# Job settings (Configurable through the environment)
+# ANALYSIS_JOBS_DB holds the queue; keep it on persistent storage to resume jobs after a restart
+JOB_SETTINGS = {
+    "DB": os.environ.get("ANALYSIS_JOBS_DB", os.path.join(tempfile.gettempdir(), "code-smell-jobs.sqlite3")),
+    "CHUNK": int(os.environ.get("ANALYSIS_JOB_CHUNK", 8)),
+    "LEASE": float(os.environ.get("ANALYSIS_JOB_LEASE", 300)),
+    "MAX_BYTES": int(os.environ.get("ANALYSIS_JOB_MAX_BYTES", 64 * 1024 * 1024)),
+}
+
+JAVA_SUFFIX = ".java"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    total INTEGER NOT NULL,
+    last_claim REAL NOT NULL DEFAULT 0,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    source TEXT,
+    status TEXT NOT NULL,
+    worker TEXT,
+    claimed REAL,
+    failed INTEGER NOT NULL DEFAULT 0,
+    report TEXT,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (job_id, status);
+"""
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _alive(worker):
+    # Only processes of this host can be checked; others wait for their lease
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def tar_sources(data):
+    """
+    Yields (path, source_code) for every .java file of a tar archive
+    (optionally gzip, bzip2 or xz compressed). Members are read in memory,
+    never extracted, so archive paths cannot escape anywhere.
+    """
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.endswith(JAVA_SUFFIX):
+                yield member.name, archive.extractfile(member).read().decode("utf-8", errors="replace")
+
+
+class JobStore:
+    """
+    Jobs and their files in one SQLite database. Each file row goes from
+    "pending" to "running" (claimed by a worker, with a lease) to "done"
+    with its report; a job is "done" once none of its files is left.
+    Sources are dropped as soon as their report is stored.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or JOB_SETTINGS["DB"]
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # One connection shared by every thread the server runs store calls in
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _transaction(self, work):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same rows
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def submit(self, files):
+        """Queues (path, source_code) pairs as one job; returns its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def work(db):
+            total = 0
+            for seq, (path, source_code) in enumerate(files):
+                db.execute("INSERT INTO files (job_id, seq, path, source, status) VALUES (?, ?, ?, ?, 'pending')",
+                           (job_id, seq, path, source_code))
+                total += 1
+            db.execute("INSERT INTO jobs (id, status, created, updated, total) VALUES (?, 'queued', ?, ?, ?)",
+                       (job_id, now, now, total))
+            if total == 0:
+                self._finish(db, job_id)
+
+        self._transaction(work)
+        return job_id
+
+    def claim(self, worker, limit=None):
+        """
+        Leases up to `limit` files to `worker`, all from the job that was
+        served least recently so concurrent jobs progress side by side.
+        Returns [(job_id, seq, path, source_code)].
+        """
+        limit = limit or JOB_SETTINGS["CHUNK"]
+        now = time.time()
+
+        def work(db):
+            rows = db.execute(
+                "SELECT j.id FROM jobs j WHERE j.status IN ('queued', 'running') AND EXISTS "
+                "(SELECT 1 FROM files f WHERE f.job_id = j.id AND f.status = 'pending') "
+                "ORDER BY j.last_claim, j.created LIMIT 1").fetchall()
+            if not rows:
+                return []
+            job_id = rows[0][0]
+            claimed = db.execute(
+                "SELECT seq, path, source FROM files WHERE job_id = ? AND status = 'pending' ORDER BY seq LIMIT ?",
+                (job_id, limit)).fetchall()
+            db.executemany("UPDATE files SET status = 'running', worker = ?, claimed = ? WHERE job_id = ? AND seq = ?",
+                           [(worker, now, job_id, seq) for seq, _, _ in claimed])
+            db.execute("UPDATE jobs SET status = 'running', last_claim = ?, updated = ? WHERE id = ?", (now, now, job_id))
+            return [(job_id, seq, path, source) for seq, path, source in claimed]
+
+        return self._transaction(work)
+
+    def complete(self, results):
+        """Stores (job_id, seq, report) results; finishes jobs with nothing left to do."""
+        now = time.time()
+
+        def work(db):
+            jobs = set()
+            for job_id, seq, report in results:
+                # A file reclaimed after its lease ran out may already be done; one of a
+                # deleted job is gone and simply not updated
+                db.execute("UPDATE files SET status = 'done', source = NULL, report = ?, failed = ? "
+                           "WHERE job_id = ? AND seq = ? AND status != 'done'",
+                           (json.dumps(report, separators=(",", ":")), 1 if report.get("error") or report.get("parseErrors") else 0, job_id, seq))
+                jobs.add(job_id)
+            for job_id in jobs:
+                db.execute("UPDATE jobs SET updated = ? WHERE id = ?", (now, job_id))
+                left = db.execute("SELECT 1 FROM files WHERE job_id = ? AND status != 'done' LIMIT 1", (job_id,)).fetchone()
+                if left is None:
+                    self._finish(db, job_id)
+
+        self._transaction(work)
+
+    def release(self, worker=None):
+        """
+        Returns claimed files to the queue: those of `worker`, or else those
+        whose lease expired or whose worker process is gone. Returns how many.
+        """
+        def work(db):
+            if worker is not None:
+                stale = db.execute("SELECT job_id, seq FROM files WHERE status = 'running' AND worker = ?", (worker,)).fetchall()
+            else:
+                deadline = time.time() - JOB_SETTINGS["LEASE"]
+                stale = [(job_id, seq) for job_id, seq, owner, claimed in db.execute(
+                    "SELECT job_id, seq, worker, claimed FROM files WHERE status = 'running'")
+                    if claimed < deadline or not _alive(owner)]
+            db.executemany("UPDATE files SET status = 'pending', worker = NULL, claimed = NULL WHERE job_id = ? AND seq = ?", stale)
+            return len(stale)
+
+        return self._transaction(work)
+
+    def _finish(self, db, job_id):
+        # The per-type summary is computed once, streaming the stored reports
+        summary = ReportSummary()
+        for (report,) in db.execute("SELECT report FROM files WHERE job_id = ? ORDER BY seq", (job_id,)):
+            summary.add(json.loads(report))
+        db.execute("UPDATE jobs SET status = 'done', summary = ?, updated = ? WHERE id = ?",
+                   (json.dumps(summary.as_dict()), time.time(), job_id))
+
+    def delete(self, job_id):
+        """Drops a job with its files and reports; False when unknown."""
+        def work(db):
+            db.execute("DELETE FROM files WHERE job_id = ?", (job_id,))
+            return db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
+
+        return self._transaction(work)
+
+    def status(self, job_id):
+        """Status and progress of a job, or None when unknown."""
+        with self._lock:
+            row = self._db.execute("SELECT status, created, updated, total, summary FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM files WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+            failed = self._db.execute("SELECT COUNT(*) FROM files WHERE job_id = ? AND failed = 1", (job_id,)).fetchone()[0]
+        status, created, updated, total, summary = row
+        result = {
+            "id": job_id,
+            "status": status,
+            "created": created,
+            "updated": updated,
+            "progress": {
+                "total": total,
+                "done": counts.get("done", 0),
+                "running": counts.get("running", 0),
+                "pending": counts.get("pending", 0),
+                "failed": failed
+            }
+        }
+        if summary is not None:
+            result["summary"] = json.loads(summary)
+        return result
+
+    def results(self, job_id, offset=0, limit=100):
+        """Stored reports of finished files in submission order, as JSON strings."""
+        with self._lock:
+            return [report for (report,) in self._db.execute(
+                "SELECT report FROM files WHERE job_id = ? AND status = 'done' ORDER BY seq LIMIT ? OFFSET ?",
+                (job_id, limit, offset))]
+
+    def has_work(self):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM files WHERE status = 'pending' LIMIT 1").fetchone() is not None
+
+
+class JobRunner:
+    """
+    Works through the queue inside the API server: claims chunks of files
+    and analyzes them in the AnalysisPool, up to `concurrency` chunks at a
+    time. `start()` runs it in the background; `run_for(seconds)` works in
+    the foreground instead, for hosts that freeze background tasks between
+    requests (serverless functions).
+    """
+
+    def __init__(self, store, pool, analyze_many, check=None, cache=None, cache_key=None, concurrency=None, timeout=None):
+        self.store = store
+        self.pool = pool
+        self.analyze_many = analyze_many
+        self.check = check or check_empty
+        self.cache = cache
+        self.cache_key = cache_key
+        self.concurrency = concurrency or max(pool.workers, 1)
+        self.timeout = timeout
+        self.worker = worker_id()
+        self._task = None
+        self._wake = None
+
+    def start(self):
+        self.store.release()
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run_forever())
+
+    def notify(self):
+        # Called after a submission so an idle runner does not wait for its next poll
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.store.release, self.worker)
+
+    async def _run_forever(self):
+        while True:
+            try:
+                if not await self._work(deadline=None):
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), 5)
+                    except asyncio.TimeoutError:
+                        # Also picks up files released by workers that died
+                        await asyncio.to_thread(self.store.release)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # A broken store (disk full, locked database) must not end the runner
+                sys.stderr.write(f"Job runner error:\n{traceback.format_exc()}")
+                await asyncio.sleep(5)
+
+    async def run_for(self, seconds):
+        """Analyzes queued files for about `seconds`; returns whether any were found."""
+        return await self._work(deadline=time.monotonic() + seconds)
+
+    async def _work(self, deadline):
+        # Keeps up to `concurrency` chunks in flight until the queue is empty or the deadline passes
+        found = False
+        running = {}
+        while True:
+            while len(running) < self.concurrency and (deadline is None or time.monotonic() < deadline):
+                claimed = await asyncio.to_thread(self.store.claim, self.worker)
+                if not claimed:
+                    break
+                found = True
+                running[asyncio.ensure_future(self._analyze(claimed))] = claimed
+            if not running:
+                return found
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                await self._settle(task, running.pop(task))
+
+    async def _settle(self, task, claimed):
+        # A chunk whose analysis raised is stored as error reports instead of staying claimed
+        try:
+            task.result()
+        except Exception as e:
+            sys.stderr.write(f"Job chunk failed:\n{traceback.format_exc()}")
+            await asyncio.to_thread(self.store.complete, [(job_id, seq, error_report(path, source_code, f"Runtime Error: {e}"))
+                                                          for job_id, seq, path, source_code in claimed])
+
+    async def _analyze(self, claimed):
+        results = []
+        pending = []
+        for job_id, seq, path, source_code in claimed:
+            problem = self.check(source_code)
+            if problem:
+                results.append((job_id, seq, error_report(path, source_code, problem)))
+                continue
+            cached = self.cache.get(self.cache_key(source_code)) if self.cache is not None else None
+            if cached is not None:
+                results.append((job_id, seq, dict(cached, path=path)))
+            else:
+                pending.append((job_id, seq, path, source_code))
+
+        if pending:
+            while True:
+                try:
+                    reports = await self.pool.run(self.analyze_many, [source for *_, source in pending], timeout=self.timeout)
+                    break
+                except PoolBusy:
+                    # Interactive requests share the pool; let them go first
+                    await asyncio.sleep(0.5)
+                except asyncio.TimeoutError:
+                    reports = [error_report(path, source, "Analysis timed out") for _, _, path, source in pending]
+                    break
+                except MemoryError:
+                    reports = [error_report(path, source, "Analysis exceeded the worker memory limit") for _, _, path, source in pending]
+                    break
+                except WorkerLost:
+                    # Not retried: the same sources would likely bring the new worker down too
+                    reports = [error_report(path, source, "Analysis worker stopped unexpectedly") for _, _, path, source in pending]
+                    break
+            for (job_id, seq, path, source_code), report in zip(pending, reports):
+                if self.cache is not None and not report.get("error", "").startswith("Analysis "):
+                    self.cache.put(self.cache_key(source_code), report)
+                results.append((job_id, seq, dict(report, path=path)))
+        await asyncio.to_thread(self.store.complete, results)
+
+
+def work(store, once=False, chunk=None):
+    """Standalone worker loop: analyzes claimed files in this process."""
+    worker = worker_id()
+    store.release()
+    try:
+        while True:
+            claimed = store.claim(worker, chunk)
+            if not claimed:
+                if once:
+                    return
+                time.sleep(1)
+                store.release()
+                continue
+            results = []
+            for job_id, seq, path, source_code in claimed:
+                problem = check_empty(source_code)
+                if problem:
+                    report = error_report(path, source_code, problem)
+                else:
+                    try:
+                        report = dict(analyze_code(source_code), path=path)
+                    except Exception as e:
+                        # Stored like any failed file: left claimed, it would come back after
+                        # its lease and stop the worker again
+                        sys.stderr.write(f"Analysis of {path} failed:\n{traceback.format_exc()}")
+                        report = error_report(path, source_code, f"Runtime Error: {e}")
+                results.append((job_id, seq, report))
+            store.complete(results)
+    finally:
+        store.release(worker)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze files queued through the job API.")
+    parser.add_argument("--db", default=None, help="Queue database (default: ANALYSIS_JOBS_DB)")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty instead of waiting")
+    parser.add_argument("--chunk", type=int, default=None, help="Files claimed at a time (default: ANALYSIS_JOB_CHUNK)")
+    args = parser.parse_args(argv)
+    store = JobStore(args.db)
+    try:
+        work(store, once=args.once, chunk=args.chunk)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+"""
+Editor integration: a Language Server Protocol server that reports smells
+as diagnostics while Java files are edited.
+
+    python lsp.py [--debounce 0.2]      (speaks LSP over stdin/stdout)
+
+The process stays warm between edits: every open document keeps its text,
+its version and the incremental analysis entries of its last run, so an
+edit re-analyzes only the declarations it touched (see analyze_incremental).
+Changes are applied incrementally and analyzed once typing pauses for the
+debounce delay; an edit arriving meanwhile cancels the pending analysis,
+and the result of one already running is dropped when the document has
+moved on. Diagnostics point at the lines a smell spans, or at the name of
+the declaration it is about.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+
+from analyzer import analyze_incremental, prewarm
+
+# LSP settings (Configurable through the environment)
+LSP_SETTINGS = {
+    "DEBOUNCE": float(os.environ.get("ANALYSIS_LSP_DEBOUNCE", 0.2)),
+}
+
+SOURCE = "code-smell"
+# Smell severity -> LSP DiagnosticSeverity (1 Error, 2 Warning, 3 Information, 4 Hint)
+SEVERITY = {"High": 2, "Medium": 3, "Low": 4}
+ERROR = 1
+# TextDocumentSyncKind.Incremental
+SYNC_INCREMENTAL = 2
+
+# JSON-RPC error codes
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+SERVER_NOT_INITIALIZED = -32002
+INVALID_REQUEST = -32600
+
+_LINE_LOCATION = re.compile(r"^Lines? (\d+)(?:-(\d+))?$")
+_AT_LINE = re.compile(r"at line (\d+)")
+# Declaration locations: "Foo", "foo()", "Field 'foo'" (and "Foo.foo()" from symbols)
+_DECLARED_NAME = re.compile(r"^(?:Field ')?(?:[\w$]+\.)?([\w$]+)(?:\(\)|')?$")
+
+
+def read_message(stream):
+    """The next JSON-RPC message from a binary stream (Content-Length framing); None at end of input."""
+    length = None
+    while True:
+        header = stream.readline()
+        if not header:
+            return None
+        header = header.strip()
+        if not header:
+            if length is not None:
+                break
+            continue
+        name, _, value = header.decode("ascii", "replace").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+    return json.loads(body.decode("utf-8"))
+
+
+def write_message(stream, message):
+    body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    stream.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    stream.flush()
+
+
+class TextDocument:
+    """
+    The text of one open document. Positions are LSP (line, character)
+    pairs; characters count UTF-16 code units unless the client negotiated
+    "utf-32" (code points, i.e. Python string indexes).
+    """
+
+    def __init__(self, uri, text, version, utf16=True):
+        self.uri = uri
+        self.text = text
+        self.version = version
+        self.utf16 = utf16
+        self._lines = None
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = self.text.split("\n")
+        return self._lines
+
+    def line(self, number):
+        # A 0-based line without its line ending; "" past the end
+        lines = self.lines
+        if number >= len(lines):
+            return ""
+        return lines[number].rstrip("\r")
+
+    def character(self, line_text, index):
+        # Python index within a line -> LSP character
+        if not self.utf16 or line_text.isascii():
+            return index
+        return index + sum(1 for c in line_text[:index] if ord(c) > 0xFFFF)
+
+    def index(self, line_text, character):
+        # LSP character -> Python index within a line
+        if not self.utf16 or line_text.isascii():
+            return min(character, len(line_text))
+        units = 0
+        for i, c in enumerate(line_text):
+            if units >= character:
+                return i
+            units += 2 if ord(c) > 0xFFFF else 1
+        return len(line_text)
+
+    def offset(self, position):
+        lines = self.lines
+        line = position["line"]
+        if line >= len(lines):
+            return len(self.text)
+        start = sum(len(text) + 1 for text in lines[:line])
+        return start + self.index(lines[line], position["character"])
+
+    def apply(self, change):
+        """Applies one TextDocumentContentChangeEvent (a range edit, or the whole text)."""
+        if "range" not in change:
+            self.text = change["text"]
+        else:
+            start = self.offset(change["range"]["start"])
+            end = self.offset(change["range"]["end"])
+            self.text = self.text[:start] + change["text"] + self.text[end:]
+        self._lines = None
+
+    def span_range(self, first, last):
+        """The range over 1-based lines first..last, from the first non-blank character to the end of the last line."""
+        first_text = self.line(first - 1)
+        last_text = self.line(last - 1)
+        indent = len(first_text) - len(first_text.lstrip())
+        return {
+            "start": {"line": first - 1, "character": self.character(first_text, indent)},
+            "end": {"line": last - 1, "character": self.character(last_text, len(last_text))}
+        }
+
+    def name_range(self, name, first, last):
+        """The range of the first `name` identifier on 1-based lines first..last, or None."""
+        pattern = re.compile(r"(?<![\w$])" + re.escape(name) + r"(?![\w$])")
+        for number in range(first - 1, min(last, len(self.lines))):
+            text = self.line(number)
+            match = pattern.search(text)
+            if match:
+                return {
+                    "start": {"line": number, "character": self.character(text, match.start())},
+                    "end": {"line": number, "character": self.character(text, match.end())}
+                }
+        return None
+
+
+def smell_range(document, smell):
+    """
+    Where a located smell is shown: the lines of line-based smells, the
+    declaration's name for the others (its first line if the name is not
+    found), the first line of the file when the smell has no place.
+    """
+    lines = smell.get("lines")
+    if not lines:
+        return document.span_range(1, 1)
+    first, last = lines[0]
+    if _LINE_LOCATION.match(smell["location"]):
+        return document.span_range(first, last)
+    match = _DECLARED_NAME.match(smell["location"])
+    found = document.name_range(match.group(1), first, last) if match else None
+    return found or document.span_range(first, first)
+
+
+def diagnostics(document, report):
+    """The LSP diagnostics of a located report (analyze_incremental(locate=True))."""
+    results = []
+    if "error" in report:
+        # Nothing could be analyzed: one error where the parser stopped
+        match = _AT_LINE.search(report["error"])
+        line = int(match.group(1)) if match else 1
+        results.append({"range": document.span_range(line, line), "severity": ERROR, "source": SOURCE, "message": report["error"]})
+    for error in report.get("parseErrors", ()):
+        match = _LINE_LOCATION.match(error["location"])
+        first = int(match.group(1)) if match else 1
+        last = int(match.group(2) or first) if match else 1
+        results.append({
+            "range": document.span_range(first, last),
+            "severity": ERROR,
+            "source": SOURCE,
+            "message": f"Not analyzed ({error['region']}): {error['error']}"
+        })
+    for smell in report["smells"]:
+        results.append({
+            "range": smell_range(document, smell),
+            "severity": SEVERITY.get(smell["severity"], 3),
+            "code": smell["type"],
+            "source": SOURCE,
+            "message": f"{smell['type']}: {smell['reason']}. Suggested refactoring: {smell['suggestedRefactoring']}",
+            "data": {"severity": smell["severity"], "suggestedRefactoring": smell["suggestedRefactoring"]}
+        })
+    return results
+
+
+class _DocumentState:
+    # An open document plus its analysis: memo entries of the last run, the
+    # pending (debounced) start, the running analysis and whether the text
+    # changed while it ran
+    __slots__ = ("document", "entries", "timer", "task", "dirty")
+
+    def __init__(self, document):
+        self.document = document
+        self.entries = None
+        self.timer = None
+        self.task = None
+        self.dirty = False
+
+
+class SmellLanguageServer:
+    """
+    Handles the LSP messages of one client; `send` writes a message to it.
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, send, debounce=None):
+        self.send = send
+        self.debounce = LSP_SETTINGS["DEBOUNCE"] if debounce is None else debounce
+        self.documents = {}
+        self.initialized = False
+        self.shutting_down = False
+        self.exited = asyncio.get_running_loop().create_future()
+        self.utf16 = True
+        # Analyses whose result was dropped because the document changed meanwhile
+        self.stale = 0
+
+    def handle(self, message):
+        method = message.get("method")
+        request_id = message.get("id")
+        if method is None:
+            # A response to a request of ours: none are sent
+            return
+        handler = getattr(self, "on_" + method.replace("/", "_").replace("$", "dollar"), None)
+        if request_id is None:
+            # Notification: unknown ones are ignored, as the protocol allows
+            if handler is not None and (self.initialized or method == "exit"):
+                try:
+                    handler(message.get("params") or {})
+                except Exception as e:
+                    sys.stderr.write(f"lsp: {method}: {type(e).__name__}: {e}\n")
+            return
+
+        if not self.initialized and method != "initialize":
+            self._error(request_id, SERVER_NOT_INITIALIZED, "Server not initialized")
+        elif handler is None:
+            self._error(request_id, METHOD_NOT_FOUND, f"Unknown method: {method}")
+        elif self.shutting_down:
+            self._error(request_id, INVALID_REQUEST, "Server is shutting down")
+        else:
+            try:
+                self.send({"jsonrpc": "2.0", "id": request_id, "result": handler(message.get("params") or {})})
+            except Exception as e:
+                self._error(request_id, INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+
+    def _error(self, request_id, code, message):
+        self.send({"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}})
+
+    # Lifecycle
+
+    def on_initialize(self, params):
+        encodings = ((params.get("capabilities") or {}).get("general") or {}).get("positionEncodings") or []
+        self.utf16 = "utf-32" not in encodings
+        self.initialized = True
+        return {
+            "capabilities": {
+                "positionEncoding": "utf-16" if self.utf16 else "utf-32",
+                "textDocumentSync": {"openClose": True, "change": SYNC_INCREMENTAL, "save": {"includeText": True}}
+            },
+            "serverInfo": {"name": "java-code-smell-detector"}
+        }
+
+    def on_initialized(self, params):
+        pass
+
+    def on_shutdown(self, params):
+        self.shutting_down = True
+        for state in self.documents.values():
+            self._cancel(state)
+        return None
+
+    def on_exit(self, params):
+        if not self.exited.done():
+            self.exited.set_result(0 if self.shutting_down else 1)
+
+    # Document synchronization
+
+    def on_textDocument_didOpen(self, params):
+        item = params["textDocument"]
+        if item.get("languageId") != "java" and not item["uri"].endswith(".java"):
+            return
+        state = _DocumentState(TextDocument(item["uri"], item["text"], item.get("version"), self.utf16))
+        self.documents[item["uri"]] = state
+        self._schedule(state, 0)
+
+    def on_textDocument_didChange(self, params):
+        state = self.documents.get(params["textDocument"]["uri"])
+        if state is None:
+            return
+        for change in params["contentChanges"]:
+            state.document.apply(change)
+        state.document.version = params["textDocument"].get("version")
+        self._schedule(state, self.debounce)
+
+    def on_textDocument_didSave(self, params):
+        state = self.documents.get(params["textDocument"]["uri"])
+        if state is None:
+            return
+        changed = params.get("text") is not None and params["text"] != state.document.text
+        if changed:
+            state.document.apply({"text": params["text"]})
+        # Saving is a pause in typing: no need to wait for the debounce
+        if changed or state.timer is not None:
+            self._schedule(state, 0)
+
+    def on_textDocument_didClose(self, params):
+        state = self.documents.pop(params["textDocument"]["uri"], None)
+        if state is None:
+            return
+        self._cancel(state)
+        self._publish(state.document.uri, None, [])
+
+    def on_dollar_cancelRequest(self, params):
+        # Every request is answered at once; analyses follow edits, not requests
+        pass
+
+    # Analysis
+
+    def _cancel(self, state):
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        state.dirty = False
+
+    def _schedule(self, state, delay):
+        # A newer edit replaces the pending start: only the last one runs
+        self._cancel(state)
+        state.timer = asyncio.get_running_loop().call_later(delay, self._start, state)
+
+    def _start(self, state):
+        state.timer = None
+        if state.task is not None:
+            # Runs once the current analysis is done (its result will be stale)
+            state.dirty = True
+            return
+        state.task = asyncio.get_running_loop().create_task(self._analyze(state))
+
+    async def _analyze(self, state):
+        document = state.document
+        version, text = document.version, document.text
+        try:
+            report, state.entries = await asyncio.to_thread(analyze_incremental, text, state.entries, True)
+        except Exception as e:
+            sys.stderr.write(f"lsp: {document.uri}: {type(e).__name__}: {e}\n")
+            report = None
+        finally:
+            state.task = None
+
+        if self.documents.get(document.uri) is not state:
+            return
+        if document.text != text:
+            # Edited while analyzing: these diagnostics would point at old lines
+            self.stale += 1
+            if state.dirty:
+                state.dirty = False
+                self._start(state)
+            return
+        if report is not None:
+            self._publish(document.uri, version, diagnostics(document, report))
+
+    def _publish(self, uri, version, results):
+        params = {"uri": uri, "diagnostics": results}
+        if version is not None:
+            params["version"] = version
+        self.send({"jsonrpc": "2.0", "method": "textDocument/publishDiagnostics", "params": params})
+
+
+def _read_messages(stream, loop, server):
+    # Reader thread: blocking reads, handled on the loop
+    try:
+        while True:
+            message = read_message(stream)
+            if message is None:
+                break
+            loop.call_soon_threadsafe(server.handle, message)
+    except (ValueError, OSError) as e:
+        sys.stderr.write(f"lsp: {type(e).__name__}: {e}\n")
+    # End of input without "exit" is an exit too
+    loop.call_soon_threadsafe(server.on_exit, {})
+
+
+async def serve(stdin, stdout, debounce=None):
+    """Serves one client over binary streams until it exits; returns the exit code."""
+    loop = asyncio.get_running_loop()
+    server = SmellLanguageServer(lambda message: write_message(stdout, message), debounce)
+    # Warm the parser and the detectors while the client starts up
+    loop.run_in_executor(None, prewarm)
+    threading.Thread(target=_read_messages, args=(stdin, loop, server), daemon=True).start()
+    return await server.exited
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Language server reporting code smells as diagnostics (LSP over stdio).")
+    parser.add_argument("--stdio", action="store_true", help="Accepted for editor compatibility; stdio is the only transport")
+    parser.add_argument("--debounce", type=float, default=None, help="Seconds of quiet after an edit before analyzing (default: ANALYSIS_LSP_DEBOUNCE or 0.2)")
+    args = parser.parse_args(argv)
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    # Stray prints must not corrupt the protocol stream
+    sys.stdout = sys.stderr
+    code = asyncio.run(serve(stdin, stdout, args.debounce))
+    # The reader thread may still be blocked on stdin: leave without
+    # waiting for it (interpreter shutdown would trip over its lock)
+    stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,51 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+import functools
+import os
+import asyncio
+import json
+import tarfile
+import time
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 # Fix potential import error if running from different dirs
 try:
-    from analyzer import analyze_code
+    from analyzer import analyze_code, analyze_sources, analyze_incremental, analyze_stream, replay_stream, summarize_reports
+    import inputs
+    from pool import AnalysisPool, PoolBusy, WorkerLost, POOL_SETTINGS, chunked
+    from cache import ResultCache, cache_key
+    from jobs import JobStore, JobRunner, JOB_SETTINGS, tar_sources
+    from watch import Workspace, WatchDaemon
+    import columnar
+    import metrics
 except ImportError:
-    from .analyzer import analyze_code
+    from .analyzer import analyze_code, analyze_sources, analyze_incremental, analyze_stream, replay_stream, summarize_reports
+    from . import inputs
+    from .pool import AnalysisPool, PoolBusy, WorkerLost, POOL_SETTINGS, chunked
+    from .cache import ResultCache, cache_key
+    from .jobs import JobStore, JobRunner, JOB_SETTINGS, tar_sources
+    from .watch import Workspace, WatchDaemon
+    from . import columnar, metrics
 
 app = FastAPI(title="Code Smell Detector API")
 
+# CPU-bound analysis runs here so the event loop keeps serving other requests
+pool = AnalysisPool()
+# Resubmitted sources are answered from here without parsing again
+cache = ResultCache()
+# Per-declaration smells of recent documents, keyed by the token returned to the client
+sessions = ResultCache(max_entries=int(os.environ.get("ANALYSIS_SESSIONS", 256)), directory="")
+# Repository analyses submitted through /api/jobs, worked off in the background
+jobs = JobStore()
+runner = JobRunner(jobs, pool, analyze_sources, check=lambda source_code: check_source(source_code, max_lines=0),
+                   cache=cache, cache_key=cache_key, timeout=POOL_SETTINGS["BATCH_TIMEOUT"])
+# Local development: with ANALYSIS_WATCH_DIR set, that tree is kept analyzed and
+# changes are pushed through /api/watch/events (SSE) and /api/watch/socket
+WATCH_DIR = os.environ.get("ANALYSIS_WATCH_DIR") or None
+watcher = WatchDaemon(Workspace(WATCH_DIR)) if WATCH_DIR else None
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -19,21 +55,383 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    if route is not None and request.method == "POST":
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=route.path)
+    return response
+
 class CodeRequest(BaseModel):
     sourceCode: str
 
+class FileEntry(BaseModel):
+    path: str
+    sourceCode: str
+
+class BatchRequest(BaseModel):
+    files: List[FileEntry]
+
+class IncrementalRequest(BaseModel):
+    sourceCode: str
+    previousToken: Optional[str] = None
+
+# Input budgets (Configurable through the environment)
+# The JSON endpoints keep the line limit; /api/analyze/large only applies the byte budget
+# ANALYSIS_MAX_LINES=0 lifts the line limit everywhere
+MAX_LINES = int(os.environ.get("ANALYSIS_MAX_LINES", 500))
+MAX_BYTES = int(os.environ.get("ANALYSIS_MAX_BYTES", 2 * 1024 * 1024))
+LARGE_TIMEOUT = float(os.environ.get("ANALYSIS_LARGE_TIMEOUT", 120))
+
+def check_source(source_code: str, max_lines=MAX_LINES):
+    # Returns an error message for unacceptable input, None otherwise
+    return inputs.check_source(source_code, MAX_BYTES, max_lines)
+
+def requested(http_request: Request, name: str):
+    # Instrumentation is turned on by ?name=1 or an X-Analysis-Name: 1 header
+    value = http_request.query_params.get(name) or http_request.headers.get(f"x-analysis-{name}")
+    return value is not None and value.lower() in ("1", "true", "yes", "on")
+
+def requested_format(http_request: Request):
+    # ?format=columnar|msgpack or an Accept: application/msgpack header; None for the usual JSON shape
+    name = http_request.query_params.get("format")
+    if name is None and columnar.MSGPACK_MEDIA_TYPE in http_request.headers.get("accept", ""):
+        name = "msgpack"
+    if name in (None, "json"):
+        return None
+    if name not in ("columnar", "msgpack"):
+        raise HTTPException(status_code=400, detail="Unknown format (expected json, columnar or msgpack)")
+    if name == "msgpack" and columnar.msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack output is not available on this server")
+    return name
+
+def columnar_response(name: str, reports, extra):
+    # The reports as one SmellTable, with the other response fields (summary, paging) beside it
+    table = columnar.table_of(reports)
+    if name == "msgpack":
+        return Response(table.to_msgpack(extra), media_type=columnar.MSGPACK_MEDIA_TYPE)
+    return dict(table.as_dict(), **extra)
+
 @app.post("/api/analyze")
 @app.post("/analyze")
-async def analyze_endpoint(request: CodeRequest):
-    if not request.sourceCode.strip():
-        raise HTTPException(status_code=400, detail="Source code cannot be empty")
-    
-    # Limit check (academic constraint)
-    if len(request.sourceCode.splitlines()) > 500:
-        raise HTTPException(status_code=400, detail="Source code exceeds 500 lines limit")
-
-    result = analyze_code(request.sourceCode)
-    return result
+async def analyze_endpoint(request: CodeRequest, http_request: Request):
+    problem = check_source(request.sourceCode)
+    if problem:
+        raise HTTPException(status_code=400, detail=problem)
+    return await analyze_source(request.sourceCode, http_request)
+
+async def read_body(http_request: Request, limit: int, what="Source code"):
+    # Read as it arrives so an oversized upload is refused after `limit`
+    # bytes instead of being buffered whole
+    declared = http_request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=413, detail=f"{what} exceeds {limit} bytes limit")
+    chunks = []
+    received = 0
+    async for chunk in http_request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail=f"{what} exceeds {limit} bytes limit")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def is_json(http_request: Request):
+    return http_request.headers.get("content-type", "").startswith("application/json")
+
+async def read_source(http_request: Request):
+    # Raw body (text/plain, or JSON with sourceCode)
+    body = await read_body(http_request, MAX_BYTES)
+
+    if is_json(http_request):
+        try:
+            source_code = json.loads(body)["sourceCode"]
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Expected a JSON object with sourceCode")
+        if not isinstance(source_code, str):
+            raise HTTPException(status_code=400, detail="sourceCode must be a string")
+    else:
+        source_code = body.decode("utf-8", errors="replace")
+    del body
+
+    problem = check_source(source_code, max_lines=0)
+    if problem:
+        raise HTTPException(status_code=400, detail=problem)
+    return source_code
+
+@app.post("/api/analyze/large")
+@app.post("/analyze/large")
+async def analyze_large_endpoint(http_request: Request):
+    source_code = await read_source(http_request)
+    return await analyze_source(source_code, http_request, timeout=LARGE_TIMEOUT)
+
+# Streamed analyses step through the detectors in a thread of this process
+# (results cannot stream out of the pool); at most STREAMS run at once
+STREAMS = int(os.environ.get("ANALYSIS_STREAMS", 2))
+stream_slots = asyncio.Semaphore(STREAMS)
+
+def sse_event(event: str, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/analyze/stream")
+@app.post("/analyze/stream")
+async def analyze_stream_endpoint(http_request: Request):
+    # Same input as /api/analyze/large; answers with Server-Sent Events:
+    # "parsed", one "smell" per smell as it is found, then "summary" (or "error")
+    source_code = await read_source(http_request)
+    key = cache_key(source_code)
+    cached = cache.get(key)
+    if cached is None and stream_slots.locked():
+        raise HTTPException(status_code=503, detail="Too many streamed analyses in progress", headers={"Retry-After": "1"})
+    return StreamingResponse(stream_events(source_code, key, cached), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def stream_events(source_code: str, key: str, cached):
+    if cached is not None:
+        for event, data in replay_stream(cached):
+            yield sse_event(event, data)
+        return
+    async with stream_slots:
+        events = analyze_stream(source_code)
+        try:
+            while True:
+                item = await asyncio.to_thread(next, events, None)
+                if item is None:
+                    break
+                event, data = item
+                if event == "report":
+                    cache.put(key, data)
+                    continue
+                if event == "error":
+                    cache.put(key, data)
+                yield sse_event(event, data)
+        except Exception as e:
+            # The response has started; the failure can only be reported in the stream
+            yield sse_event("error", {"error": f"Runtime Error: {str(e)}"})
+
+async def analyze_source(source_code: str, http_request: Request, timeout=None):
+    profile = requested(http_request, "profile")
+    instrumented = profile or requested(http_request, "timings")
+
+    key = cache_key(source_code)
+    # Instrumented requests always measure a real analysis
+    result = None if instrumented else cache.get(key)
+    timings = None
+    if result is None:
+        submitted = time.perf_counter()
+        result = await run_in_pool(
+            functools.partial(analyze_code, timings="rules" if instrumented else "phases", profile=profile),
+            source_code, timeout=timeout)
+        timings = result.pop("timings")
+        timings["queue"] = max(0.0, time.perf_counter() - submitted - timings["total"])
+        cache.put(key, result)
+
+    start = time.perf_counter()
+    body = json.dumps(result)
+    if timings is not None:
+        timings["serialize"] = time.perf_counter() - start
+        metrics.observe_timings(timings)
+        if instrumented:
+            body = json.dumps(dict(result, timings=timings))
+    return Response(body, media_type="application/json")
+
+@app.post("/api/analyze/batch")
+@app.post("/analyze/batch")
+async def analyze_batch_endpoint(request: BatchRequest, http_request: Request):
+    if not request.files:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one file")
+    wire_format = requested_format(http_request)
+
+    # Invalid files are reported individually instead of failing the whole batch
+    reports = [None] * len(request.files)
+    pending = []
+    for i, entry in enumerate(request.files):
+        problem = check_source(entry.sourceCode)
+        if problem:
+            reports[i] = inputs.error_report(entry.path, entry.sourceCode, problem)
+            continue
+
+        key = cache_key(entry.sourceCode)
+        cached = cache.get(key)
+        if cached is not None:
+            reports[i] = dict(cached, path=entry.path)
+        else:
+            pending.append((i, entry, key))
+
+    if pending:
+        # A few chunks per worker: enough to balance load, few enough to fit the queue
+        chunks = chunked([e.sourceCode for _, e, _ in pending], max(pool.workers, 1) * 2)
+        results = await run_in_pool(analyze_sources, chunks, many=True, timeout=pool.batch_timeout(len(pending)))
+        results = [report for chunk in results for report in chunk]
+        for (i, entry, key), report in zip(pending, results):
+            cache.put(key, report)
+            reports[i] = dict(report, path=entry.path)
+
+    if wire_format:
+        return columnar_response(wire_format, reports, {"summary": summarize_reports(reports)})
+    return {
+        "summary": summarize_reports(reports),
+        "files": reports
+    }
+
+@app.post("/api/analyze/incremental")
+@app.post("/analyze/incremental")
+async def analyze_incremental_endpoint(request: IncrementalRequest):
+    problem = check_source(request.sourceCode)
+    if problem:
+        raise HTTPException(status_code=400, detail=problem)
+
+    # An unknown or expired token just means a full analysis
+    previous = sessions.get(request.previousToken) if request.previousToken else None
+    report, entries = await run_in_pool(functools.partial(analyze_incremental, previous=previous), request.sourceCode)
+
+    token = cache_key(request.sourceCode)
+    sessions.put(token, entries)
+    report["token"] = token
+    report["incremental"]["previousFound"] = previous is not None
+    return report
+
+async def run_in_pool(fn, arg, many=False, timeout=None):
+    try:
+        if many:
+            return await pool.run_many(fn, arg, timeout=timeout)
+        return await pool.run(fn, arg, timeout=timeout)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+    except MemoryError:
+        # Raised inside a worker capped by ANALYSIS_WORKER_MEMORY_MB
+        raise HTTPException(status_code=413, detail="Analysis exceeded the worker memory limit")
+    except WorkerLost as e:
+        # The pool starts new workers for the next request
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+@app.post("/api/jobs")
+@app.post("/jobs")
+async def submit_job_endpoint(http_request: Request):
+    # A tar archive of the repository (any compression), or JSON {"files": [{path, sourceCode}]}
+    body = await read_body(http_request, JOB_SETTINGS["MAX_BYTES"], "Job upload")
+    # Unpacking an upload and the SQLite calls run in threads so they do not stall the event loop
+    files = await asyncio.to_thread(parse_job_files, body, is_json(http_request))
+    if not files:
+        raise HTTPException(status_code=400, detail="Job must contain at least one .java file")
+    job_id = await asyncio.to_thread(jobs.submit, files)
+    runner.notify()
+    return JSONResponse(status_code=202, content=await asyncio.to_thread(jobs.status, job_id), headers={"Location": f"/api/jobs/{job_id}"})
+
+def parse_job_files(body: bytes, json_body: bool):
+    if json_body:
+        try:
+            request = BatchRequest(**json.loads(body))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Expected a JSON object with files")
+        return [(entry.path, entry.sourceCode) for entry in request.files]
+    try:
+        return list(tar_sources(body))
+    except (tarfile.TarError, EOFError, OSError):
+        raise HTTPException(status_code=400, detail="Expected a tar archive or a JSON object with files")
+
+@app.get("/api/jobs/{job_id}")
+@app.get("/jobs/{job_id}")
+def job_status_endpoint(job_id: str):
+    status = jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return status
+
+@app.get("/api/jobs/{job_id}/results")
+@app.get("/jobs/{job_id}/results")
+def job_results_endpoint(job_id: str, http_request: Request, offset: int = 0, limit: int = 100):
+    status = jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    wire_format = requested_format(http_request)
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), 1000)
+    # Reports are stored as JSON and passed through without decoding
+    reports = jobs.results(job_id, offset, limit)
+    following = offset + len(reports)
+    page = {
+        "id": job_id,
+        "status": status["status"],
+        "offset": offset,
+        "limit": limit,
+        "next": following if following < status["progress"]["done"] else None
+    }
+    if wire_format:
+        return columnar_response(wire_format, [json.loads(report) for report in reports], page)
+    body = json.dumps(page)[:-1] + ', "files": [' + ",".join(reports) + "]}"
+    return Response(body, media_type="application/json")
+
+@app.delete("/api/jobs/{job_id}")
+@app.delete("/jobs/{job_id}")
+def delete_job_endpoint(job_id: str):
+    if not jobs.delete(job_id):
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {"id": job_id, "status": "deleted"}
+
+def watching():
+    if watcher is None:
+        raise HTTPException(status_code=404, detail="Watch mode is off (set ANALYSIS_WATCH_DIR)")
+    return watcher
+
+@app.get("/api/watch")
+@app.get("/watch")
+async def watch_snapshot_endpoint():
+    # Every report of the watched tree as it stands
+    return await asyncio.to_thread(watching().workspace.snapshot)
+
+@app.get("/api/watch/events")
+@app.get("/watch/events")
+async def watch_events_endpoint():
+    # Server-Sent Events: "snapshot", then "file", "removed", "project" and "ready" (see watch.py)
+    events = watching().events()
+    return StreamingResponse((sse_event(event["event"], event) async for event in events), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/api/watch/socket")
+@app.websocket("/watch/socket")
+async def watch_socket_endpoint(websocket: WebSocket):
+    # The same events as JSON messages (needs uvicorn with WebSocket support, e.g. uvicorn[standard])
+    if watcher is None:
+        await websocket.close(code=1008, reason="Watch mode is off")
+        return
+    await websocket.accept()
+    try:
+        async for event in watcher.events():
+            await websocket.send_json(event)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+@app.on_event("startup")
+def start_jobs():
+    runner.start()
+    if watcher is not None:
+        watcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_pool():
+    if watcher is not None:
+        await watcher.stop()
+    await runner.stop()
+    pool.shutdown()
+
+@app.get("/metrics")
+@app.get("/api/metrics")
+def metrics_endpoint():
+    stats = cache.stats()
+    text = metrics.render(extra=[
+        ("analysis_cache_hits_total", "Reports served from the memory cache.", stats["hits"]),
+        ("analysis_cache_disk_hits_total", "Reports served from the disk cache.", stats["diskHits"]),
+        ("analysis_cache_misses_total", "Cache lookups that needed an analysis.", stats["misses"]),
+    ])
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache")
+def cache_stats():
+    return cache.stats()
 
 @app.get("/api")
 def api_root():
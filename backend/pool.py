@@ -0,0 +1,202 @@
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Pool settings (Configurable through the environment)
+# ANALYSIS_WORKERS=0 runs analyses in threads, for hosts without multiprocessing
+POOL_SETTINGS = {
+    "WORKERS": int(os.environ.get("ANALYSIS_WORKERS", os.cpu_count() or 1)),
+    "QUEUE_DEPTH": int(os.environ.get("ANALYSIS_QUEUE_DEPTH", 0)) or None,
+    "TIMEOUT": float(os.environ.get("ANALYSIS_TIMEOUT", 30)),
+    "BATCH_TIMEOUT": float(os.environ.get("ANALYSIS_BATCH_TIMEOUT", 300)),
+    # Address-space cap per worker process in MB; 0 leaves workers unlimited
+    "WORKER_MEMORY_MB": int(os.environ.get("ANALYSIS_WORKER_MEMORY_MB", 0)),
+}
+
+
+class PoolBusy(Exception):
+    """Raised when the pool already holds its maximum number of pending analyses."""
+
+
+class WorkerLost(Exception):
+    """Raised when a worker process died (killed, crashed) before finishing an analysis."""
+
+
+def _limit_memory(megabytes):
+    # Runs in each worker: an oversized input then fails with MemoryError
+    # inside that worker instead of pushing the whole host into swap
+    try:
+        import resource
+    except ImportError:
+        return
+    limit = megabytes * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _start_worker(memory_mb, warmup):
+    if memory_mb:
+        _limit_memory(memory_mb)
+    if warmup is not None:
+        warmup()
+
+
+def _noop():
+    return None
+
+
+class AnalysisPool:
+    """
+    Runs CPU-bound analysis outside the event loop.
+    Tracks submitted-but-unfinished jobs so callers can shed load once
+    `queue_depth` is reached instead of letting latency grow without bound.
+    """
+
+    def __init__(self, workers=None, queue_depth=None, timeout=None, memory_mb=None, warmup=None):
+        self.workers = POOL_SETTINGS["WORKERS"] if workers is None else workers
+        self.memory_mb = POOL_SETTINGS["WORKER_MEMORY_MB"] if memory_mb is None else memory_mb
+        # Picklable callable each worker process runs once when it starts
+        self.warmup = warmup
+        self.queue_depth = queue_depth or POOL_SETTINGS["QUEUE_DEPTH"] or max(self.workers, 1) * 4
+        self.timeout = timeout or POOL_SETTINGS["TIMEOUT"]
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.workers > 0:
+                try:
+                    # spawn: forking a process that already runs threads can deadlock
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_start_worker if self.memory_mb or self.warmup else None,
+                        initargs=(self.memory_mb, self.warmup) if self.memory_mb or self.warmup else ())
+                except (OSError, NotImplementedError):
+                    # Platforms without multiprocessing support (e.g. serverless sandboxes)
+                    self.workers = 0
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor
+
+    def prewarm(self):
+        """
+        Starts every worker process now, so they import and warm up while the
+        instance initializes instead of one by one as the first requests come in.
+        """
+        executor = self._get_executor()
+        if self.workers > 0:
+            # One task per worker: the executor only starts a new process when none is idle
+            concurrent.futures.wait([executor.submit(_noop) for _ in range(self.workers)])
+
+    def _reserve(self, count):
+        with self._lock:
+            if self._pending + count > self.queue_depth:
+                raise PoolBusy(f"Analysis queue is full ({self._pending}/{self.queue_depth} pending)")
+            self._pending += count
+
+    def _release(self, _future=None, count=1):
+        with self._lock:
+            self._pending -= count
+
+    def _discard(self, executor):
+        # A process pool with a dead worker refuses all further work; the next
+        # submission starts a fresh one (the broken one has stopped its workers)
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def _finished(self, executor, future):
+        self._release()
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._discard(executor)
+
+    def _submit(self, fn, *args):
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # Broke since the last submission
+                self._discard(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args)
+        except BaseException:
+            # Never submitted (executor broken or shut down): no callback will free the slot
+            self._release()
+            raise
+        # The slot is freed when the work really ends, not when the caller stops waiting
+        future.add_done_callback(functools.partial(self._finished, executor))
+        return asyncio.wrap_future(future)
+
+    async def run(self, fn, *args, timeout=None):
+        """
+        Runs fn(*args) in the pool. Raises PoolBusy when the queue is full,
+        asyncio.TimeoutError when the result takes longer than `timeout` and
+        WorkerLost when the worker process died meanwhile.
+        """
+        self._reserve(1)
+        try:
+            return await asyncio.wait_for(self._submit(fn, *args), timeout or self.timeout)
+        except BrokenProcessPool as e:
+            raise WorkerLost("Analysis worker stopped unexpectedly") from e
+
+    def batch_timeout(self, files):
+        # The per-file timeout for every file one worker gets, capped by ANALYSIS_BATCH_TIMEOUT
+        rounds = -(-files // max(self.workers, 1))
+        return min(self.timeout * max(rounds, 1), POOL_SETTINGS["BATCH_TIMEOUT"])
+
+    async def run_many(self, fn, items, timeout=None):
+        """
+        Runs fn(item) for every item, reserving all slots up front so a batch
+        is either accepted as a whole or rejected with PoolBusy.
+        """
+        items = list(items)
+        self._reserve(len(items))
+        futures = []
+        try:
+            for item in items:
+                futures.append(self._submit(fn, item))
+        except BaseException:
+            # _submit freed the slot of the item that failed; free the ones never tried
+            # and cancel the rest of the batch, whose callbacks free their own
+            self._release(count=len(items) - len(futures) - 1)
+            for future in futures:
+                future.cancel()
+            raise
+        try:
+            return await asyncio.wait_for(asyncio.gather(*futures), timeout or POOL_SETTINGS["BATCH_TIMEOUT"])
+        except asyncio.TimeoutError:
+            for future in futures:
+                future.cancel()
+            raise
+        except BrokenProcessPool as e:
+            raise WorkerLost("Analysis worker stopped unexpectedly") from e
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def chunked(items, count):
+    """Splits items into at most `count` contiguous chunks of similar size."""
+    items = list(items)
+    count = max(1, min(count, len(items)))
+    size, extra = divmod(len(items), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
@@ -0,0 +1,78 @@
+import collections
+import os
+import sys
+import threading
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler for the calling thread.
+    A background thread snapshots the profiled thread's stack every
+    `interval` seconds; functions seen most often are where time went.
+
+        with SamplingProfiler() as profiler:
+            work()
+        profiler.hottest(10)
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = 0
+        self._self_counts = collections.Counter()
+        self._total_counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+
+    def __enter__(self):
+        # The sampler can only run when the profiled thread releases the GIL,
+        # so switch threads as often as we want samples while profiling
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            self.samples += 1
+            self._self_counts[_describe(frame.f_code)] += 1
+            seen = set()
+            while frame is not None:
+                key = _describe(frame.f_code)
+                if key not in seen:
+                    seen.add(key)
+                    self._total_counts[key] += 1
+                frame = frame.f_back
+
+    def hottest(self, limit=15):
+        """
+        Functions ordered by samples in which they were on top of the stack,
+        with their share of all samples, inclusive and exclusive of callees.
+        """
+        if not self.samples:
+            return []
+        rows = []
+        for key, own in self._self_counts.most_common(limit):
+            rows.append({
+                "function": key,
+                "selfSamples": own,
+                "selfPercent": round(own * 100 / self.samples, 1),
+                "totalPercent": round(self._total_counts[key] * 100 / self.samples, 1)
+            })
+        return rows
+
+
+def _describe(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
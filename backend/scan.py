@@ -0,0 +1,333 @@
+"""
+Command-line scanner for whole source trees.
+
+    python scan.py path/to/repo [more/paths ...] [-j JOBS] [-o results.ndjson]
+
+Every .java file found is analyzed with analyze_code in worker processes.
+One JSON report per file is streamed as NDJSON (stdout by default) as soon as
+it is ready, and a per-smell-type summary is printed to stderr at the end.
+With --clones, the normalized tokens of every file are also compared to
+report copy-paste between files, renamed identifiers and changed literals
+included, as {"clone": {...}} records written after the file reports. With --project (or --index FILE, which
+keeps the project index between runs) smells that span files are reported
+as {"projectSmell": {...}} records. Every path given is analyzed again; to
+update an index cheaply, pass only the files that changed since the last run.
+--ast-cache DIR stores parsed trees on disk, so a rerun over mostly
+unchanged files skips parsing them and only runs the detectors. --quick
+skips parsing altogether and only runs the rules that work on tokens.
+Diff mode (--base REV [--head REV], or --diff FILE) only analyzes the files
+a change touched and reports the smells it introduced (see changes.py).
+--format columnar (JSON) or msgpack writes one compact columnar table
+(see columnar.py) at the end instead of the NDJSON stream, with the clone
+and project smell records as "clones" / "projectSmells" lists beside it.
+Only a bounded number of files is in flight at any time, so apart from the
+--clones token codes (12 bytes per token) memory stays constant regardless
+of the size of the tree.
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from analyzer import analyze_code, ReportSummary
+from cache import ResultCache
+from changes import git_changes, diff_changes, analyze_changes
+from clones import TokenCloneIndex
+import columnar
+from smells import THRESHOLDS
+from symbols import ProjectIndex
+
+JAVA_SUFFIX = ".java"
+
+
+def iter_java_files(roots):
+    """
+    Lazily yields .java file paths under the given roots (files are passed through).
+    """
+    for root in roots:
+        if os.path.isfile(root):
+            yield root
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            # Skip hidden and build directories; sort for a stable output order
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d not in ("build", "target", "node_modules"))
+            for name in sorted(filenames):
+                if name.endswith(JAVA_SUFFIX):
+                    yield os.path.join(dirpath, name)
+
+
+def scan_file(path, fingerprints=False, symbols=False, quick=False):
+    """
+    Returns (report, fingerprints); fingerprints are the compact token codes
+    used by the cross-file clone index, or None when not requested or when
+    the file could not be parsed.
+    With `symbols`, the report carries the file's symbols for a ProjectIndex.
+    `quick` runs the token-level rules only, without parsing (see analyze_code).
+    """
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            source_code = f.read()
+    except OSError as e:
+        return {
+            "path": path,
+            "error": f"Read Error: {e.strerror}",
+            "summary": {"totalLines": 0, "totalSmells": 0},
+            "smells": []
+        }, None
+    report = analyze_code(source_code, symbols=symbols, clone_tokens=fingerprints, quick=quick)
+    report["path"] = path
+    return report, report.pop("cloneTokens", None)
+
+
+def scan_files(paths, fingerprints=False, symbols=False, quick=False):
+    # One pool job: workers read the files themselves so sources never pass through the parent
+    return [scan_file(path, fingerprints, symbols, quick) for path in paths]
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def scan(roots, jobs=None, chunk_size=8, fingerprints=False, symbols=False, quick=False):
+    """
+    Yields one (report, fingerprints) pair per .java file under `roots`, in
+    completion order. At most jobs * 2 chunks are in flight at once.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    chunks = _chunks(iter_java_files(roots), chunk_size)
+
+    if jobs == 1:
+        for chunk in chunks:
+            yield from scan_files(chunk, fingerprints, symbols, quick)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_flight = set()
+        for chunk in chunks:
+            in_flight.add(pool.submit(scan_files, chunk, fingerprints, symbols, quick))
+            if len(in_flight) >= jobs * 2:
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        for future in concurrent.futures.as_completed(in_flight):
+            yield from future.result()
+
+
+def print_summary(summary, elapsed, out, clone_count=None, project_count=None):
+    data = summary.as_dict()
+    out.write(f"\nScanned {data['totalFiles']} files ({data['totalLines']} lines) in {elapsed:.1f}s\n")
+    if data["filesWithErrors"]:
+        out.write(f"Files with errors: {data['filesWithErrors']}\n")
+    out.write(f"Total smells: {data['totalSmells']}\n")
+    if clone_count is not None:
+        out.write(f"Cross-file clones: {clone_count}\n")
+    if project_count is not None:
+        out.write(f"Cross-file smells: {project_count}\n")
+    width = max((len(t) for t in data["smellsByType"]), default=0)
+    for smell_type, count in sorted(data["smellsByType"].items(), key=lambda kv: (-kv[1], kv[0])):
+        out.write(f"  {smell_type.ljust(width)}  {count}\n")
+
+
+class NdjsonOutput:
+    """One JSON line per report and per {"clone"|"projectSmell": ...} record, written as they come."""
+
+    def __init__(self, out):
+        self.out = out
+
+    def report(self, report):
+        self.out.write(json.dumps(report, separators=(",", ":")))
+        self.out.write("\n")
+
+    def record(self, kind, value):
+        self.out.write(json.dumps({kind: value}, separators=(",", ":")))
+        self.out.write("\n")
+
+    def close(self):
+        pass
+
+
+class ColumnarOutput:
+    """Collects the reports into a SmellTable and writes it once, on close()."""
+
+    # Record kind -> list it is collected in
+    RECORDS = {"clone": "clones", "projectSmell": "projectSmells"}
+
+    def __init__(self, out, binary=False):
+        self.out = out
+        self.binary = binary
+        self.table = columnar.SmellTable()
+        self.records = {}
+
+    def report(self, report):
+        self.table.add_report(report)
+
+    def record(self, kind, value):
+        self.records.setdefault(self.RECORDS[kind], []).append(value)
+
+    def close(self):
+        if self.binary:
+            self.out.write(self.table.to_msgpack(self.records))
+        else:
+            data = self.table.as_dict()
+            data.update(self.records)
+            self.out.write(json.dumps(data, separators=(",", ":")))
+            self.out.write("\n")
+
+
+def open_output(args):
+    """(output, file to close or None) for --output and --format."""
+    binary = args.format == "msgpack"
+    if args.output == "-":
+        out, owned = (sys.stdout.buffer if binary else sys.stdout), None
+    else:
+        out = owned = open(args.output, "wb") if binary else open(args.output, "w", encoding="utf-8")
+    if args.format == "ndjson":
+        return NdjsonOutput(out), owned
+    return ColumnarOutput(out, binary=binary), owned
+
+
+def scan_changes(args, out):
+    """
+    Diff mode of main(): writes one report per changed file with only the
+    smells the change introduced. Returns the ReportSummary of those reports.
+    """
+    root = args.paths[0] if args.paths else "."
+    if args.diff:
+        if args.diff == "-":
+            text = sys.stdin.read()
+        else:
+            with open(args.diff, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        changes = diff_changes(text, root)
+    else:
+        changes = git_changes(root, args.base, args.head)
+
+    summary = ReportSummary()
+    cache = ResultCache(directory=args.cache) if args.cache is not None else ResultCache()
+    for report in analyze_changes(changes, cache, jobs=args.jobs):
+        summary.add(report)
+        out.report(report)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a directory tree of Java files for code smells.")
+    parser.add_argument("paths", nargs="*", help="Directories or .java files to scan (diff mode: the repository or tree the diff applies to, default: .)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--format", choices=("ndjson", "columnar", "msgpack"), default="ndjson",
+                        help="ndjson: one report per line as it is ready (default); columnar: one compact JSON table; "
+                             "msgpack: the same table as MessagePack")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Files per worker job (default: 8)")
+    parser.add_argument("--clones", action="store_true", help="Also report duplicated code between files")
+    parser.add_argument("--project", action="store_true", help="Also report smells that span files (dead package methods, ...)")
+    parser.add_argument("--index", help="Project index file to update and reuse across runs (implies --project); the files given replace their entries, so pass only changed files to update it")
+    parser.add_argument("--ast-cache", help="Directory caching parsed files between runs")
+    parser.add_argument("--quick", action="store_true",
+                        help="Only run the rules that need no parse (Switch Statements, Duplicate Code, Message Chains): "
+                             "several times faster, e.g. for pre-commit hooks")
+    parser.add_argument("--base", help="Diff mode: only report smells introduced since this git revision")
+    parser.add_argument("--head", help="Diff mode: revision compared with --base (default: the working tree)")
+    parser.add_argument("--diff", help="Diff mode: unified diff file (- for stdin) of the changes in the tree on disk")
+    parser.add_argument("--cache", help="Diff mode: directory caching reports between runs (default: ANALYSIS_CACHE_DIR)")
+    parser.add_argument("--exit-code", action="store_true", help="Diff mode: exit with 1 when the change introduces smells")
+    args = parser.parse_args(argv)
+    diff_mode = bool(args.base or args.diff)
+    if args.head and not args.base:
+        parser.error("--head needs --base")
+    if args.base and args.diff:
+        parser.error("use either --base or --diff")
+    if diff_mode and (len(args.paths) > 1 or args.clones or args.project or args.index):
+        parser.error("diff mode takes a single repository path and no --clones/--project/--index")
+    if args.quick and (diff_mode or args.project or args.index):
+        parser.error("--quick cannot be combined with diff mode or --project/--index")
+    if not diff_mode and not args.paths:
+        parser.error("the following arguments are required: paths")
+    if args.format == "msgpack" and columnar.msgpack is None:
+        parser.error("--format msgpack needs the msgpack package (pip install msgpack)")
+
+    if args.ast_cache:
+        # Read by every worker process on its first parse
+        os.environ["ANALYSIS_AST_CACHE_DIR"] = args.ast_cache
+
+    out, owned = open_output(args)
+    if diff_mode:
+        start = time.perf_counter()
+        try:
+            summary = scan_changes(args, out)
+        except subprocess.CalledProcessError as e:
+            sys.stderr.write(f"git failed: {e.stderr.decode('utf-8', 'replace').strip()}\n")
+            return 2
+        except (OSError, ValueError) as e:
+            sys.stderr.write(f"Diff Error: {e}\n")
+            return 2
+        else:
+            out.close()
+        finally:
+            if owned is not None:
+                owned.close()
+        print_summary(summary, time.perf_counter() - start, sys.stderr)
+        return 1 if args.exit_code and summary.as_dict()["totalSmells"] else 0
+
+    summary = ReportSummary()
+    index = TokenCloneIndex(THRESHOLDS["DUPLICATE_CODE_TOKENS"]) if args.clones else None
+    clone_count = 0
+    project = None
+    if args.index:
+        project = ProjectIndex.load(args.index)
+        # Files deleted since the last run must not keep their calls alive
+        project.prune()
+    elif args.project:
+        project = ProjectIndex()
+    project_count = 0
+    start = time.perf_counter()
+    try:
+        for report, fingerprints in scan(args.paths, jobs=args.jobs, chunk_size=max(1, args.chunk_size),
+                                         fingerprints=args.clones, symbols=project is not None, quick=args.quick):
+            symbols = report.pop("symbols", None)
+            if project is not None:
+                if symbols is not None:
+                    project.update(report["path"], symbols)
+                else:
+                    # Unreadable or unparsable now: forget what the last version declared
+                    project.remove(report["path"])
+            summary.add(report)
+            out.report(report)
+            if index is not None and fingerprints is not None:
+                index.add_fingerprints(report["path"], *fingerprints)
+        if index is not None:
+            # Compared in one pass once every file is in
+            for clone in index.clones():
+                # Clones inside one file are already reported as Duplicate Code smells
+                if clone.other_path != clone.path:
+                    clone_count += 1
+                    out.record("clone", clone.as_dict())
+        if project is not None:
+            for smell in project.smells():
+                project_count += 1
+                out.record("projectSmell", smell)
+            if args.index:
+                project.save(args.index)
+        out.close()
+    finally:
+        if owned is not None:
+            owned.close()
+
+    print_summary(summary, time.perf_counter() - start, sys.stderr, clone_count if index is not None else None,
+                  project_count if project is not None else None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
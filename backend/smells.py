@@ -1,6 +1,9 @@
-import javalang
-from javalang.tree import MethodDeclaration, ClassDeclaration, SwitchStatement, FormalParameter, BasicType, ReferenceType, MemberReference, MethodInvocation, ThrowStatement, ClassCreator
+from javalang.tokenizer import Keyword, Operator
+from javalang.tree import MethodDeclaration, ClassDeclaration, BasicType, ReferenceType, ThrowStatement, ClassCreator
 import collections
+from engine import Rule, run_rules, iter_rules
+from clones import CloneIndex, TokenCloneIndex, line_fingerprints, token_fingerprints
+from codemetrics import MetricsTable
 
 # Thresholds (Configurable)
 THRESHOLDS = {
@@ -10,62 +13,74 @@ THRESHOLDS = {
     "LONG_PARAMETER_LIST": 4,
     "SWITCH_CASES": 5,
     "DUPLICATE_CODE_BLOCK": 6,
+    "DUPLICATE_CODE_TOKENS": 50,
     "DATA_CLUMP_FIELDS": 3,
     "MESSAGE_CHAIN_LENGTH": 3,
-    "LAZY_CLASS_METHODS": 3
+    "LAZY_CLASS_METHODS": 3,
+    "FEATURE_ENVY_ACCESSES": 3,
+    "MIDDLE_MAN_DELEGATES": 3
 }
 
-def detect_bloaters(tree, source_code_lines):
-    smells = []
-    
+# ---------------------------------------------------------------------------
+# Bloaters
+# ---------------------------------------------------------------------------
+
+class LongMethodRule(Rule):
     # 1. Long Method & 2. Long Parameter List (Existing)
-    for path, node in tree.filter(MethodDeclaration):
-        # Long Method Heuristic
-        if node.position:
-            start_line = node.position.line
-            end_line = start_line
-            if node.body:
-                for statement in node.body:
-                     if hasattr(statement, 'position') and statement.position:
-                         end_line = max(end_line, statement.position.line)
-            length = (end_line - start_line) + 2 
-            
+    node_types = (MethodDeclaration,)
+    scope = MethodDeclaration
+
+    def visit(self, node, ancestors):
+        method = self.metrics.method(node)
+        # Long Method: from the declaration to its closing brace
+        if method.start_line:
+            length = method.loc
             if length > THRESHOLDS["LONG_METHOD"]:
-                 smells.append({
+                 self.smells.append({
                     "type": "Long Method",
                     "location": f"{node.name}()",
                     "severity": "High" if length > THRESHOLDS["LONG_METHOD"] * 2 else "Medium",
-                    "reason": f"Method length estimated at {length} lines",
+                    "reason": f"Method spans {length} lines",
                     "suggestedRefactoring": "Extract Method"
                 })
 
         # Long Parameter List
-        if len(node.parameters) > THRESHOLDS["LONG_PARAMETER_LIST"]:
-            smells.append({
+        if method.parameter_count > THRESHOLDS["LONG_PARAMETER_LIST"]:
+            self.smells.append({
                 "type": "Long Parameter List",
                 "location": f"{node.name}()",
                 "severity": "Medium",
-                "reason": f"Method has {len(node.parameters)} parameters",
+                "reason": f"Method has {method.parameter_count} parameters",
                 "suggestedRefactoring": "Introduce Parameter Object"
             })
 
+
+class LargeClassRule(Rule):
     # 3. Large Class (Existing)
-    for path, node in tree.filter(ClassDeclaration):
-        method_count = len(node.methods)
+    node_types = (ClassDeclaration,)
+    scope = ClassDeclaration
+
+    def visit(self, node, ancestors):
+        method_count = self.metrics.cls(node).method_count
         if method_count > THRESHOLDS["LARGE_CLASS_METHODS"]:
-             smells.append({
+             self.smells.append({
                 "type": "Large Class",
                 "location": node.name,
                 "severity": "High",
                 "reason": f"Class has {method_count} methods",
                 "suggestedRefactoring": "Extract Class"
             })
-            
+
+
+class PrimitiveObsessionRule(Rule):
     # 4. Primitive Obsession (Existing)
-    for path, node in tree.filter(ClassDeclaration):
+    node_types = (ClassDeclaration,)
+    scope = ClassDeclaration
+
+    def visit(self, node, ancestors):
         fields = [f for f in node.fields]
-        if not fields: continue
-        
+        if not fields: return
+
         primitive_count = 0
         total_fields = 0
         for field in fields:
@@ -74,9 +89,9 @@ def detect_bloaters(tree, source_code_lines):
             elif isinstance(field.type, ReferenceType) and field.type.name in ["String", "Integer", "Double", "Boolean"]:
                  primitive_count += 1
             total_fields += 1
-            
+
         if total_fields > 3 and (primitive_count / total_fields) > 0.5:
-             smells.append({
+             self.smells.append({
                 "type": "Primitive Obsession",
                 "location": node.name,
                 "severity": "Low",
@@ -84,174 +99,273 @@ def detect_bloaters(tree, source_code_lines):
                 "suggestedRefactoring": "Replace Data Value with Object"
             })
 
+
+class DataClumpsRule(Rule):
     # 5. Data Clumps (New: Repeated groups of >= 3 parameters)
     # Heuristic: Find method signatures with overlapping parameter sequences of types/names
-    param_groups = collections.Counter()
-    for path, node in tree.filter(MethodDeclaration):
-        if not node.parameters: continue
+    node_types = (MethodDeclaration,)
+
+    def __init__(self, metrics=None):
+        super().__init__(metrics)
+        self.param_groups = collections.Counter()
+
+    def visit(self, node, ancestors):
+        if not node.parameters: return
         # Extract types
         params = []
         for p in node.parameters:
             t = p.type.name if hasattr(p.type, 'name') else 'Unknown'
             params.append(t)
-        
+
         # Look for subsets of size 3
         if len(params) >= THRESHOLDS["DATA_CLUMP_FIELDS"]:
             # Simple check: store the sorted tuple of types
             # (Better would be types+names or just types if distinct enough)
             group = tuple(sorted(params))
-            param_groups[group] += 1
-            
-    for group, count in param_groups.items():
-        if count >= 2: # Appears in at least 2 methods (heuristic for single file)
-             smells.append({
-                "type": "Data Clumps",
-                "location": f"Global (Method Parameters)",
-                "severity": "Medium",
-                "reason": f"Parameter group {group} appears in {count} methods",
-                "suggestedRefactoring": "Extract Class"
-            })
+            self.param_groups[group] += 1
 
-    return smells
-
-def detect_oo_abusers(tree, source_code_lines):
-    smells = []
-    
-    # 1. Switch Statements (Existing)
-    for path, node in tree.filter(SwitchStatement):
-        cases = node.cases
-        if len(cases) > THRESHOLDS["SWITCH_CASES"]:
-             smells.append({
-                "type": "Switch Statements",
-                "location": f"Line {node.position.line}",
-                "severity": "Medium",
-                "reason": f"Switch statement has {len(cases)} cases",
-                "suggestedRefactoring": "Replace Conditional with Polymorphism"
-            })
-            
+    def finish(self, source_code_lines):
+        for group, count in self.param_groups.items():
+            if count >= 2: # Appears in at least 2 methods (heuristic for single file)
+                 self.smells.append({
+                    "type": "Data Clumps",
+                    "location": f"Global (Method Parameters)",
+                    "severity": "Medium",
+                    "reason": f"Parameter group {group} appears in {count} methods",
+                    "suggestedRefactoring": "Extract Class"
+                })
+        return self.smells
+
+
+BLOATER_RULES = [LongMethodRule, LargeClassRule, PrimitiveObsessionRule, DataClumpsRule]
+
+# ---------------------------------------------------------------------------
+# OO Abusers
+# ---------------------------------------------------------------------------
+
+def _switch_case_groups(values, lines):
+    """
+    (line of the switch keyword, number of case groups) of every switch in a
+    token stream, in source order. Labels that directly follow each other
+    ("case 1: case 2:") form one group, like javalang's SwitchStatement.cases.
+    """
+    found = []
+    # Index of a switch block's "{" -> its entry in found
+    blocks = {}
+    # One entry per open brace: [entry in found, inside a label, right after a label] for
+    # switch blocks, None for other braces
+    stack = []
+    for i, value in enumerate(values):
+        if value == "switch":
+            # The block opens after the parenthesized selector
+            depth = 0
+            for j in range(i + 1, len(values)):
+                if values[j] == "(":
+                    depth += 1
+                elif values[j] == ")":
+                    depth -= 1
+                    if depth == 0:
+                        if j + 1 < len(values) and values[j + 1] == "{":
+                            blocks[j + 1] = len(found)
+                            found.append([lines[i], 0])
+                        break
+        frame = stack[-1] if stack else None
+        if value == "{":
+            if frame is not None and not frame[1]:
+                frame[2] = False
+            entry = blocks.pop(i, None)
+            stack.append([entry, False, False] if entry is not None else None)
+        elif value == "}":
+            if stack:
+                stack.pop()
+        elif frame is not None:
+            # A token directly inside a switch block
+            if frame[1]:
+                if value in (":", "->"):
+                    # Arrow cases ("case 1 ->") each have their own body
+                    frame[1], frame[2] = False, value == ":"
+            elif value in ("case", "default"):
+                if not frame[2]:
+                    found[frame[0]][1] += 1
+                frame[1] = True
+            else:
+                frame[2] = False
+    return [tuple(entry) for entry in found]
+
+
+class SwitchStatementsRule(Rule):
+    # 1. Switch Statements (Existing; case groups counted on the token stream)
+    needs_tree = False
+
+    def finish(self, source_code_lines):
+        spans = self.metrics.token_spans(source_code_lines)
+        for line, cases in _switch_case_groups(spans.values, spans.lines):
+            if cases > THRESHOLDS["SWITCH_CASES"]:
+                self.smells.append({
+                    "type": "Switch Statements",
+                    "location": f"Line {line}",
+                    "severity": "Medium",
+                    "reason": f"Switch statement has {cases} cases",
+                    "suggestedRefactoring": "Replace Conditional with Polymorphism"
+                })
+        return self.smells
+
+
+class TemporaryFieldRule(Rule):
     # 2. Temporary Field (New)
     # Heuristic: Field used in only one method (and not getter/setter)
-    class_fields = set()
-    for path, node in tree.filter(ClassDeclaration):
-        for field in node.fields:
-             for declarator in field.declarators:
-                 class_fields.add(declarator.name)
-    
-    field_usage = {f: set() for f in class_fields}
-    for path, node in tree.filter(MethodDeclaration):
-        # Walk method body to find refs
-        for _, ref in node.filter(MemberReference):
-            if ref.member in class_fields:
-                field_usage[ref.member].add(node.name)
-                
-    for field, methods in field_usage.items():
-        # exclude setters/getters roughly
-        real_usage = [m for m in methods if not (m.startswith("set") or m.startswith("get"))]
-        if len(real_usage) == 1:
-             smells.append({
-                "type": "Temporary Field",
-                "location": f"Field '{field}'",
-                "severity": "Low",
-                "reason": f"Field used mainly in single method '{list(real_usage)[0]}'",
-                "suggestedRefactoring": "Extract Class"
-            })
+    node_types = (ClassDeclaration,)
+    needs_usage = True
+
+    def __init__(self, metrics=None):
+        super().__init__(metrics)
+        self.classes = []
 
+    def visit(self, node, ancestors):
+        self.classes.append(node)
+
+    def finish(self, source_code_lines):
+        # Field uses are complete once the walk is over
+        for node in self.classes:
+            usage = self.metrics.cls(node).field_usage
+            declarations = {d.name: field for field in node.fields for d in field.declarators}
+            for field in usage.field_ids:
+                # exclude setters/getters roughly
+                real_usage = [m for m in usage.methods_using(field) if not (m.is_getter or m.is_setter)]
+                if len(real_usage) == 1:
+                     self.smells.append({
+                        "type": "Temporary Field",
+                        "location": f"Field '{field}'",
+                        "severity": "Low",
+                        "reason": f"Field used mainly in single method '{real_usage[0].name}'",
+                        "suggestedRefactoring": "Extract Class"
+                    })
+                     self.origins[id(self.smells[-1])] = declarations[field]
+        return self.smells
+
+
+class RefusedBequestRule(Rule):
     # 3. Refused Bequest (New)
     # Heuristic: Method overrides but throws UnsupportedOperationException
-    for path, node in tree.filter(MethodDeclaration):
-        # We can't easily check @Override without resolving annotations fully or inheritance, 
+    node_types = (MethodDeclaration,)
+    scope = MethodDeclaration
+
+    def visit(self, node, ancestors):
+        # We can't easily check @Override without resolving annotations fully or inheritance,
         # but we can look for specific exception
         if node.throws and 'UnsupportedOperationException' in node.throws:
-             smells.append({
-                "type": "Refused Bequest",
-                "location": f"{node.name}()",
+            reason = "Method throws UnsupportedOperationException"
+        elif node.body and len(node.body) == 1 and isinstance(node.body[0], ThrowStatement) \
+                and isinstance(node.body[0].expression, ClassCreator) \
+                and node.body[0].expression.type.name == 'UnsupportedOperationException':
+            # Check body for strict throw: the whole body is `throw new UnsupportedOperationException(...)`
+            reason = "Method body only throws UnsupportedOperationException"
+        else:
+            return
+        self.smells.append({
+            "type": "Refused Bequest",
+            "location": f"{node.name}()",
+            "severity": "Medium",
+            "reason": reason,
+            "suggestedRefactoring": "Push Down Method / Extract Superclass"
+        })
+
+
+OO_ABUSER_RULES = [SwitchStatementsRule, TemporaryFieldRule, RefusedBequestRule]
+
+# ---------------------------------------------------------------------------
+# Dispensables
+# ---------------------------------------------------------------------------
+
+class DuplicateCodeRule(Rule):
+    # 1. Duplicate Code (Type-2 clones: token windows with identifiers and literals normalized,
+    #    merged into maximal clones; exact line windows when no tokens are available)
+    needs_tree = False
+
+    def finish(self, source_code_lines):
+        spans = self.metrics.spans
+        if spans is not None:
+            index = TokenCloneIndex(THRESHOLDS["DUPLICATE_CODE_TOKENS"])
+            index.add_fingerprints(None, *token_fingerprints(spans.values, spans.lines))
+            found = index.clones()
+        else:
+            window_size = THRESHOLDS["DUPLICATE_CODE_BLOCK"]
+            line_numbers, hashes = line_fingerprints(source_code_lines)
+            found = CloneIndex(window_size).add_fingerprints(None, line_numbers, hashes) if len(hashes) > window_size else []
+        for clone in found:
+            size = f"{clone.lines} lines ({clone.tokens} tokens)" if clone.tokens else f"{clone.lines} lines"
+            self.smells.append({
+                "type": "Duplicate Code",
+                "location": f"Lines {clone.start_line}-{clone.end_line}",
                 "severity": "Medium",
-                "reason": "Method throws UnsupportedOperationException",
-                "suggestedRefactoring": "Push Down Method / Extract Superclass"
+                "reason": f"Block of {size} duplicates lines {clone.other_start_line}-{clone.other_end_line}",
+                "suggestedRefactoring": "Extract Method"
             })
-        # Check body for strict throw
-        if node.body and len(node.body) == 1:
-            stmt = node.body[0]
-            if isinstance(stmt, ThrowStatement):
-                # Check what is thrown.. hard to deep dive in simplified AST usage
-                pass # Javalang structure for Throw is generic
-
-    return smells
-
-def detect_dispensables(tree, source_code_lines):
-    smells = []
-    
-    # 1. Duplicate Code (Existing)
-    lines = [l.strip() for l in source_code_lines if l.strip()]
-    if len(lines) > THRESHOLDS["DUPLICATE_CODE_BLOCK"]:
-        seen_blocks = {}
-        window_size = THRESHOLDS["DUPLICATE_CODE_BLOCK"]
-        for i in range(len(lines) - window_size + 1):
-            block = tuple(lines[i:i+window_size])
-            if block in seen_blocks:
-                smells.append({
-                    "type": "Duplicate Code",
-                    "location": f"Lines near {i}",
-                    "severity": "Medium",
-                    "reason": "Identical block of code detected multiple times",
-                    "suggestedRefactoring": "Extract Method"
-                })
-                break 
-            seen_blocks[block] = i
+        return self.smells
+
 
+class DeadCodeRule(Rule):
     # 2. Dead Code (New: Private methods never called)
-    private_methods = set()
-    all_calls = set()
-    
-    for path, node in tree.filter(MethodDeclaration):
+    node_types = (MethodDeclaration,)
+    needs_usage = True
+
+    def __init__(self, metrics=None):
+        super().__init__(metrics)
+        self.private_methods = set()
+        self.all_calls = set()
+
+    def visit(self, node, ancestors):
         if 'private' in node.modifiers:
-            private_methods.add(node.name)
-        
-        # Collect calls in this method body
-        for _, invocation in node.filter(MethodInvocation):
-            all_calls.add(invocation.member)
-            
-    dead_methods = private_methods - all_calls
-    for dm in dead_methods:
-         smells.append({
-            "type": "Dead Code",
-            "location": f"{dm}()",
-            "severity": "Medium",
-            "reason": "Private method is never called within the file",
-            "suggestedRefactoring": "Inline Method / Delete Code"
-        })
+            self.private_methods.add(node.name)
 
+    def finish(self, source_code_lines):
+        # Collect calls made from method bodies
+        for method in self.metrics.methods():
+            self.all_calls |= method.calls
+        dead_methods = self.private_methods - self.all_calls
+        for dm in dead_methods:
+             self.smells.append({
+                "type": "Dead Code",
+                "location": f"{dm}()",
+                "severity": "Medium",
+                "reason": "Private method is never called within the file",
+                "suggestedRefactoring": "Inline Method / Delete Code"
+            })
+        return self.smells
+
+
+class LazyClassRule(Rule):
     # 3. Lazy Class (New)
-    for path, node in tree.filter(ClassDeclaration):
+    node_types = (ClassDeclaration,)
+    scope = ClassDeclaration
+
+    def visit(self, node, ancestors):
         # Heuristic: Few methods (excluding getters/setters) and fields
-        methods = node.methods
-        real_methods = [m for m in methods if not (m.name.startswith("get") or m.name.startswith("set"))]
-        
-        if len(real_methods) < THRESHOLDS["LAZY_CLASS_METHODS"] and len(node.fields) < 2:
-             smells.append({
+        metrics = self.metrics.cls(node)
+        real_methods = metrics.method_count - metrics.get_set_count
+
+        if real_methods < THRESHOLDS["LAZY_CLASS_METHODS"] and metrics.field_count < 2:
+             self.smells.append({
                 "type": "Lazy Class",
                 "location": node.name,
                 "severity": "Low",
                 "reason": "Class has very little functionality/data",
                 "suggestedRefactoring": "Collapse Hierarchy / Inline Class"
             })
-            
+
+
+class DataClassRule(Rule):
     # 4. Data Class (Existing) - Logic: Mostly getters/setters
-    for path, node in tree.filter(ClassDeclaration):
-        methods = node.methods
-        if len(methods) > 2:
-            is_data_class = True
-            non_accessors = 0
-            for m in methods:
-                name = m.name
-                if not (name.startswith("get") or name.startswith("set") or name.startswith("is")):
-                    is_data_class = False
-                    non_accessors += 1
-            
+    node_types = (ClassDeclaration,)
+    scope = ClassDeclaration
+
+    def visit(self, node, ancestors):
+        metrics = self.metrics.cls(node)
+        if metrics.method_count > 2:
             # Refined: If >90% are accessors
-            ratio = (len(methods) - non_accessors) / len(methods)
-            if ratio > 0.9: 
-                 smells.append({
+            ratio = metrics.accessor_count / metrics.method_count
+            if ratio > 0.9:
+                 self.smells.append({
                     "type": "Data Class",
                     "location": node.name,
                     "severity": "Low",
@@ -259,37 +373,213 @@ def detect_dispensables(tree, source_code_lines):
                     "suggestedRefactoring": "Move Method"
                 })
 
-    return smells
-
-def detect_couplers(tree, source_code_lines):
-    smells = []
-    
-    # 1. Feature Envy (New: Simple Heuristic)
-    # Check if a method uses more fields/methods from another class than its own (rough check)
-    for path, node in tree.filter(MethodDeclaration):
-        # Count 'this.' or implicit field access vs 'otherObject.'
-        pass # Without symbol table/types, this is very hard to guess accurately.
-        # Simple Proxy: Count variables that have many methods called on them?
-        
-    # 2. Message Chains (New)
-    for i, line in enumerate(source_code_lines):
-        if line.count("().") >= THRESHOLDS["MESSAGE_CHAIN_LENGTH"]:
-            smells.append({
-                "type": "Message Chains",
-                "location": f"Line {i+1}",
-                "severity": "Medium",
-                "reason": "Complex method chaining detected (>.().().)",
-                "suggestedRefactoring": "Hide Delegate"
-            })
-            
-    # 3. Middle Man (New)
-    # Method bodies strictly delegates: return x.foo()
-    for path, node in tree.filter(MethodDeclaration):
-        if node.body and len(node.body) == 1:
-            stmt = node.body[0]
-            # Check if it's a return statement with a method invocation
-            # Or just an expression statement
-            # This is intricate AST matching. 
-            pass
-
-    return smells
+
+DISPENSABLE_RULES = [DuplicateCodeRule, DeadCodeRule, LazyClassRule, DataClassRule]
+
+# ---------------------------------------------------------------------------
+# Couplers
+# ---------------------------------------------------------------------------
+
+class FeatureEnvyRule(Rule):
+    # 1. Feature Envy (New; from the reference profile of each method)
+    # Heuristic: a method uses the members of one other object more than those of its own class
+    node_types = (MethodDeclaration,)
+    needs_usage = True
+
+    def __init__(self, metrics=None):
+        super().__init__(metrics)
+        self.methods = []
+
+    def visit(self, node, ancestors):
+        self.methods.append(node)
+
+    def finish(self, source_code_lines):
+        # Profiles are complete once the walk is over
+        for node in self.methods:
+            profile = self.metrics.method(node).profile
+            if not profile.foreign:
+                continue
+            target, uses = profile.foreign.most_common(1)[0]
+            if uses >= THRESHOLDS["FEATURE_ENVY_ACCESSES"] and uses > profile.own:
+                self.smells.append({
+                    "type": "Feature Envy",
+                    "location": f"{node.name}()",
+                    "severity": "Medium",
+                    "reason": f"Method uses {uses} members of '{target}' but {profile.own} of its own class",
+                    "suggestedRefactoring": "Move Method"
+                })
+                self.origins[id(self.smells[-1])] = node
+        return self.smells
+
+
+# Tokens that can start or continue a chain (besides identifiers and literals)
+_CHAIN_PRIMARIES = frozenset(("this", "super"))
+_NOT_PRIMARY = frozenset(Keyword.VALUES) - _CHAIN_PRIMARIES | frozenset(Operator.VALUES) | {"@"}
+
+
+def _message_chains(values, separators, lines):
+    """
+    (first line, last line, calls) of every chain of messages in a token
+    stream, in source order, where `calls` counts the calls whose result
+    receives the next message: a().b().c().d() has 3. Chains may span lines,
+    and the arguments of a call hold chains of their own.
+    """
+    found = []
+    # Per open bracket: [first line, last line, calls, last token: None|"primary"|"call"|"dot"]
+    levels = [[0, 0, 0, None]]
+    # Per open bracket: (whether it opens the arguments of a call, its line)
+    calls = []
+
+    def end(level):
+        if level[2]:
+            found.append((level[0], level[1], level[2]))
+        level[2] = 0
+        level[3] = None
+
+    angles = 0
+    for i, value in enumerate(values):
+        level = levels[-1]
+        if angles:
+            # Type arguments of a generic call: a.<String>b()
+            angles += value.count("<") - value.count(">")
+            angles = max(angles, 0)
+            continue
+        if separators[i]:
+            if value in "([{":
+                calls.append((value == "(" and level[3] == "primary", lines[i]))
+                levels.append([0, 0, 0, None])
+            elif value in ")]}":
+                if len(levels) == 1:
+                    end(level)
+                    continue
+                end(levels.pop())
+                level = levels[-1]
+                was_call, opened = calls.pop()
+                if value == "}":
+                    end(level)
+                elif level[3] is not None or value == ")":
+                    # A call result, an indexed element or a parenthesized expression
+                    if level[3] is None:
+                        level[0] = opened
+                    level[3] = "call" if was_call else "primary"
+                    level[1] = lines[i]
+            elif value == "." and level[3] in ("primary", "call"):
+                if level[3] == "call":
+                    level[2] += 1
+                level[3] = "dot"
+            else:
+                end(level)
+        elif value == "<" and level[3] == "dot":
+            angles = 1
+        elif value not in _NOT_PRIMARY:
+            if level[3] != "dot":
+                end(level)
+                level[0] = lines[i]
+            level[1] = lines[i]
+            level[3] = "primary"
+        else:
+            end(level)
+    for level in levels:
+        end(level)
+    found.sort()
+    return found
+
+
+class MessageChainsRule(Rule):
+    # 2. Message Chains (New; chains followed across lines on the token stream)
+    needs_tree = False
+
+    def finish(self, source_code_lines):
+        spans = self.metrics.token_spans(source_code_lines)
+        for first, last, calls in _message_chains(spans.values, spans.separators, spans.lines):
+            if calls >= THRESHOLDS["MESSAGE_CHAIN_LENGTH"]:
+                self.smells.append({
+                    "type": "Message Chains",
+                    "location": f"Line {first}" if first == last else f"Lines {first}-{last}",
+                    "severity": "Medium",
+                    "reason": f"Complex method chaining detected ({calls} chained calls)",
+                    "suggestedRefactoring": "Hide Delegate"
+                })
+        return self.smells
+
+class MiddleManRule(Rule):
+    # 3. Middle Man (New; from the reference profiles of a class's methods)
+    # Heuristic: at least half the methods of a class only delegate to the same field
+    node_types = (ClassDeclaration,)
+    needs_usage = True
+
+    def __init__(self, metrics=None):
+        super().__init__(metrics)
+        self.classes = []
+
+    def visit(self, node, ancestors):
+        self.classes.append(node)
+
+    def finish(self, source_code_lines):
+        # Delegation targets are resolved (field or not) during the walk
+        for node in self.classes:
+            metrics = self.metrics.cls(node)
+            fields = metrics.field_usage.field_ids
+            targets = collections.Counter(m.profile.delegate for m in metrics.methods if m.profile.delegate in fields)
+            if not targets:
+                continue
+            target, delegating = targets.most_common(1)[0]
+            if delegating >= THRESHOLDS["MIDDLE_MAN_DELEGATES"] and delegating * 2 >= metrics.method_count:
+                self.smells.append({
+                    "type": "Middle Man",
+                    "location": node.name,
+                    "severity": "Low",
+                    "reason": f"{delegating} of {metrics.method_count} methods only delegate to '{target}'",
+                    "suggestedRefactoring": "Remove Middle Man"
+                })
+                self.origins[id(self.smells[-1])] = node
+        return self.smells
+
+
+COUPLER_RULES = [FeatureEnvyRule, MessageChainsRule, MiddleManRule]
+
+ALL_RULES = BLOATER_RULES + OO_ABUSER_RULES + DISPENSABLE_RULES + COUPLER_RULES
+
+# Rules that run on tokens alone: all a quick scan runs, without parsing
+TOKEN_RULES = [rule for rule in ALL_RULES if not rule.needs_tree]
+
+RULE_FAMILIES = {
+    "bloaters": BLOATER_RULES,
+    "ooAbusers": OO_ABUSER_RULES,
+    "dispensables": DISPENSABLE_RULES,
+    "couplers": COUPLER_RULES
+}
+
+
+# Each detector accepts a MetricsTable built for the same tree (one with
+# TokenSpans gives exact line counts); a plain one is created otherwise.
+# The family detectors are generators: each smell is yielded as soon as its
+# rule has found it (see iter_rules)
+
+def detect_bloaters(tree, source_code_lines, metrics=None):
+    for _, smell in iter_rules(tree, source_code_lines, BLOATER_RULES, metrics=metrics or MetricsTable()):
+        yield smell
+
+def detect_oo_abusers(tree, source_code_lines, metrics=None):
+    for _, smell in iter_rules(tree, source_code_lines, OO_ABUSER_RULES, metrics=metrics or MetricsTable()):
+        yield smell
+
+def detect_dispensables(tree, source_code_lines, metrics=None):
+    for _, smell in iter_rules(tree, source_code_lines, DISPENSABLE_RULES, metrics=metrics or MetricsTable()):
+        yield smell
+
+def detect_couplers(tree, source_code_lines, metrics=None):
+    for _, smell in iter_rules(tree, source_code_lines, COUPLER_RULES, metrics=metrics or MetricsTable()):
+        yield smell
+
+def detect_all(tree, source_code_lines, memo=None, timings=None, metrics=None, origins=None):
+    # Single walk of the tree shared by every detector family
+    return run_rules(tree, source_code_lines, ALL_RULES, memo, timings, metrics or MetricsTable(), origins)
+
+def detect_quick(source_code_lines, timings=None, metrics=None):
+    # The token-level rules only; no tree needed (a MetricsTable with the TokenSpans avoids lexing again)
+    return run_rules(None, source_code_lines, TOKEN_RULES, timings=timings, metrics=metrics or MetricsTable())
+
+def iter_all(tree, source_code_lines, timings=None, metrics=None):
+    # detect_all as a generator of (index of the rule in ALL_RULES, smell)
+    return iter_rules(tree, source_code_lines, ALL_RULES, timings=timings, metrics=metrics or MetricsTable())
@@ -0,0 +1,141 @@
+import bisect
+import hashlib
+import re
+
+from javalang.tokenizer import Separator, Operator
+
+# One alternative per kind of lexeme, tried in this order (see lex())
+_LEXEME = re.compile("|".join((
+    r"(?P<space>\s+|//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))",
+    r'(?P<text>"""[\s\S]*?""")',
+    r"(?P<string>\"(?:[^\"\\\n]|\\.)*\"|'(?:[^'\\\n]|\\.)*')",
+    r"(?P<number>0[xX][0-9a-fA-F_]*(?:\.[0-9a-fA-F_]*)?(?:[pP][+-]?[0-9_]*)?[lLfFdD]?"
+    r"|0[bB][01_]*[lL]?|(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][+-]?[\d_]*)?[lLfFdD]?)",
+    r"(?P<name>(?:[^\W\d]|\$)[\w$]*)",
+    r"(?P<operator>" + "|".join(re.escape(value) for value in sorted(Operator.VALUES, key=len, reverse=True)) + "|@)",
+    r"(?P<separator>[(){}\[\];,.])",
+    r"(?P<unterminated>[\"'][^\n]*)",
+    r"(?P<error>.)",
+)))
+_UNICODE_ESCAPE = re.compile(r"\\u+([0-9a-fA-F]{4})")
+
+
+def lex(source_code):
+    """
+    Tokenizes Java source straight into TokenSpans with one regular
+    expression: several times faster than javalang's tokenizer, with the
+    same values and positions for valid sources. For the quick tier, which
+    needs no parse. Returns (spans, errors); errors are (line, message) for
+    text that is not a token, which is skipped (an unterminated literal up
+    to the end of its line).
+    """
+    if "\\u" in source_code:
+        # Unicode escapes are translated before tokenizing, as javalang does
+        source_code = _UNICODE_ESCAPE.sub(lambda match: chr(int(match.group(1), 16)), source_code)
+    values, lines, columns, separators, errors = [], [], [], [], []
+    line, line_start = 1, -1
+    for match in _LEXEME.finditer(source_code):
+        kind = match.lastgroup
+        value = match.group()
+        start = match.start()
+        if kind == "unterminated":
+            errors.append((line, f"Lexical Error: unterminated string literal at line {line}"))
+        elif kind == "error":
+            errors.append((line, f"Lexical Error: Could not process token at line {line}"))
+        elif kind != "space":
+            values.append(value)
+            lines.append(line)
+            columns.append(start - line_start)
+            separators.append(kind == "separator")
+        if kind == "space" or kind == "text":
+            newlines = value.count("\n")
+            if newlines:
+                line += newlines
+                line_start = start + value.rindex("\n")
+    return TokenSpans.from_columns(values, lines, columns, separators), errors
+
+
+class TokenSpans:
+    """
+    Locates declarations in the token stream they were parsed from.
+    javalang only records where a node starts; the end is found by matching
+    the braces of its body, using a bracket table built in one pass.
+    """
+
+    def __init__(self, tokens):
+        self._index(
+            [t.value for t in tokens],
+            [t.position.line for t in tokens],
+            [t.position.column for t in tokens],
+            [isinstance(t, Separator) for t in tokens])
+
+    @classmethod
+    def from_columns(cls, values, lines, columns, separators):
+        """
+        Builds spans from per-token columns (see `columns_data()`) instead of
+        token objects, e.g. when the tokens come from a parse cache.
+        """
+        spans = cls.__new__(cls)
+        spans._index(values, lines, columns, separators)
+        return spans
+
+    def _index(self, values, lines, columns, separators):
+        self.values = values
+        self.lines = lines
+        self.columns = columns
+        self.separators = separators
+        self._starts = list(zip(lines, columns))
+        self._closing = {}
+        stack = []
+        for i, value in enumerate(values):
+            if separators[i]:
+                if value == "{":
+                    stack.append(i)
+                elif value == "}" and stack:
+                    self._closing[stack.pop()] = i
+
+    def columns_data(self):
+        """(values, lines, columns, separators): everything needed to rebuild these spans."""
+        return self.values, self.lines, self.columns, self.separators
+
+    def span(self, node):
+        """
+        Returns (first, last) token indexes of a class, method or constructor
+        declaration, or None when the node has no position.
+        """
+        position = node.position
+        if not position:
+            return None
+        values = self.values
+        separators = self.separators
+        start = bisect.bisect_left(self._starts, (position.line, position.column))
+        depth = 0
+        for i in range(start, len(values)):
+            if not separators[i]:
+                continue
+            value = values[i]
+            if value == "(":
+                depth += 1
+            elif value == ")":
+                depth -= 1
+            elif depth == 0 and value == "{":
+                return start, self._closing.get(i, len(values) - 1)
+            elif depth == 0 and value == ";":
+                return start, i
+        return start, len(values) - 1
+
+    def line_range(self, span):
+        first, last = span
+        return self.lines[first], self.lines[last]
+
+    def fingerprint(self, span):
+        """
+        Hash of the token values in a span. Whitespace and comments do not
+        affect it, so reformatting keeps the fingerprint stable.
+        """
+        first, last = span
+        digest = hashlib.blake2b(digest_size=16)
+        for value in self.values[first:last + 1]:
+            digest.update(value.encode("utf-8", "surrogatepass"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
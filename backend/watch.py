@@ -0,0 +1,312 @@
+"""
+Watch mode: a long-running daemon that keeps the analysis of a source tree
+warm and pushes changes to subscribers.
+
+    python watch.py path/to/src [--port 8765 | --socket PATH] [--interval 0.1]
+
+The tree is polled for .java files whose size, modification time or inode
+changed. Only those are read and analyzed again; every other report (and
+the project index behind the cross-file smells) stays in memory. Each
+client of the local socket receives newline-delimited JSON events:
+
+    {"event": "snapshot", "root", "ready", "summary", "files", "projectSmells"}
+    {"event": "file", "path", "report", "seconds"}     a file was (re)analyzed
+    {"event": "removed", "path"}
+    {"event": "project", "projectSmells"}              cross-file smells changed
+    {"event": "ready"}                                 initial analysis done
+
+The API server offers the same events over SSE and WebSocket when
+ANALYSIS_WATCH_DIR is set (see main.py).
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+from analyzer import analyze_code, summarize_reports
+from scan import iter_java_files
+from symbols import ProjectIndex
+
+# Watch settings (Configurable through the environment)
+WATCH_SETTINGS = {
+    "INTERVAL": float(os.environ.get("ANALYSIS_WATCH_INTERVAL", 0.1)),
+}
+
+
+class _FileState:
+    __slots__ = ("signature", "digest", "report")
+
+    def __init__(self, signature, digest, report):
+        self.signature = signature
+        self.digest = digest
+        self.report = report
+
+
+class Workspace:
+    """
+    Reports of every .java file under `root`, keyed by path relative to it,
+    plus a ProjectIndex of their symbols for cross-file smells (unless
+    `project` is off). Methods may be called from worker threads.
+    """
+
+    def __init__(self, root, project=True):
+        self.root = os.path.abspath(root)
+        self.files = {}
+        self.project = ProjectIndex() if project else None
+        self.project_smells = []
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def changes(self):
+        """
+        ([(path, signature)] of files added or modified since they were last
+        analyzed, [path] of files gone), from one pass of os.stat over the tree.
+        """
+        current = {}
+        for path in iter_java_files([self.root]):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            current[os.path.relpath(path, self.root)] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self.lock:
+            changed = [(path, signature) for path, signature in current.items()
+                       if path not in self.files or self.files[path].signature != signature]
+            removed = [path for path in self.files if path not in current]
+        return changed, removed
+
+    def update(self, path, signature):
+        """
+        Analyzes one file again; returns its "file" event, or None when only
+        its metadata changed (saved without edits, touched).
+        """
+        try:
+            with open(os.path.join(self.root, path), "r", encoding="utf-8", errors="replace") as f:
+                source_code = f.read()
+        except OSError:
+            # Gone between the stat and the read
+            return self.remove(path)
+        digest = hashlib.blake2b(source_code.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+        with self.lock:
+            state = self.files.get(path)
+            if state is not None and state.digest == digest:
+                state.signature = signature
+                return None
+
+        start = time.perf_counter()
+        report = analyze_code(source_code, symbols=self.project is not None)
+        seconds = time.perf_counter() - start
+        symbols = report.pop("symbols", None)
+        report["path"] = path
+        with self.lock:
+            self.files[path] = _FileState(signature, digest, report)
+            if self.project is not None:
+                if symbols is not None:
+                    self.project.update(path, symbols)
+                else:
+                    # Unparsable now: forget what the last version declared
+                    self.project.remove(path)
+        return {"event": "file", "path": path, "report": report, "seconds": round(seconds, 4)}
+
+    def remove(self, path):
+        with self.lock:
+            if self.files.pop(path, None) is None:
+                return None
+            if self.project is not None:
+                self.project.remove(path)
+        return {"event": "removed", "path": path}
+
+    def project_event(self):
+        """A "project" event when the cross-file smells changed since the last call, else None."""
+        if self.project is None:
+            return None
+        with self.lock:
+            smells = self.project.smells()
+        if smells == self.project_smells:
+            return None
+        self.project_smells = smells
+        return {"event": "project", "projectSmells": smells}
+
+    def snapshot(self):
+        with self.lock:
+            files = [self.files[path].report for path in sorted(self.files)]
+        return {
+            "event": "snapshot",
+            "root": self.root,
+            "ready": self.ready,
+            "summary": summarize_reports(files),
+            "files": files,
+            "projectSmells": self.project_smells
+        }
+
+
+class _Subscriber:
+    __slots__ = ("pending", "wake")
+
+    def __init__(self):
+        self.pending = collections.deque()
+        self.wake = asyncio.Event()
+
+
+class WatchDaemon:
+    """
+    Keeps a Workspace up to date in the background: polls the tree every
+    `interval` seconds and re-analyzes the files that changed, one at a
+    time in a thread, publishing an event for each to every subscriber.
+    """
+
+    # Events queued for a subscriber that does not keep up; beyond this it
+    # gets a fresh snapshot instead
+    MAX_PENDING = 256
+
+    def __init__(self, workspace, interval=None):
+        self.workspace = workspace
+        self.interval = WATCH_SETTINGS["INTERVAL"] if interval is None else interval
+        self._subscribers = set()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # A bad file or a vanished directory must not end the watch
+                sys.stderr.write(f"watch: {type(e).__name__}: {e}\n")
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        """One poll: analyzes what changed and publishes the events."""
+        workspace = self.workspace
+        changed, removed = await asyncio.to_thread(workspace.changes)
+        for path in removed:
+            self._publish(workspace.remove(path))
+        for path, signature in changed:
+            self._publish(await asyncio.to_thread(workspace.update, path, signature))
+        if changed or removed:
+            self._publish(await asyncio.to_thread(workspace.project_event))
+        if not workspace.ready:
+            workspace.ready = True
+            self._publish({"event": "ready"})
+
+    def _publish(self, event):
+        if event is None:
+            return
+        for subscriber in self._subscribers:
+            if len(subscriber.pending) >= self.MAX_PENDING:
+                # None stands for "send a snapshot": it replaces everything missed
+                subscriber.pending.clear()
+                subscriber.pending.append(None)
+            else:
+                subscriber.pending.append(event)
+            subscriber.wake.set()
+
+    async def events(self):
+        """
+        Events for one subscriber: a snapshot, then every change as soon as
+        it is analyzed. A change made while the snapshot is taken may show up
+        in both; applying an event twice is harmless.
+        """
+        subscriber = _Subscriber()
+        self._subscribers.add(subscriber)
+        try:
+            yield await asyncio.to_thread(self.workspace.snapshot)
+            while True:
+                while not subscriber.pending:
+                    subscriber.wake.clear()
+                    await subscriber.wake.wait()
+                event = subscriber.pending.popleft()
+                yield event if event is not None else await asyncio.to_thread(self.workspace.snapshot)
+        finally:
+            self._subscribers.discard(subscriber)
+
+
+async def _send_events(daemon, reader, writer):
+    # One socket client: newline-delimited JSON until it disconnects
+    try:
+        async for event in daemon.events():
+            writer.write(json.dumps(event, separators=(",", ":")).encode("utf-8") + b"\n")
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _log_events(daemon, out):
+    async for event in daemon.events():
+        kind = event["event"]
+        if kind == "snapshot" and event["ready"]:
+            continue
+        if kind == "file":
+            report = event["report"]
+            problem = f" ({report['error']})" if "error" in report else ""
+            out.write(f"{event['path']}: {report['summary']['totalSmells']} smells in {event['seconds'] * 1000:.0f} ms{problem}\n")
+        elif kind == "removed":
+            out.write(f"{event['path']}: removed\n")
+        elif kind == "project":
+            out.write(f"Cross-file smells: {len(event['projectSmells'])}\n")
+        elif kind == "ready":
+            summary = daemon.workspace.snapshot()["summary"]
+            out.write(f"Ready: {summary['totalFiles']} files, {summary['totalSmells']} smells\n")
+        out.flush()
+
+
+async def serve(root, host="127.0.0.1", port=8765, socket_path=None, interval=None, project=True, quiet=False):
+    daemon = WatchDaemon(Workspace(root, project=project), interval)
+    handler = lambda reader, writer: _send_events(daemon, reader, writer)
+    if socket_path:
+        server = await asyncio.start_unix_server(handler, socket_path)
+        where = socket_path
+    else:
+        server = await asyncio.start_server(handler, host, port)
+        where = "{}:{}".format(*server.sockets[0].getsockname()[:2])
+    sys.stderr.write(f"Watching {daemon.workspace.root}, events on {where}\n")
+    logger = None if quiet else asyncio.get_running_loop().create_task(_log_events(daemon, sys.stderr))
+    daemon.start()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if logger is not None:
+            logger.cancel()
+        await daemon.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch a source tree and push smell updates as files change.")
+    parser.add_argument("root", help="Directory to watch")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port for subscribers (default: 8765)")
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--interval", type=float, default=None, help="Seconds between polls (default: ANALYSIS_WATCH_INTERVAL or 0.1)")
+    parser.add_argument("--no-project", action="store_true", help="Skip the cross-file smells")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not log analyzed files to stderr")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.root):
+        parser.error(f"not a directory: {args.root}")
+    try:
+        asyncio.run(serve(args.root, args.host, args.port, args.socket, args.interval, not args.no_project, args.quiet))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
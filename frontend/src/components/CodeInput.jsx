@@ -25,7 +25,7 @@ const CodeInput = ({ onAnalyze, isLoading }) => {
 }`);
 
   const lineCount = code.split('\n').length;
-  const isOverLimit = lineCount > 500;
+  const isLarge = lineCount > 500;
 
   // Generate line numbers
   const lineNumbers = Array.from({ length: lineCount }, (_, i) => i + 1).join('\n');
@@ -65,13 +65,13 @@ const CodeInput = ({ onAnalyze, isLoading }) => {
       </div>
 
       <div className="action-bar">
-        <div className="line-count" style={{ color: isOverLimit ? '#ef4444' : 'inherit' }}>
-          {lineCount} lines {isOverLimit && '(Limit: 500)'}
+        <div className="line-count">
+          {lineCount} lines {isLarge && '(large input mode)'}
         </div>
         <button
           className="btn-primary"
           onClick={() => onAnalyze(code)}
-          disabled={isLoading || !code.trim() || isOverLimit}
+          disabled={isLoading || !code.trim()}
         >
           {isLoading ? 'Scanning...' : 'Analyze Code'}
         </button>
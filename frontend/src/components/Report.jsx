@@ -49,6 +49,7 @@ const Report = ({ data, isLoading }) => {
     <div className="panel report-panel fade-in">
       <div className="panel-header">
         <h2><span>📊</span> Analysis Report</h2>
+        {data.streaming && <span className="stat-label">⏳ Still analyzing...</span>}
       </div>
 
       <div className="stats-grid">
@@ -65,7 +66,22 @@ const Report = ({ data, isLoading }) => {
       </div>
 
       <div className="smell-feed">
-        {smells.length === 0 ? (
+        {data.parseErrors && data.parseErrors.length > 0 && (
+          <div className="smell-card card-severity-High">
+            <div className="card-header">
+              <span className="smell-title">Partially Analyzed</span>
+              <span className="badge badge-High">{data.parseErrors.length} Skipped</span>
+            </div>
+            {data.parseErrors.map((parseError, index) => (
+              <div key={index} className="card-row">
+                <span className="card-label">{parseError.location}:</span>
+                <span className="card-value">{parseError.region} ({parseError.error})</span>
+              </div>
+            ))}
+          </div>
+        )}
+
+        {smells.length === 0 && !data.streaming ? (
           <div className="empty-state">
             <div className="empty-icon">✅</div>
             <p>No code smells detected. Great job!</p>
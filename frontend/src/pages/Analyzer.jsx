@@ -3,6 +3,45 @@ import CodeInput from '../components/CodeInput';
 import Report from '../components/Report';
 import axios from 'axios';
 
+const LARGE_INPUT_LINES = 500;
+
+// POSTs the source to the SSE endpoint and calls onEvent(event, data) for
+// every event (EventSource cannot send a request body)
+const streamAnalysis = async (code, onEvent) => {
+    const response = await fetch('/api/analyze/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'text/plain' },
+        body: code
+    });
+    if (!response.ok) {
+        const body = await response.json().catch(() => ({}));
+        const err = new Error(body.detail || `HTTP ${response.status}`);
+        err.response = { data: body };
+        throw err;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+};
+
 const Analyzer = () => {
     const [report, setReport] = useState(null);
     const [loading, setLoading] = useState(false);
@@ -15,10 +54,33 @@ const Analyzer = () => {
 
         try {
             // Relative path works for both Vite Proxy (Local) and Vercel Redirect (Prod)
-            const response = await axios.post('/api/analyze', {
-                sourceCode: code
-            });
-            setReport(response.data);
+            // Large inputs are streamed: smells show up as the detectors find them
+            if (code.split('\n').length > LARGE_INPUT_LINES) {
+                await streamAnalysis(code, (event, data) => {
+                    if (event === 'parsed') {
+                        setLoading(false);
+                        setReport({
+                            summary: { totalLines: data.totalLines, totalSmells: 0 },
+                            smells: [],
+                            parseErrors: data.parseErrors,
+                            streaming: true
+                        });
+                    } else if (event === 'smell') {
+                        setReport(prev => ({
+                            ...prev,
+                            smells: [...prev.smells, data],
+                            summary: { ...prev.summary, totalSmells: prev.summary.totalSmells + 1 }
+                        }));
+                    } else if (event === 'summary') {
+                        setReport(prev => ({ ...prev, summary: data, streaming: false }));
+                    } else if (event === 'error') {
+                        setReport(data);
+                    }
+                });
+            } else {
+                const response = await axios.post('/api/analyze', { sourceCode: code });
+                setReport(response.data);
+            }
         } catch (err) {
             console.error(err);
             let msg = err.response?.data?.detail || err.message || "Connection refused";
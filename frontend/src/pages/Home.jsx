@@ -20,7 +20,8 @@ const Home = () => {
         { category: "Dispensables", smell: "Duplicate Code", heuristic: "Identical block > 6 lines" },
         { category: "", smell: "Dead Code", heuristic: "Unused private methods" },
         { category: "Couplers", smell: "Message Chains", heuristic: "> 3 chained calls" },
-        { category: "", smell: "Feature Envy", heuristic: "Frequent foreign data usage" },
+        { category: "", smell: "Feature Envy", heuristic: "Uses another object's members more than its own" },
+        { category: "", smell: "Middle Man", heuristic: "Most methods only delegate" },
     ];
 
     return (
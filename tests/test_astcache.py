@@ -0,0 +1,64 @@
+import os
+import pickle
+
+import javalang
+import pytest
+
+import astcache
+from astcache import ParseCache, parse_source
+from bench import generate_source
+
+SOURCE = generate_source(2, 3, 10, switch_cases=4, chain_length=3)
+
+
+def test_cached_parse_matches_a_fresh_one(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    tree, spans = parse_source(SOURCE, cache)
+    assert cache.misses == 1
+
+    cached_tree, cached_spans = parse_source(SOURCE, cache)
+    assert cache.hits == 1
+    assert pickle.dumps(cached_tree) == pickle.dumps(tree)
+    assert cached_spans.columns_data() == spans.columns_data()
+
+
+def test_entries_of_another_format_are_misses(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path))
+    key = cache.key(SOURCE)
+    tree, spans = parse_source(SOURCE)
+    monkeypatch.setattr(astcache, "_FORMAT", "ast0:javalang-0.0")
+    cache.store(key, tree, spans)
+    monkeypatch.undo()
+
+    assert cache.load(key) is None
+    # A schema or javalang upgrade also changes the key, so old entries are not even read
+    monkeypatch.setattr(astcache, "_FORMAT", "ast0:javalang-0.0")
+    assert cache.key(SOURCE) != key
+
+
+def test_corrupt_entries_are_misses(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    parse_source(SOURCE, cache)
+    key = cache.key(SOURCE)
+    with open(cache._path(key), "wb") as f:
+        f.write(b"not zlib")
+
+    assert cache.load(key) is None
+    parse_source(SOURCE, cache)
+    assert cache.load(key) is not None
+
+
+def test_syntax_errors_are_not_cached(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    with pytest.raises(javalang.parser.JavaSyntaxError):
+        parse_source("class A { void f( }", cache)
+    assert not os.path.exists(cache._path(cache.key("class A { void f( }")))
+
+
+def test_default_cache_follows_the_environment(tmp_path, monkeypatch):
+    monkeypatch.delenv("ANALYSIS_AST_CACHE_DIR", raising=False)
+    assert astcache.default_cache() is None
+    monkeypatch.setenv("ANALYSIS_AST_CACHE_DIR", str(tmp_path / "a"))
+    assert astcache.default_cache().directory == str(tmp_path / "a")
+    monkeypatch.setenv("ANALYSIS_AST_CACHE_DIR", str(tmp_path / "b"))
+    assert astcache.default_cache().directory == str(tmp_path / "b")
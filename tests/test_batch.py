@@ -0,0 +1,59 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from analyzer import analyze_code
+from bench import generate_source
+from cache import ResultCache
+from columnar import SmellTable
+from pool import AnalysisPool
+
+FILES = [{"path": f"src/Generated{i}.java", "sourceCode": generate_source(1, 2 + i, 20, switch_cases=4)} for i in range(3)]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pool = AnalysisPool(workers=0, queue_depth=16, timeout=30)
+    monkeypatch.setattr(main, "pool", pool)
+    monkeypatch.setattr(main, "cache", ResultCache(directory=""))
+    yield TestClient(main.app)
+    pool.shutdown()
+
+
+def test_batch_reports_every_file_in_order(client):
+    files = FILES[:1] + [{"path": "src/Empty.java", "sourceCode": "  "}] + FILES[1:]
+    response = client.post("/api/analyze/batch", json={"files": files})
+
+    assert response.status_code == 200
+    reports = response.json()["files"]
+    assert [r["path"] for r in reports] == [f["path"] for f in files]
+    assert reports[1]["error"] == "Source code cannot be empty"
+    for entry, report in zip(files, reports):
+        if entry is not files[1]:
+            assert report == dict(analyze_code(entry["sourceCode"]), path=entry["path"])
+
+    # The second time every report comes from the cache
+    assert client.post("/api/analyze/batch", json={"files": files}).json() == response.json()
+    assert main.cache.hits == len(FILES)
+
+
+def test_columnar_batch_holds_the_same_reports(client):
+    plain = client.post("/api/analyze/batch", json={"files": FILES}).json()
+    response = client.post("/api/analyze/batch?format=columnar", json={"files": FILES})
+
+    assert list(SmellTable.from_dict(response.json()).reports()) == plain["files"]
+    assert response.json()["summary"] == plain["summary"]
+
+
+def test_batch_past_its_deadline_is_a_504(client, monkeypatch):
+    def slow(sources):
+        time.sleep(0.5)
+        return [analyze_code(source_code) for source_code in sources]
+
+    monkeypatch.setattr(main, "analyze_sources", slow)
+    monkeypatch.setattr(main.pool, "batch_timeout", lambda files: 0.05)
+
+    response = client.post("/api/analyze/batch", json={"files": FILES})
+    assert response.status_code == 504
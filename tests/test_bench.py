@@ -0,0 +1,37 @@
+import json
+
+import javalang
+
+import bench
+
+
+def test_generated_sources_parse_with_the_requested_shape():
+    source_code = bench.generate_source(3, 2, 5, switch_cases=4, chain_length=3)
+    tree = javalang.parse.parse(source_code)
+    classes = [node for _, node in tree.filter(javalang.tree.ClassDeclaration)]
+    assert len(classes) == 3
+    assert all(sum(1 for m in cls.methods if m.name.startswith("compute")) == 2 for cls in classes)
+
+
+def test_regressions_beyond_the_tolerance():
+    baseline = {"results": [{"scenario": "mixed", "phases": {"parse": {"median": 1.0}, "detect_all": {"median": 1.0}}}]}
+    report = {"results": [{"scenario": "mixed", "phases": {"parse": {"median": 1.05}, "detect_all": {"median": 1.5}}}]}
+
+    assert bench.regressions(report, baseline, 0.10) == [("mixed", "detect_all", 0.5)]
+
+
+def test_compare_fails_on_a_slower_run(tmp_path, capsys):
+    output = str(tmp_path / "bench.json")
+    assert bench.main(["-s", "mixed", "--scale", "0.05", "-r", "1", "-o", output]) == 0
+    with open(output) as f:
+        report = json.load(f)
+    [result] = report["results"]
+    assert result["scenario"] == "mixed" and "detect_all" in result["phases"]
+
+    # A baseline that ran every phase in no time at all
+    for phase in result["phases"].values():
+        phase["median"] = 1e-9
+    with open(output, "w") as f:
+        json.dump(report, f)
+    assert bench.main(["-s", "mixed", "--scale", "0.05", "-r", "1", "--compare", output]) == 1
+    assert "Regression: mixed/" in capsys.readouterr().err
@@ -0,0 +1,51 @@
+import os
+
+import cache
+from cache import ResultCache, cache_key
+
+THRESHOLDS = {"LONG_METHOD_LINES": 30}
+
+
+def test_memory_tier_evicts_the_least_recently_used_entry():
+    results = ResultCache(max_entries=2, directory="")
+    results.put("a", {"n": 1})
+    results.put("b", {"n": 2})
+    assert results.get("a") == {"n": 1}
+    results.put("c", {"n": 3})
+
+    assert results.get("b") is None
+    assert results.get("a") == {"n": 1}
+    assert results.get("c") == {"n": 3}
+    assert results.stats()["entries"] == 2
+
+
+def test_disk_tier_outlives_memory_eviction_and_restarts(tmp_path):
+    results = ResultCache(max_entries=1, directory=str(tmp_path))
+    results.put("aa11", {"n": 1})
+    results.put("bb22", {"n": 2})
+
+    assert results.get("aa11") == {"n": 1}
+    assert results.disk_hits == 1
+    restarted = ResultCache(max_entries=1, directory=str(tmp_path))
+    assert restarted.get("bb22") == {"n": 2}
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    results = ResultCache(max_entries=0, directory=str(tmp_path))
+    results.put("cc33", {"n": 1})
+    with open(os.path.join(tmp_path, "cc", "cc33.json"), "w") as f:
+        f.write("{trunc")
+
+    assert results.get("cc33") is None
+    assert results.misses == 1
+
+
+def test_key_changes_with_version_thresholds_and_variant(monkeypatch):
+    key = cache_key("class A {}", THRESHOLDS)
+    assert cache_key("class A {}", THRESHOLDS) == key
+    assert cache_key("class B {}", THRESHOLDS) != key
+    assert cache_key("class A {}", dict(THRESHOLDS, LONG_METHOD_LINES=31)) != key
+    assert cache_key("class A {}", THRESHOLDS, variant="ranges") != key
+
+    monkeypatch.setattr(cache, "CACHE_VERSION", cache.CACHE_VERSION + 1)
+    assert cache_key("class A {}", THRESHOLDS) != key
@@ -0,0 +1,57 @@
+import difflib
+
+from changes import analyze_changes, diff_changes, introduced_smells, parse_diff
+
+OLD = """class Orders {
+    void untouched(int a, int b, int c, int d, int e) { }
+    void grows(int a, int b, int c, int d, int e) { }
+    void small(int a) { }
+}
+"""
+NEW = """class Orders {
+    void untouched(int a, int b, int c, int d, int e) { }
+    void grows(int a, int b, int c, int d, int e, int f, int g) { }
+    void small(int a) { }
+    void added(int a, int b, int c, int d, int e, int f) { }
+}
+"""
+
+
+def unified(old, new, path="src/Orders.java"):
+    return "".join(difflib.unified_diff(old.splitlines(True), new.splitlines(True), f"a/{path}", f"b/{path}"))
+
+
+def test_hunks_become_changed_ranges_and_line_maps():
+    [diff] = parse_diff(unified(OLD, NEW))
+    assert (diff.old_path, diff.new_path, diff.status) == ("src/Orders.java", "src/Orders.java", "modified")
+    assert diff.changed_ranges() == [[3, 3], [5, 5]]
+    # Unchanged old lines move with the insertions before them; edited ones have no counterpart
+    assert [diff.map_line(line) for line in (1, 2, 3, 4, 5)] == [1, 2, None, 4, 6]
+    assert diff.reverse(NEW) == OLD
+
+
+def test_pure_deletion_touches_the_lines_around_it():
+    new = OLD.replace("    void small(int a) { }\n", "")
+    [diff] = parse_diff(unified(OLD, new))
+    assert diff.changed_ranges() == [[3, 4]]
+
+
+def test_only_new_or_worsened_smells_on_changed_lines_are_reported(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "Orders.java").write_text(NEW)
+    [report] = analyze_changes(diff_changes(unified(OLD, NEW), root=str(tmp_path)), jobs=1)
+    assert report["path"] == "src/Orders.java"
+    assert report["changedLines"] == [[3, 3], [5, 5]]
+    introduced = [(s["type"], s["location"], s["change"]) for s in report["smells"]]
+    assert introduced == [("Long Parameter List", "grows()", "worsened"), ("Long Parameter List", "added()", "new")]
+    assert report["smells"][0]["previous"]["reason"] == "Method has 5 parameters"
+
+
+def test_line_locations_are_matched_after_renumbering():
+    [diff] = parse_diff(unified("a\nb\nc\n", "new\na\nb\nc\n"))
+    old = [{"type": "Duplicate Code", "location": "Lines 1-2", "severity": "Low", "reason": "6 lines"}]
+    # Same smell, moved down by the inserted line: not introduced, though its lines cover the edit
+    moved = [dict(old[0], location="Lines 2-3", lines=[[1, 3]])]
+    assert introduced_smells(old, moved, diff) == []
+    touching = [dict(old[0], location="Lines 1-3", lines=[[1, 3]])]
+    assert [s["change"] for s in introduced_smells(old, touching, diff)] == ["new"]
@@ -0,0 +1,84 @@
+import pytest
+
+import clones
+from bench import generate_source
+from clones import CloneIndex, TokenCloneIndex, line_fingerprints, rolling_hashes, token_fingerprints
+from spans import lex
+
+BLOCK = """int total = 0;
+for (int i = 0; i < items.length; i++) {
+    total += items[i].price * items[i].quantity;
+}
+if (total > limit) {
+    total = limit;
+}
+return total;""".splitlines()
+
+
+def test_rolling_hashes_match_hashing_every_window():
+    hashes = [7, 3, 11, 5, 3, 11, 5, 2]
+
+    def direct(window):
+        value = 0
+        for h in window:
+            value = (value * clones._BASE + h) % clones._MOD
+        return value
+
+    assert list(rolling_hashes(hashes, 3)) == [direct(hashes[i:i + 3]) for i in range(len(hashes) - 2)]
+    assert list(rolling_hashes(hashes[:2], 3)) == []
+
+
+def test_line_fingerprints_skip_blank_lines_and_ignore_indentation():
+    numbers, hashes = line_fingerprints(["int a = 1;", "", "   ", "\tint a = 1;  ", "a++;"])
+
+    assert list(numbers) == [1, 4, 5]
+    assert hashes[0] == hashes[1] != hashes[2]
+    # Stable across processes (no str hash randomization), so workers can send them to the parent
+    assert list(line_fingerprints(["a++;"])[1]) == [hashes[2]]
+
+
+def test_line_clones_across_files():
+    index = CloneIndex(window_size=6)
+    assert index.add("A.java", ["class A {"] + BLOCK + ["}"]) == []
+    found = index.add("B.java", ["class B {", "  // copied"] + ["    " + line for line in BLOCK] + ["}"])
+    # Whitespace is ignored and the closing brace matches too
+    assert [c.as_dict() for c in found] == [{
+        "path": "B.java", "startLine": 3, "endLine": 11,
+        "otherPath": "A.java", "otherStartLine": 2, "otherEndLine": 10, "lines": 9}]
+
+
+def fingerprints(source_code):
+    spans, _ = lex(source_code)
+    return token_fingerprints(spans.values, spans.lines)
+
+
+def test_token_clones_survive_renames_and_changed_literals():
+    renamed = [line.replace("total", "sum").replace("limit", "cap").replace("0", "1") for line in BLOCK]
+    index = TokenCloneIndex(window_size=30)
+    index.add_fingerprints("A.java", *fingerprints("\n".join(["class A { int f() {"] + BLOCK + ["} }"])))
+    index.add_fingerprints("B.java", *fingerprints("\n".join(["class B { int g() {"] + renamed + ["} }"])))
+    found = [c.as_dict() for c in index.clones()]
+    assert [(c["path"], c["otherPath"], c["startLine"], c["otherStartLine"]) for c in found] == [("B.java", "A.java", 1, 1)]
+    assert found[0]["endLine"] == found[0]["otherEndLine"] == len(BLOCK) + 2
+
+
+def clone_pairs(files, numpy_min_tokens, monkeypatch):
+    monkeypatch.setattr(clones, "NUMPY_MIN_TOKENS", numpy_min_tokens)
+    index = TokenCloneIndex(window_size=50)
+    for path, source_code in files:
+        index.add_fingerprints(path, *fingerprints(source_code))
+    return [c.as_dict() for c in index.clones()]
+
+
+def test_numpy_and_pure_python_find_the_same_clones(monkeypatch):
+    pytest.importorskip("numpy")
+    files = [
+        ("Mixed.java", generate_source(classes=6, methods=3, statements=5, switch_cases=4, chain_length=3)),
+        ("Long.java", generate_source(classes=2, methods=2, statements=12)),
+        ("Copy.java", "class Copy { int f(int[] items, int limit) {\n" + "\n".join(BLOCK) + "\n} }\n"
+                      "class Paste { int g(int[] xs, int max) {\n" + "\n".join(BLOCK).replace("total", "t") + "\n} }\n"),
+    ]
+    with_numpy = clone_pairs(files, 0, monkeypatch)
+    without_numpy = clone_pairs(files, float("inf"), monkeypatch)
+    assert with_numpy
+    assert with_numpy == without_numpy
@@ -0,0 +1,56 @@
+from javalang.tree import ClassDeclaration
+
+from astcache import parse_source
+from codemetrics import MetricsTable
+from engine import Rule, run_rules
+
+SOURCE = """class Cart {
+    private int total;
+    private String owner;
+
+    public int getTotal() { return total; }
+
+    void add(int price, int quantity) {
+        int total = price * quantity;
+        this.total += total;
+    }
+
+    void rename(String owner) {
+        this.owner = owner;
+    }
+}
+"""
+
+
+class UsageOf(Rule):
+    # Reads the usage facts the table collects during the walk
+    node_types = (ClassDeclaration,)
+    needs_usage = True
+
+    def visit(self, node, ancestors):
+        self.node = node
+
+    def finish(self, source_code_lines):
+        usage = self.metrics.cls(self.node).field_usage
+        self.smells = [(name, [m.name for m in usage.methods_using(name)]) for name in usage.field_ids]
+        return self.smells
+
+
+def test_declaration_facts_are_computed_once_and_end_at_the_closing_brace():
+    tree, spans = parse_source(SOURCE)
+    [cart] = [node for _, node in tree.filter(ClassDeclaration)]
+    table = MetricsTable(spans)
+
+    metrics = table.cls(cart)
+    assert table.cls(cart) is metrics
+    assert (metrics.start_line, metrics.end_line, metrics.field_names, metrics.accessor_count) == (1, 15, ["total", "owner"], 1)
+    assert [(m.name, m.start_line, m.loc, m.parameter_count) for m in metrics.methods] == [
+        ("getTotal", 5, 1, 0), ("add", 7, 4, 2), ("rename", 12, 3, 1)]
+    assert table.method(cart.methods[1]) is metrics.methods[1]
+
+
+def test_field_uses_skip_shadowing_locals_and_parameters():
+    tree, spans = parse_source(SOURCE)
+    uses = run_rules(tree, SOURCE.splitlines(), [UsageOf], metrics=MetricsTable(spans))
+    # `add` only touches the field through this.total; `rename` assigns this.owner
+    assert uses == [("total", ["getTotal", "add"]), ("owner", ["rename"])]
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from analyzer import analyze_code
+from bench import generate_source
+from columnar import FORMAT, SmellTable, table_of
+from inputs import error_report
+
+
+def sample_reports():
+    reports = [dict(analyze_code(generate_source(2, 3, 30, switch_cases=5, chain_length=4)), path="src/A.java"),
+               dict(analyze_code("class Empty { }"), path="src/Empty.java"),
+               error_report("src/Bad.java", "class {", "Parse Error: unexpected token")]
+    # A huge file needs 32-bit columns; a report without a path and smells with extra fields must survive too
+    reports.append({"summary": {"totalLines": 70000, "totalSmells": 1}, "smells": [
+        {"type": "Long Method", "location": "Line 69000", "severity": "High", "reason": "Method has 900 lines",
+         "suggestedRefactoring": "Extract Method", "lines": [[69000, 69900]]}]})
+    return reports
+
+
+def test_json_round_trip_gives_back_the_reports():
+    reports = sample_reports()
+    data = json.loads(json.dumps(table_of(reports).as_dict()))
+
+    assert data["format"] == FORMAT
+    assert list(SmellTable.from_dict(data).reports()) == reports
+
+
+def test_binary_columns_round_trip_and_accept_more_reports():
+    reports = sample_reports()
+    data = table_of(reports[:3]).as_dict(binary=True)
+    assert all(isinstance(column, bytes) for name, column in data["smells"].items() if name != "extra")
+
+    table = SmellTable.from_dict(data)
+    table.add_report(reports[3])
+    assert list(table.reports()) == reports
+    assert table.counts()["Long Method"] >= 1
+
+
+def test_msgpack_round_trip():
+    pytest.importorskip("msgpack")
+    reports = sample_reports()
+    payload = table_of(reports).to_msgpack(extra={"summary": {"totalFiles": len(reports)}})
+
+    assert list(SmellTable.from_msgpack(payload).reports()) == reports
+
+
+def test_other_formats_are_rejected():
+    with pytest.raises(ValueError):
+        SmellTable.from_dict({"format": "smells-columnar/0"})
@@ -0,0 +1,41 @@
+import pytest
+
+from analyzer import analyze_code, analyze_incremental
+from bench import generate_source
+
+SOURCE = generate_source(3, 4, 12, switch_cases=6, chain_length=4)
+LONG_BODY = "".join(f"        total += a * {i};\n" for i in range(40))
+
+EDITS = {
+    "longer method": lambda s: s.replace("        int total = 0;\n", "        int total = 0;\n" + LONG_BODY, 1),
+    "lines shifted": lambda s: "// header\n\n" + s,
+    "method added": lambda s: s.replace("class Generated1 {\n", "class Generated1 {\n    void extra(int a, int b, String name, Object extra) { }\n", 1),
+    "method removed": lambda s: s.replace("    public int getCount0() { return count0; }\n", "", 1),
+    "class renamed": lambda s: s.replace("Generated2", "Renamed2"),
+    "new parameter group": lambda s: s.replace("String name, Object extra", "String name, long extra", 2),
+}
+
+
+@pytest.mark.parametrize("edit", EDITS.values(), ids=list(EDITS))
+def test_incremental_matches_a_full_analysis(edit):
+    _, entries = analyze_incremental(SOURCE)
+    edited = edit(SOURCE)
+    assert edited != SOURCE
+
+    report, _ = analyze_incremental(edited, previous=entries)
+
+    assert report["incremental"]["reusedScopes"] > 0
+    full = analyze_code(edited)
+    assert report["summary"] == full["summary"]
+    assert report["smells"] == full["smells"]
+
+
+def test_syntax_error_keeps_the_previous_state():
+    _, entries = analyze_incremental(SOURCE)
+    _, kept = analyze_incremental(SOURCE.replace("{", "", 1), previous=entries)
+    assert kept is entries
+
+    edited = EDITS["longer method"](SOURCE)
+    report, _ = analyze_incremental(edited, previous=kept)
+    assert report["incremental"]["reusedScopes"] > 0
+    assert report["smells"] == analyze_code(edited)["smells"]
@@ -0,0 +1,28 @@
+import pytest
+
+from inputs import check_source, count_lines, error_report
+
+
+@pytest.mark.parametrize("source_code", [
+    "", "a", "a\n", "a\nb", "a\r\nb\r\n", "a\rb\rc", "a\r\r\nb", "\n\n",
+    "a\x0bb\x0cc", "a\x1cb\x1dc\x1ed", "a\x85b", "a b ", "class A {}\r",
+])
+def test_count_lines_matches_splitlines(source_code):
+    assert count_lines(source_code) == len(source_code.splitlines())
+
+
+def test_line_limit_counts_every_line_break():
+    assert check_source("x;\r" * 3, max_bytes=100, max_lines=2) == "Source code exceeds 2 lines limit"
+    assert check_source("x; " * 2, max_bytes=100, max_lines=2) is None
+
+
+def test_byte_limit_counts_utf8_bytes():
+    assert check_source("é" * 5, max_bytes=10) is None
+    assert check_source("é" * 6, max_bytes=10) == "Source code exceeds 10 bytes limit"
+    assert check_source("x" * 11, max_bytes=10) == "Source code exceeds 10 bytes limit"
+
+
+def test_empty_sources_are_rejected():
+    assert check_source("", max_bytes=10) == check_source(" \n\t", max_bytes=10) == "Source code cannot be empty"
+    assert error_report("A.java", "a\rb", "bad") == {
+        "path": "A.java", "error": "bad", "summary": {"totalLines": 2, "totalSmells": 0}, "smells": []}
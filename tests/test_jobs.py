@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+import jobs
+from jobs import JobRunner, JobStore, work
+
+
+class BrokenPool:
+    workers = 1
+
+    async def run(self, fn, *args, timeout=None):
+        raise RuntimeError("worker crashed")
+
+
+def test_failed_chunk_is_stored_as_error_reports(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.submit([("A.java", "class A {}"), ("B.java", "class B {}")])
+    runner = JobRunner(store, BrokenPool(), analyze_many=None)
+
+    asyncio.run(runner.run_for(5))
+
+    assert store.status(job_id)["status"] == "done"
+    assert store.status(job_id)["progress"]["failed"] == 2
+    reports = [json.loads(report) for report in store.results(job_id)]
+    assert [(r["path"], r["error"]) for r in reports] == [("A.java", "Runtime Error: worker crashed"),
+                                                         ("B.java", "Runtime Error: worker crashed")]
+    store.close()
+
+
+def test_standalone_worker_stores_failed_files(tmp_path, monkeypatch):
+    def analyze_code(source_code):
+        if "B" in source_code:
+            raise ValueError("parser bug")
+        return {"summary": {"totalLines": 1, "totalSmells": 0}, "smells": []}
+
+    monkeypatch.setattr(jobs, "analyze_code", analyze_code)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.submit([("A.java", "class A {}"), ("B.java", "class B {}")])
+
+    work(store, once=True)
+
+    assert store.status(job_id)["status"] == "done"
+    reports = [json.loads(report) for report in store.results(job_id)]
+    assert [(r["path"], r.get("error")) for r in reports] == [("A.java", None), ("B.java", "Runtime Error: parser bug")]
+    store.close()
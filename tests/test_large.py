@@ -0,0 +1,51 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from analyzer import analyze_code
+from bench import generate_source
+from cache import ResultCache
+from pool import AnalysisPool
+
+# Past the line limit of /api/analyze
+SOURCE = generate_source(4, 6, 20, switch_cases=4, chain_length=3)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pool = AnalysisPool(workers=0, queue_depth=16, timeout=30)
+    monkeypatch.setattr(main, "pool", pool)
+    monkeypatch.setattr(main, "cache", ResultCache(directory=""))
+    yield TestClient(main.app)
+    pool.shutdown()
+
+
+def test_large_sources_skip_the_line_limit(client):
+    assert len(SOURCE.splitlines()) > main.MAX_LINES
+    assert client.post("/api/analyze", json={"sourceCode": SOURCE}).status_code == 400
+
+    raw = client.post("/api/analyze/large", content=SOURCE.encode(), headers={"Content-Type": "text/plain"})
+    wrapped = client.post("/api/analyze/large", json={"sourceCode": SOURCE})
+    assert raw.status_code == wrapped.status_code == 200
+    assert raw.json() == wrapped.json() == analyze_code(SOURCE)
+
+
+def test_byte_budget_is_enforced_while_reading(client, monkeypatch):
+    monkeypatch.setattr(main, "MAX_BYTES", 1000)
+    declared = client.post("/api/analyze/large", content=SOURCE.encode(), headers={"Content-Type": "text/plain"})
+    assert declared.status_code == 413
+
+    def chunks():
+        # No Content-Length: refused once the stream passes the budget
+        for start in range(0, len(SOURCE), 500):
+            yield SOURCE[start:start + 500].encode()
+
+    streamed = client.post("/api/analyze/large", content=chunks(), headers={"Content-Type": "text/plain"})
+    assert streamed.status_code == 413
+
+
+def test_bad_json_is_a_400(client):
+    response = client.post("/api/analyze/large", content=json.dumps({"code": SOURCE}), headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
@@ -0,0 +1,91 @@
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+from analyzer import analyze_incremental
+from lsp import TextDocument, diagnostics, read_message, write_message
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+SOURCE = """class A {
+    void run(int a, int b, int c, int d, int e, int f) { }
+    String s = "\U0001F600"; int x = 1;
+}
+"""
+
+
+def test_range_edits_count_utf16_code_units():
+    document = TextDocument("file:///A.java", SOURCE, 1)
+    # The emoji is two UTF-16 code units, so "int" starts 3 units after the opening quote
+    quote = SOURCE.split("\n")[2].index('"')
+    document.apply({"range": {"start": {"line": 2, "character": quote + 1}, "end": {"line": 2, "character": quote + 3}},
+                    "text": "ab"})
+    assert document.line(2) == '    String s = "ab"; int x = 1;'
+
+    utf32 = TextDocument("file:///A.java", SOURCE, 1, utf16=False)
+    utf32.apply({"range": {"start": {"line": 2, "character": quote + 1}, "end": {"line": 2, "character": quote + 2}},
+                 "text": "ab"})
+    assert utf32.text == document.text
+
+
+def test_smells_point_at_the_declared_name():
+    document = TextDocument("file:///A.java", SOURCE, 1)
+    report, _ = analyze_incremental(SOURCE, locate=True)
+    [parameters] = [d for d in diagnostics(document, report) if d["code"] == "Long Parameter List"]
+    assert parameters["range"] == {"start": {"line": 1, "character": 9}, "end": {"line": 1, "character": 12}}
+
+    broken = diagnostics(document, {"error": "Syntax Error at line 2", "summary": {}, "smells": []})
+    assert [d["range"]["start"]["line"] for d in broken] == [1]
+
+
+def test_session_publishes_the_latest_version():
+    server = subprocess.Popen([sys.executable, "lsp.py", "--debounce", "0.3"], cwd=BACKEND,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    received = queue.Queue()
+
+    def read():
+        while True:
+            message = read_message(server.stdout)
+            received.put(message)
+            if message is None:
+                return
+
+    threading.Thread(target=read, daemon=True).start()
+
+    def send(**message):
+        write_message(server.stdin, dict(jsonrpc="2.0", **message))
+
+    def receive():
+        return received.get(timeout=30)
+
+    try:
+        send(id=1, method="initialize", params={"capabilities": {}})
+        assert receive()["id"] == 1
+        send(method="initialized", params={})
+
+        uri = "file:///tmp/A.java"
+        send(method="textDocument/didOpen", params={"textDocument": {"uri": uri, "languageId": "java", "version": 1, "text": SOURCE}})
+        published = receive()
+        assert published["method"] == "textDocument/publishDiagnostics"
+        assert published["params"]["version"] == 1
+        assert "Long Parameter List" in {d["code"] for d in published["params"]["diagnostics"]}
+
+        # A burst of edits is analyzed once, for its last version
+        for version in range(2, 6):
+            send(method="textDocument/didChange", params={"textDocument": {"uri": uri, "version": version}, "contentChanges": [
+                {"range": {"start": {"line": 0, "character": 0}, "end": {"line": 0, "character": 0}}, "text": "\n"}]})
+        published = receive()
+        assert published["params"]["version"] == 5
+        [parameters] = [d for d in published["params"]["diagnostics"] if d["code"] == "Long Parameter List"]
+        assert parameters["range"]["start"]["line"] == 5
+
+        send(method="textDocument/didClose", params={"textDocument": {"uri": uri}})
+        assert receive()["params"]["diagnostics"] == []
+        send(id=2, method="shutdown")
+        assert receive()["id"] == 2
+        send(method="exit")
+        assert server.wait(10) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
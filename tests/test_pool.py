@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import pool as pool_module
+from pool import AnalysisPool, WorkerLost
+
+
+class FailingExecutor(ThreadPoolExecutor):
+    """Accepts `accepted` submissions, then fails like a broken process pool."""
+
+    def __init__(self, accepted):
+        super().__init__(max_workers=1)
+        self.accepted = accepted
+
+    def submit(self, fn, *args):
+        if self.accepted == 0:
+            raise RuntimeError("executor is broken")
+        self.accepted -= 1
+        return super().submit(fn, *args)
+
+
+def pool_with(executor):
+    pool = AnalysisPool(workers=0, queue_depth=8, timeout=5)
+    pool._executor = executor
+    return pool
+
+
+def test_run_releases_the_slot_when_submit_fails():
+    pool = pool_with(FailingExecutor(accepted=0))
+    with pytest.raises(RuntimeError):
+        asyncio.run(pool.run(len, "abc"))
+    assert pool.pending == 0
+    pool.shutdown()
+
+
+def test_run_many_releases_every_slot_when_submit_fails_partway():
+    pool = pool_with(FailingExecutor(accepted=2))
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await pool.run_many(len, ["a", "bb", "ccc", "dddd", "eeeee"])
+        # Submitted items free their slots once they finish or are cancelled
+        for _ in range(100):
+            if pool.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert pool.pending == 0
+    pool.shutdown()
+
+
+def test_batch_timeout_grows_with_the_files_per_worker(monkeypatch):
+    monkeypatch.setitem(pool_module.POOL_SETTINGS, "BATCH_TIMEOUT", 100)
+    pool = AnalysisPool(workers=4, queue_depth=8, timeout=10)
+    assert pool.batch_timeout(0) == 10
+    assert pool.batch_timeout(4) == 10
+    assert pool.batch_timeout(9) == 30
+    assert pool.batch_timeout(1000) == 100
+
+
+def test_run_many_times_out_as_a_whole():
+    pool = AnalysisPool(workers=0, queue_depth=8, timeout=5)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run_many(time.sleep, [0.5, 0.5], timeout=0.1)
+
+    asyncio.run(scenario())
+    pool.shutdown()
+
+
+def _die(_):
+    # Ends the worker process the way an OOM kill or a segfault would
+    os._exit(1)
+
+
+def test_pool_recovers_after_a_worker_dies():
+    pool = AnalysisPool(workers=1, queue_depth=8, timeout=60)
+
+    async def scenario():
+        assert await pool.run(len, "abc") == 3
+        with pytest.raises(WorkerLost):
+            await pool.run(_die, None)
+        return await pool.run(len, "ab")
+
+    try:
+        assert asyncio.run(scenario()) == 2
+        assert pool.pending == 0
+    finally:
+        pool.shutdown()
+
+
+def _warm_up():
+    os.environ["POOL_TEST_WARM"] = str(os.getpid())
+
+
+def _warmed_by(_):
+    return os.environ.get("POOL_TEST_WARM"), os.getpid()
+
+
+def test_prewarm_starts_workers_that_ran_the_warmup():
+    pool = AnalysisPool(workers=2, queue_depth=8, timeout=60, warmup=_warm_up)
+    try:
+        pool.prewarm()
+        assert len(pool._executor._processes) == 2
+        warmed, pid = asyncio.run(pool.run(_warmed_by, None))
+        assert warmed == str(pid) != str(os.getpid())
+    finally:
+        pool.shutdown()
@@ -0,0 +1,31 @@
+import pytest
+
+from analyzer import analyze_code
+from bench import generate_source
+
+SOURCE = generate_source(3, 4, 12, switch_cases=6, chain_length=4)
+TOKEN_SMELLS = {"Switch Statements", "Duplicate Code", "Message Chains"}
+
+
+def test_quick_finds_the_token_smells_of_a_full_analysis():
+    quick = analyze_code(SOURCE, quick=True)
+    full = analyze_code(SOURCE)
+
+    assert quick["quick"] is True
+    assert {smell["type"] for smell in quick["smells"]} == TOKEN_SMELLS
+    assert quick["smells"] == [smell for smell in full["smells"] if smell["type"] in TOKEN_SMELLS]
+    assert quick["summary"] == {"totalLines": full["summary"]["totalLines"], "totalSmells": len(quick["smells"])}
+
+
+def test_quick_checks_sources_that_do_not_parse():
+    broken = SOURCE.replace("{", "", 2)
+    assert "error" in analyze_code(broken, recover=False)
+
+    report = analyze_code(broken, quick=True)
+    assert "error" not in report
+    assert report["summary"]["totalSmells"] > 0
+
+
+def test_quick_has_no_symbols():
+    with pytest.raises(ValueError):
+        analyze_code(SOURCE, quick=True, symbols=True)
@@ -0,0 +1,77 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import recovery
+from analyzer import analyze_code
+from recovery import recover_tree
+
+BROKEN = """class Good {
+    int a;
+    int ok() { return a; }
+    void broken() { int x = ; }
+    int alsoOk(int p) { return p + 1; }
+}
+class Other { void f() { } }
+interface Bad { void g( }
+"""
+
+
+def outline(tree):
+    return [(t.name, [(m.name, m.position.line) for m in t.methods]) for t in tree.types]
+
+
+def test_members_around_a_broken_method_are_recovered():
+    tree, tokens, errors = recover_tree(BROKEN, workers=1)
+    # Recovered members keep their positions in the original file
+    assert outline(tree) == [("Good", [("ok", 3), ("alsoOk", 5)]), ("Other", [("f", 7)]), ("Bad", [])]
+    assert [(e["location"], e["region"]) for e in errors] == [
+        ("Lines 4-4", "class Good > broken()"), ("Lines 8-8", "interface Bad > g()")]
+
+
+def test_parallel_recovery_matches_serial():
+    serial = recover_tree(BROKEN, workers=1)
+    parallel = recover_tree(BROKEN, workers=2)
+    assert outline(parallel[0]) == outline(serial[0])
+    assert parallel[2] == serial[2]
+
+
+class _NoNestedPool:
+    def __init__(self, *args, **kwargs):
+        raise AssertionError("a worker process started a pool of its own")
+
+
+def _recover_in_worker(source_code):
+    recovery.ProcessPoolExecutor = _NoNestedPool
+    tree, _, errors = recover_tree(source_code, workers=2)
+    return outline(tree), errors
+
+
+def test_worker_processes_recover_serially():
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        recovered, errors = pool.submit(_recover_in_worker, BROKEN).result()
+    tree, _, expected = recover_tree(BROKEN, workers=1)
+    assert recovered == outline(tree)
+    assert errors == expected
+
+
+def test_unterminated_string_does_not_swallow_the_rest_of_the_file():
+    source_code = 'class A { String s = "open; }\nclass B { void g() {} }\n'
+    tree, _, errors = recover_tree(source_code, workers=1)
+    assert [t.name for t in tree.types] == ["A", "B"]
+    assert [e["error"] for e in errors] == ["Lexical Error: unterminated string literal at line 1"]
+
+
+def test_nothing_to_recover():
+    tree, _, errors = recover_tree("class { ", workers=1)
+    assert tree is None
+    assert len(errors) == 1
+
+
+def test_analysis_reports_parse_errors_next_to_recovered_smells():
+    source_code = BROKEN.replace("int alsoOk(int p)", "int alsoOk(int p, int q, int r, int s, int t)")
+    report = analyze_code(source_code)
+    assert [e["region"] for e in report["parseErrors"]] == ["class Good > broken()", "interface Bad > g()"]
+    assert "Long Parameter List" in [smell["type"] for smell in report["smells"]]
+
+    strict = analyze_code(source_code, recover=False)
+    assert strict["error"].startswith("Syntax Error") and strict["smells"] == []
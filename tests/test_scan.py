@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+from analyzer import analyze_code
+from bench import generate_source
+from columnar import SmellTable
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def make_tree(root):
+    files = {os.path.join("a", f"Generated{i}.java"): generate_source(1, 2 + i, 10, switch_cases=i) for i in range(4)}
+    files["Bad.java"] = "class {"
+    os.makedirs(os.path.join(root, "a"))
+    for path, source_code in dict(files, **{"notes.txt": "not java"}).items():
+        with open(os.path.join(root, path), "w") as f:
+            f.write(source_code)
+    return {os.path.join(root, path): source_code for path, source_code in files.items()}
+
+
+def scan(*args):
+    done = subprocess.run([sys.executable, "scan.py", *args], cwd=BACKEND, capture_output=True, timeout=120)
+    assert done.returncode == 0, done.stderr.decode()
+    return done.stdout, done.stderr.decode()
+
+
+def test_every_java_file_is_reported_once(tmp_path):
+    files = make_tree(str(tmp_path))
+    out, summary = scan(str(tmp_path), "-j", "2", "--chunk-size", "2")
+
+    reports = [json.loads(line) for line in out.decode().splitlines()]
+    assert sorted(report["path"] for report in reports) == sorted(files)
+    for report in reports:
+        if "error" not in report:
+            assert report == dict(analyze_code(files[report["path"]]), path=report["path"])
+    assert f"Scanned {len(files)} files" in summary
+    assert "Files with errors: 1" in summary
+
+
+def test_columnar_output_holds_the_same_reports(tmp_path):
+    make_tree(str(tmp_path))
+    ndjson, _ = scan(str(tmp_path), "-j", "2")
+    columnar, _ = scan(str(tmp_path), "-j", "2", "--format", "columnar")
+
+    reports = sorted((json.loads(line) for line in ndjson.decode().splitlines()), key=lambda report: report["path"])
+    table = SmellTable.from_dict(json.loads(columnar))
+    assert sorted(table.reports(), key=lambda report: report["path"]) == reports
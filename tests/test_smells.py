@@ -0,0 +1,51 @@
+from analyzer import analyze_code
+
+
+def smells_of(source_code, smell_type):
+    return [smell for smell in analyze_code(source_code)["smells"] if smell["type"] == smell_type]
+
+
+def test_middle_man_delegating_to_a_field():
+    source_code = """class Employee {
+    Department department;
+    String name() { return department.getName(); }
+    String code() { return this.department.getCode(); }
+    void rename(String name) { department.setName(name); }
+}"""
+    smells = smells_of(source_code, "Middle Man")
+    assert [smell["reason"] for smell in smells] == ["3 of 3 methods only delegate to 'department'"]
+
+
+def test_middle_man_ignores_parameters_shadowing_the_field():
+    source_code = """class Employee {
+    Department department;
+    String name(Department department) { return department.getName(); }
+    String code(Department department) { return department.getCode(); }
+    String id(Department department) { return department.getId(); }
+}"""
+    assert smells_of(source_code, "Middle Man") == []
+
+
+def test_temporary_field_ignores_shadowed_names():
+    source_code = """class Report {
+    int total;
+    void add(int total) { total++; }
+    void print() { int total = 0; System.out.println(total); }
+    void reset() { this.total = 0; }
+}"""
+    smells = smells_of(source_code, "Temporary Field")
+    assert [(smell["location"], smell["reason"]) for smell in smells] == [
+        ("Field 'total'", "Field used mainly in single method 'reset'")]
+
+
+def test_refused_bequest_for_declared_or_thrown_refusals():
+    source_code = """class ReadOnlyList extends Base {
+    void add(Object item) throws UnsupportedOperationException { store(item); }
+    void remove(Object item) { throw new UnsupportedOperationException("read only"); }
+    void clear() { throw new IllegalStateException(); }
+    void log() { if (verbose) { throw new UnsupportedOperationException(); } }
+}"""
+    smells = smells_of(source_code, "Refused Bequest")
+    assert [(smell["location"], smell["reason"]) for smell in smells] == [
+        ("add()", "Method throws UnsupportedOperationException"),
+        ("remove()", "Method body only throws UnsupportedOperationException")]
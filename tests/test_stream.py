@@ -0,0 +1,33 @@
+import os
+
+from analyzer import analyze_code, analyze_stream, replay_stream
+
+with open(os.path.join(os.path.dirname(__file__), "..", "final_comprehensive_smell.java")) as f:
+    SOURCE = f.read()
+
+
+def test_stream_ends_with_the_report_analyze_code_returns():
+    events = list(analyze_stream(SOURCE))
+    kinds = [event for event, _ in events]
+    assert kinds[0] == "parsed" and kinds[-2:] == ["summary", "report"]
+    assert set(kinds[1:-2]) == {"smell"}
+
+    report = events[-1][1]
+    assert report == analyze_code(SOURCE)
+    # Every smell was sent once before the report, in discovery order
+    streamed = [data for event, data in events if event == "smell"]
+    assert sorted(map(repr, streamed)) == sorted(map(repr, report["smells"]))
+    assert events[-2][1] == report["summary"]
+
+
+def test_unparsable_source_sends_a_single_error():
+    [(event, report)] = list(analyze_stream("class {", recover=False))
+    assert event == "error" and report["error"].startswith("Syntax Error")
+
+
+def test_replay_of_a_cached_report():
+    report = analyze_code(SOURCE)
+    events = list(replay_stream(report))
+    assert events[0] == ("parsed", {"totalLines": report["summary"]["totalLines"], "parseSeconds": 0.0})
+    assert [data for event, data in events if event == "smell"] == report["smells"]
+    assert events[-1] == ("summary", report["summary"])
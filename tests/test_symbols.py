@@ -0,0 +1,73 @@
+import json
+
+from analyzer import analyze_code
+from symbols import ProjectIndex
+
+FILES = {
+    "Repository.java": """class Repository {
+    void save(String key, String value, int version, long stamp) { }
+    void purge() { }
+}
+""",
+    "Service.java": """class Service {
+    private Repository repository = new Repository();
+    public void store(String key, String value, int version, long stamp) {
+        repository.save(key, value, version, stamp);
+    }
+}
+""",
+    "Base.java": """class Base {
+    public void close() { }
+}
+""",
+    "Stream.java": """class Stream extends Base {
+    public void close() { throw new UnsupportedOperationException(); }
+}
+""",
+}
+
+
+def symbols_of(source_code):
+    return analyze_code(source_code, symbols=True)["symbols"]
+
+
+def index_of(files):
+    index = ProjectIndex()
+    for path, source_code in files.items():
+        index.update(path, symbols_of(source_code))
+    return index
+
+
+def test_smells_that_span_files():
+    smells = {(s["type"], s["location"], s["path"]) for s in index_of(FILES).smells()}
+    assert smells == {
+        ("Dead Code", "Repository.purge()", "Repository.java"),
+        ("Refused Bequest", "Stream.close()", "Stream.java"),
+        ("Data Clumps", "Project (Method Parameters)", "Repository.java"),
+    }
+
+
+def test_updating_one_file_matches_a_fresh_index():
+    index = index_of(FILES)
+    edited = dict(FILES, **{"Service.java": FILES["Service.java"].replace("repository.save", "repository.purge(); repository.save")})
+    index.update("Service.java", symbols_of(edited["Service.java"]))
+    index.remove("Stream.java")
+    del edited["Stream.java"]
+
+    assert index.smells() == index_of(edited).smells()
+    assert "Dead Code" not in {s["type"] for s in index.smells()}
+
+
+def test_saved_index_loads_back_unless_outdated(tmp_path):
+    index = index_of(FILES)
+    filename = str(tmp_path / "project.json")
+    index.save(filename)
+
+    assert ProjectIndex.load(filename).smells() == index.smells()
+
+    with open(filename) as f:
+        data = json.load(f)
+    data["version"] = -1
+    with open(filename, "w") as f:
+        json.dump(data, f)
+    assert len(ProjectIndex.load(filename)) == 0
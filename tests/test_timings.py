@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+from analyzer import analyze_code
+from bench import generate_source
+from cache import ResultCache
+from pool import AnalysisPool
+from smells import ALL_RULES, RULE_FAMILIES
+
+SOURCE = generate_source(2, 4, 15, switch_cases=4, chain_length=3)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pool = AnalysisPool(workers=0, queue_depth=16, timeout=30)
+    monkeypatch.setattr(main, "pool", pool)
+    monkeypatch.setattr(main, "cache", ResultCache(directory=""))
+    yield TestClient(main.app)
+    pool.shutdown()
+
+
+def test_rule_timings_cover_every_rule_and_family():
+    report = analyze_code(SOURCE, timings="rules")
+    timings = report.pop("timings")
+
+    assert report == analyze_code(SOURCE)
+    assert {rule.__name__ for rule in ALL_RULES} <= set(timings["rules"])
+    assert set(timings["families"]) == set(RULE_FAMILIES)
+    assert sum(timings["rules"].values()) <= timings["detect"] + 1e-3
+    assert timings["total"] == pytest.approx(timings["parse"] + timings["detect"])
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "Test.", ("phase",), buckets=(0.1, 1.0))
+    metrics.REGISTRY.remove(histogram)
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, phase="parse")
+
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{phase="parse",le="0.1"} 1',
+        'test_seconds_bucket{phase="parse",le="1.0"} 2',
+        'test_seconds_bucket{phase="parse",le="+Inf"} 3',
+        'test_seconds_sum{phase="parse"} 5.55',
+        'test_seconds_count{phase="parse"} 3',
+    ]
+
+
+def test_instrumented_requests_report_timings_and_feed_metrics(client):
+    response = client.post("/api/analyze?timings=1", json={"sourceCode": SOURCE})
+    timings = response.json()["timings"]
+    assert {"parse", "detect", "queue", "serialize", "rules"} <= set(timings)
+
+    # Plain requests are answered without timings
+    assert "timings" not in client.post("/api/analyze", json={"sourceCode": SOURCE}).json()
+    text = client.get("/metrics").text
+    assert 'analysis_phase_seconds_count{phase="parse"}' in text
+    assert "analysis_cache_hits_total 1" in text
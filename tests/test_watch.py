@@ -0,0 +1,49 @@
+import os
+
+from analyzer import analyze_code
+from watch import Workspace
+
+ORDERS = """class Orders {
+    void place(int a, int b, int c, int d, int e, int f) { }
+}
+"""
+
+
+def save(path, text, mtime):
+    with open(path, "w") as f:
+        f.write(text)
+    # Distinct timestamps even on filesystems with coarse ones
+    os.utime(path, ns=(mtime, mtime))
+
+
+def sync(workspace):
+    changed, removed = workspace.changes()
+    events = [workspace.update(path, signature) for path, signature in changed]
+    events += [workspace.remove(path) for path in removed]
+    return [event for event in events if event is not None]
+
+
+def test_only_changed_files_are_analyzed_again(tmp_path):
+    orders = tmp_path / "src" / "Orders.java"
+    orders.parent.mkdir()
+    save(orders, ORDERS, 1_000_000_000)
+    save(tmp_path / "Empty.java", "class Empty { }", 1_000_000_000)
+    workspace = Workspace(str(tmp_path))
+
+    events = sync(workspace)
+    assert sorted(event["path"] for event in events) == ["Empty.java", os.path.join("src", "Orders.java")]
+    assert workspace.changes() == ([], [])
+
+    # Saved without edits: nothing to publish
+    save(orders, ORDERS, 2_000_000_000)
+    assert sync(workspace) == []
+
+    edited = ORDERS.replace("int f", "int f, int g")
+    save(orders, edited, 3_000_000_000)
+    [event] = sync(workspace)
+    assert event["event"] == "file"
+    assert event["report"] == dict(analyze_code(edited), path=os.path.join("src", "Orders.java"))
+
+    os.remove(orders)
+    assert sync(workspace) == [{"event": "removed", "path": os.path.join("src", "Orders.java")}]
+    assert [report["path"] for report in workspace.snapshot()["files"]] == ["Empty.java"]